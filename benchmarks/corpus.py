@@ -0,0 +1,87 @@
+import argparse
+import itertools
+import json
+import random
+import string
+import sys
+
+COMMANDS = ('COUNT', 'TOP_10', 'TOP_10_COUNT')
+
+
+def word(rank):
+    """Return the synthetic word of the given rank: a, b, ..., z, aa, ab, ..."""
+    letters = []
+    rank += 1
+    while rank > 0:
+        rank, r = divmod(rank - 1, 26)
+        letters.append(string.ascii_lowercase[r])
+    return ''.join(reversed(letters))
+
+
+class ZipfCorpus(object):
+    """
+    A reproducible corpus whose word frequencies follow Zipf's law.
+
+    Parameters
+    ----------
+    num_docs: int
+        the number of documents
+    vocab_size: int, default 50_000
+        the number of distinct words
+    exponent: float, default 1.1
+        the exponent s of the distribution P(rank) ~ 1 / rank ** s
+    doc_len: int, default 200
+        the mean number of words of a document
+    seed: int, default 0
+        the seed of the random generator
+    """
+
+    def __init__(self, num_docs, vocab_size=50_000, exponent=1.1, doc_len=200, seed=0):
+        self.num_docs = num_docs
+        self.vocab_size = vocab_size
+        self.exponent = exponent
+        self.doc_len = doc_len
+        self.seed = seed
+        self.vocab = [word(r) for r in range(vocab_size)]
+        self.cum_weights = list(itertools.accumulate(1.0 / (r + 1) ** exponent for r in range(vocab_size)))
+
+    def docs(self):
+        """Yield (id, text) of the documents."""
+        rng = random.Random(self.seed)
+        for i in range(self.num_docs):
+            length = max(1, int(rng.expovariate(1.0 / self.doc_len)))
+            words = rng.choices(self.vocab, cum_weights=self.cum_weights, k=length)
+            yield f"doc{i}", ' '.join(words)
+
+    def queries(self, num_queries, max_terms=4, seed=None):
+        """
+        Yield (command, query) of queries whose terms are drawn from the same
+        distribution as the documents, so frequent terms appear in queries too.
+        """
+        rng = random.Random(self.seed + 1 if seed is None else seed)
+        for _ in range(num_queries):
+            terms = rng.choices(self.vocab, cum_weights=self.cum_weights, k=rng.randint(1, max_terms))
+            yield rng.choice(COMMANDS), ' '.join(terms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Zipf corpus as JSON lines, or its queries.")
+    parser.add_argument('--docs', type=int, default=10_000)
+    parser.add_argument('--vocab', type=int, default=50_000)
+    parser.add_argument('--exponent', type=float, default=1.1)
+    parser.add_argument('--doc-len', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=0,
+                        help="write this many queries in the COMMAND<TAB>query format instead of documents")
+    args = parser.parse_args()
+    corpus = ZipfCorpus(args.docs, args.vocab, args.exponent, args.doc_len, args.seed)
+    if args.queries:
+        for command, query in corpus.queries(args.queries):
+            sys.stdout.write(f"{command}\t{query}\n")
+    else:
+        for doc_id, text in corpus.docs():
+            sys.stdout.write(json.dumps({'id': doc_id, 'text': text}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import json
+import random
+import sys
+import time
+from array import array
+
+from pysearchlite.block_skip_list import BlockSkipListExt
+from pysearchlite.commands.tune_skip_list import encode_list
+from pysearchlite.intersection import INTERSECTIONS, double_binary_search
+
+# (shorter, longer) list lengths, from balanced to skewed
+LENGTHS = ((100, 100), (1_000, 1_000), (10_000, 10_000), (100_000, 100_000),
+           (100, 10_000), (100, 100_000), (1_000, 100_000), (1_000, 1_000_000))
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_intersections(lengths=LENGTHS, universe=2_000_000, repeat=3, seed=0):
+    """
+    Time the intersection algorithms on pairs of random lists of each pair of lengths.
+
+    The lists are skip lists as written by save(). 'dbs_array' is the double
+    binary search on lists already decoded into array('I'), the cost left
+    once decoded lists are cached.
+    """
+    rnd = random.Random(seed)
+    results = []
+    for short, long in lengths:
+        ids = [sorted(rnd.sample(range(universe), n)) for n in (short, long)]
+        doc_lists = [BlockSkipListExt.of(*encode_list(x, 44, 10)) for x in ids]
+        arrays = [array('I', x) for x in ids]
+        seconds = {name: best_time(lambda: func(doc_lists, count=True), repeat)
+                   for name, func in INTERSECTIONS.items()}
+        seconds['dbs_array'] = best_time(lambda: double_binary_search(arrays[0], arrays[1], []), repeat)
+        results.append({'short': short, 'long': long, 'seconds': seconds,
+                        'fastest': min(seconds, key=seconds.get)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the intersection algorithms on random lists.")
+    parser.add_argument('--universe', type=int, default=2_000_000, help="the number of doc ids")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    json.dump(bench_intersections(LENGTHS, args.universe, args.repeat, args.seed), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
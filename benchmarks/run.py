@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from pysearchlite.doc_list import MemoryDocList
+from pysearchlite.implementations import INVERTED_INDEX_IMPLEMENTATIONS as IMPLEMENTATIONS
+from pysearchlite.index_reader import IndexReader
+from pysearchlite.metrics import current_rss, latency_summary, peak_rss
+from pysearchlite.tokenize import normalized_tokens
+from .corpus import COMMANDS, ZipfCorpus
+
+
+def run_query(reader, command, query):
+    if command == 'COUNT':
+        return reader.count(query)
+    elif command == 'TOP_10':
+        return reader.top_k(query, 10)
+    return len(reader.search(query))
+
+
+def bench_implementation(cls, docs, queries):
+    result = {}
+    with tempfile.TemporaryDirectory(prefix="pysearchlite_bench_") as idx_dir:
+        doc_list = MemoryDocList(idx_dir)
+        inverted_index = cls(idx_dir)
+        num_tokens = 0
+        start = time.perf_counter()
+        for name, text in docs:
+            tokens = normalized_tokens(text)
+            num_tokens += len(tokens)
+            inverted_index.add(doc_list.add(name), tokens)
+        elapsed = time.perf_counter() - start
+        result['build'] = {
+            'seconds': elapsed,
+            'docs_per_sec': len(docs) / elapsed,
+            'tokens_per_sec': num_tokens / elapsed,
+        }
+
+        start = time.perf_counter()
+        doc_list.save()
+        inverted_index.save()
+        result['save'] = {
+            'seconds': time.perf_counter() - start,
+            'index_bytes': os.path.getsize(inverted_index.get_inverted_index_filename()),
+        }
+        doc_list.close()
+        inverted_index.close()
+
+        rss_before = current_rss()
+        start = time.perf_counter()
+        doc_list = MemoryDocList(idx_dir)
+        inverted_index = cls(idx_dir)
+        doc_list.restore()
+        inverted_index.restore()
+        result['restore'] = {
+            'seconds': time.perf_counter() - start,
+            'rss_bytes': current_rss(),
+            'rss_delta_bytes': current_rss() - rss_before if rss_before is not None else None,
+        }
+
+        reader = IndexReader(doc_list, inverted_index)
+        latencies = {command: [] for command in COMMANDS}
+        try:
+            for command, query in queries:
+                start = time.perf_counter()
+                run_query(reader, command, query)
+                latencies[command].append(time.perf_counter() - start)
+        except NotImplementedError:
+            result['queries'] = None
+        else:
+            result['queries'] = {command: latency_summary(values) for command, values in latencies.items()}
+        reader.retire()
+    return result
+
+
+def run(corpus, num_queries, implementations):
+    docs = list(corpus.docs())
+    queries = list(corpus.queries(num_queries))
+    results = {}
+    for name in implementations:
+        sys.stderr.write(f"Benchmarking {name}\n")
+        results[name] = bench_implementation(IMPLEMENTATIONS[name], docs, queries)
+    return {
+        'config': {
+            'docs': corpus.num_docs,
+            'vocab': corpus.vocab_size,
+            'exponent': corpus.exponent,
+            'doc_len': corpus.doc_len,
+            'seed': corpus.seed,
+            'queries': num_queries,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'env': {k: v for k, v in os.environ.items() if k.startswith('PYSEARCHLITE_')},
+        },
+        'results': results,
+        'peak_rss_bytes': peak_rss(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the inverted index implementations on a Zipf corpus.")
+    parser.add_argument('--docs', type=int, default=10_000)
+    parser.add_argument('--vocab', type=int, default=50_000)
+    parser.add_argument('--exponent', type=float, default=1.1)
+    parser.add_argument('--doc-len', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=1_000)
+    parser.add_argument('--impl', action='append', choices=sorted(IMPLEMENTATIONS),
+                        help="implementation to benchmark, may be repeated (defaults to all)")
+    parser.add_argument('--output', default='-', help="JSON output file (defaults to stdout)")
+    args = parser.parse_args()
+
+    corpus = ZipfCorpus(args.docs, args.vocab, args.exponent, args.doc_len, args.seed)
+    report = run(corpus, args.queries, args.impl or list(IMPLEMENTATIONS))
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+from .corpus import ZipfCorpus, word
+from .run import IMPLEMENTATIONS, run
+
+
+def test_word():
+    assert [word(r) for r in (0, 1, 25, 26, 27, 701, 702)] == ['a', 'b', 'z', 'aa', 'ab', 'zz', 'aaa']
+
+
+def test_zipf_corpus_reproducible():
+    docs1 = list(ZipfCorpus(20, vocab_size=100, seed=1).docs())
+    docs2 = list(ZipfCorpus(20, vocab_size=100, seed=1).docs())
+    docs3 = list(ZipfCorpus(20, vocab_size=100, seed=2).docs())
+    assert docs1 == docs2
+    assert docs1 != docs3
+    assert len(docs1) == 20
+
+
+def test_run():
+    report = run(ZipfCorpus(50, vocab_size=100, doc_len=20), 20, list(IMPLEMENTATIONS))
+    assert set(report['results']) == set(IMPLEMENTATIONS)
+    assert report['results']['memory']['queries'] is None
+    counts = report['results']['block_skip_list']['queries']
+    assert sum(summary['count'] for summary in counts.values()) == 20
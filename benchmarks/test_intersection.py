@@ -0,0 +1,7 @@
+from .intersection import bench_intersections
+
+
+def test_bench_intersections():
+    results = bench_intersections([(10, 100), (50, 50)], universe=1000, repeat=1)
+    assert [(r['short'], r['long']) for r in results] == [(10, 100), (50, 50)]
+    assert set(results[0]['seconds']) == {'leapfrog', 'svs', 'galloping', 'dbs', 'dbs_array'}
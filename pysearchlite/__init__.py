@@ -1,19 +1,35 @@
 from .search_engine import (
+    cache_stats,
     clear_index,
+    collect_query_stats,
     count,
+    count_batch,
+    count_phrase,
+    explain,
     index,
     init,
+    iter_search,
+    last_query_stats,
+    reopen,
     restore_index,
     save_index,
     search,
+    search_after,
+    search_batch,
+    search_phrase,
+    set_slow_query_log,
+    top_k,
 )
 from .tokenize import normalized_tokens
 from .doc_list import (
     DocList,
     MemoryDocList,
 )
+from .index_reader import IndexReader
 from .inverted_index import InvertedIndex
 from .inverted_index_skip_list import InvertedIndexBlockSkipList
+from .query_stats import QueryStats
+from .slow_query_log import SlowQueryLog
 #from .memory_inverted_index import MemoryInvertedIndex
 #from .spim_inverted_index import SinglePassInMemoryInvertedIndex
 #from .spim_inverted_index_memory import SinglePassInMemoryInvertedIndexMemory
@@ -0,0 +1,95 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from . import search_engine
+
+DEFAULT_MAX_PENDING = 1024
+
+
+def init_worker(idx_dir, use_mmap):
+    search_engine.init(idx_dir, use_mmap=use_mmap)
+    search_engine.restore_index()
+
+
+class AsyncSearchEngine(object):
+    """
+    Run queries in a pool of worker processes which open the same index,
+    so that long queries do not block the event loop.
+
+    Parameters
+    ----------
+    idx_dir: str
+        the index directory
+    max_workers: int, optional
+        the number of worker processes. Defaults to the number of CPUs.
+    max_pending: int, default DEFAULT_MAX_PENDING
+        the maximum number of queries submitted to the pool at a time.
+        Further queries wait for a free slot.
+    timeout: float, optional
+        the default timeout in seconds of a query, including the time spent
+        waiting for a slot.
+    use_mmap: bool, default True
+        whether the workers map the index file instead of copying it.
+
+    Examples
+    --------
+    >>> async with AsyncSearchEngine('idx') as engine:
+    ...     names = await engine.top_k('los angeles', 10, timeout=0.5)
+    """
+
+    def __init__(self, idx_dir, max_workers=None, max_pending=DEFAULT_MAX_PENDING, timeout=None, use_mmap=True):
+        self.idx_dir = idx_dir
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.use_mmap = use_mmap
+        self.executor = None
+        self.slots = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def start(self):
+        # Worker processes are spawned rather than forked, so that they do not
+        # inherit the sockets and other resources of the host application.
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=init_worker, initargs=(self.idx_dir, self.use_mmap))
+        self.slots = asyncio.Semaphore(self.max_pending)
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def run(self, fn, *args, timeout=None):
+        """
+        Call fn(*args) in a worker and return its result.
+
+        Raises asyncio.TimeoutError if it does not finish within timeout.
+        On timeout or cancellation a query which has not started yet is
+        dropped from the pool; a running one completes in its worker and
+        its result is discarded.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        return await asyncio.wait_for(self._run(fn, *args), timeout)
+
+    async def _run(self, fn, *args):
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def search(self, query, timeout=None):
+        return await self.run(search_engine.search, query, timeout=timeout)
+
+    async def count(self, query, timeout=None):
+        return await self.run(search_engine.count, query, timeout=timeout)
+
+    async def top_k(self, query, k=10, timeout=None):
+        return await self.run(search_engine.top_k, query, k, timeout=timeout)
@@ -1,29 +1,118 @@
 import os
+import re
 import sys
+from array import array
+from bisect import bisect_left, bisect_right
 
 from pysearchlite.gamma_codecs import (
+    BITMAP_LEN_BYTES,
+    BLOCK_TYPE_BITMAP,
     BLOCK_TYPE_DOC_ID,
     BLOCK_TYPE_DOC_IDS_LIST,
+    BLOCK_TYPE_FLAT_SKIP_LIST,
+    BLOCK_TYPE_ROARING,
     BLOCK_TYPE_SKIP_LIST,
     DOCID_LEN_BYTES,
+    FLAT_BLOCK_HEAD_BYTES,
+    FLAT_BLOCK_OFFSET_BYTES,
+    ROARING_KEY_BYTES,
+    ROARING_OFFSET_BYTES,
     SKIP_LIST_BLOCK_INDEX_BYTES,
     bytes_docid,
-    compare_docid,
     decode_block_idx,
+    decode_docid,
     encode_block_idx,
     encode_docid,
     bytes_block_idx,
+    write_bitmap,
     write_block_skip_list,
     write_doc_ids_list,
+    write_flat_skip_list,
+    write_roaring_list,
     write_single_doc_id,
 )
 
 SKIPLIST_BLOCK_SIZE = int(os.environ.get('PYSEARCHLITE_SKIPLIST_BLOCK_SIZE', '44'))
 SKIPLIST_MAX_LEVEL = int(os.environ.get('PYSEARCHLITE_SKIPLIST_MAX_LEVEL', '10'))
+# 'block' for BlockSkipList, 'flat' for FlatSkipList, 'roaring' for RoaringList
+SKIPLIST_FORMAT = os.environ.get('PYSEARCHLITE_SKIPLIST_FORMAT', 'block')
+FLAT_BLOCK_IDS = int(os.environ.get('PYSEARCHLITE_FLAT_BLOCK_IDS', '16'))
+# the shorter lists of the 'roaring' format are DocIdList
+ROARING_MIN_DF = int(os.environ.get('PYSEARCHLITE_ROARING_MIN_DF', '64'))
+# A list of at least BITMAP_MIN_DF doc ids is written as a bitmap if its doc
+# ids are at least BITMAP_DENSITY of the doc ids up to its last one. At 1/16
+# the bitmap is no larger than the varints of the ids.
+BITMAP_DENSITY = float(os.environ.get('PYSEARCHLITE_BITMAP_DENSITY', '0.0625'))
+BITMAP_MIN_DF = int(os.environ.get('PYSEARCHLITE_BITMAP_MIN_DF', '1024'))
+
+# the doc id of an iterator past the end of its list, greater than any doc id
+END_DOC_ID = sys.maxsize
 
 LIST_TYPE_DOC_ID = 1
 LIST_TYPE_DOC_IDS_LIST = 2
 LIST_TYPE_SKIP_LIST = 3
+LIST_TYPE_FLAT_SKIP_LIST = 4
+LIST_TYPE_BITMAP = 5
+LIST_TYPE_ROARING = 6
+
+LIST_TYPE_NAMES = {
+    LIST_TYPE_DOC_ID: 'LIST_TYPE_DOC_ID',
+    LIST_TYPE_DOC_IDS_LIST: 'LIST_TYPE_DOC_IDS_LIST',
+    LIST_TYPE_SKIP_LIST: 'LIST_TYPE_SKIP_LIST',
+    LIST_TYPE_FLAT_SKIP_LIST: 'LIST_TYPE_FLAT_SKIP_LIST',
+    LIST_TYPE_BITMAP: 'LIST_TYPE_BITMAP',
+    LIST_TYPE_ROARING: 'LIST_TYPE_ROARING',
+}
+
+# the containers of a RoaringList: sorted uint16 doc ids, a bitmap of the
+# 65536 doc ids of the chunk, or (start, length - 1) uint16 pairs of runs
+ROARING_ARRAY = 0
+ROARING_BITMAP = 1
+ROARING_RUN = 2
+ROARING_CHUNK_BITS = 16
+ROARING_BITMAP_BYTES = (1 << ROARING_CHUNK_BITS) >> 3
+
+# the positions of the set bits of a byte, and of its lowest set bit
+BIT_POSITIONS = [tuple(i for i in range(8) if b >> i & 1) for b in range(256)]
+LOWEST_BIT = [(b & -b).bit_length() - 1 for b in range(256)]
+NONZERO_BYTE = re.compile(rb'[^\x00]')
+
+
+if sys.version_info >= (3, 10):
+    def popcount(x):
+        return x.bit_count()
+else:
+    def popcount(x):
+        return bin(x).count('1')
+
+
+def bitmap_ids(bitmap):
+    """Return the doc ids of the set bits of bitmap."""
+    ids = []
+    pos = 0
+    while True:
+        m = NONZERO_BYTE.search(bitmap, pos)
+        if m is None:
+            return ids
+        pos = m.start()
+        base = pos << 3
+        ids.extend([base + i for i in BIT_POSITIONS[bitmap[pos]]])
+        pos += 1
+
+
+def next_set_bit(bitmap, doc_id):
+    """Return the first doc id not less than doc_id whose bit is set in bitmap, or END_DOC_ID."""
+    pos = doc_id >> 3
+    if pos >= len(bitmap):
+        return END_DOC_ID
+    b = bitmap[pos] >> (doc_id & 7)
+    if b:
+        return doc_id + LOWEST_BIT[b]
+    m = NONZERO_BYTE.search(bitmap, pos + 1)
+    if m is None:
+        return END_DOC_ID
+    pos = m.start()
+    return (pos << 3) + LOWEST_BIT[bitmap[pos]]
 
 
 class BlockSkipList(object):
@@ -120,6 +209,14 @@ class BlockSkipList(object):
 
 
 class BlockSkipListExt(object):
+    """
+    A BlockSkipList read from an index.
+
+    The header is parsed once, and the first block of each level is decoded
+    on first use and shared by the iterators of the list.
+    """
+
+    __slots__ = ('mem', 'block_size', 'max_level', 'level_block_idx', 'offset', 'freq', 'first_blocks')
 
     def __init__(self, mem, freq):
         self.mem = mem
@@ -132,6 +229,7 @@ class BlockSkipListExt(object):
             self.level_block_idx.append(int.from_bytes(mem[p:p + SKIP_LIST_BLOCK_INDEX_BYTES], sys.byteorder))
         self.offset = 2 + self.max_level * SKIP_LIST_BLOCK_INDEX_BYTES + SKIP_LIST_BLOCK_INDEX_BYTES
         self.freq = freq
+        self.first_blocks = None
 
     @staticmethod
     def of(freq, list_type, mem):
@@ -141,6 +239,12 @@ class BlockSkipListExt(object):
             return DocIdListExt(mem, freq)
         elif list_type == LIST_TYPE_SKIP_LIST:
             return BlockSkipListExt(mem, freq)
+        elif list_type == LIST_TYPE_FLAT_SKIP_LIST:
+            return FlatSkipListExt(mem, freq)
+        elif list_type == LIST_TYPE_BITMAP:
+            return BitmapListExt(mem, freq)
+        elif list_type == LIST_TYPE_ROARING:
+            return RoaringListExt(mem, freq)
 
     @staticmethod
     def read(mem):
@@ -153,11 +257,74 @@ class BlockSkipListExt(object):
         elif block_type == BLOCK_TYPE_SKIP_LIST:
             freq = int.from_bytes(mem[1:DOCID_LEN_BYTES + 1], sys.byteorder)
             return BlockSkipListExt(mem[DOCID_LEN_BYTES + 1:], freq)
+        elif block_type == BLOCK_TYPE_FLAT_SKIP_LIST:
+            freq = int.from_bytes(mem[1:DOCID_LEN_BYTES + 1], sys.byteorder)
+            return FlatSkipListExt(mem[DOCID_LEN_BYTES + 1:], freq)
+        elif block_type == BLOCK_TYPE_BITMAP:
+            freq = int.from_bytes(mem[1:DOCID_LEN_BYTES + 1], sys.byteorder)
+            return BitmapListExt(mem[DOCID_LEN_BYTES + 1:], freq)
+        elif block_type == BLOCK_TYPE_ROARING:
+            freq = int.from_bytes(mem[1:DOCID_LEN_BYTES + 1], sys.byteorder)
+            return RoaringListExt(mem[DOCID_LEN_BYTES + 1:], freq)
         else:
             raise ValueError(f"Unsupported block type: {block_type}")
 
-    def get_iter(self):
-        return BlockSkipListExtIter(self)
+    def get_iter(self, stats=None):
+        return BlockSkipListExtIter(self, stats)
+
+    def get_first_blocks(self):
+        """Return the doc ids, lower level block indexes and next block index of the first block of each level."""
+        if self.first_blocks is None:
+            keys, next_block = self.decode_block(0)
+            first_keys = [keys]
+            first_children = [None]
+            first_next_block = [next_block]
+            for level in range(1, self.max_level + 1):
+                keys, children, next_block = self.decode_skip_block(self.level_block_idx[level])
+                first_keys.append(keys)
+                first_children.append(children)
+                first_next_block.append(next_block)
+            self.first_blocks = (first_keys, first_children, first_next_block)
+        return self.first_blocks
+
+    def decode_block(self, block_idx):
+        """Return the doc ids and the next block index of a block of level 0."""
+        mem = self.mem
+        block_offset = self.offset + self.block_size * block_idx
+        pos = block_offset + SKIP_LIST_BLOCK_INDEX_BYTES + 1
+        block_end = pos + mem[block_offset + SKIP_LIST_BLOCK_INDEX_BYTES]
+        ids = []
+        while pos < block_end:
+            ids.append(decode_docid(mem, pos))
+            pos += bytes_docid(mem, pos)
+        return ids, int.from_bytes(mem[block_offset:block_offset + SKIP_LIST_BLOCK_INDEX_BYTES], sys.byteorder)
+
+    def decode_skip_block(self, block_idx):
+        """Return the doc ids, the lower level block indexes and the next block index of a skip list block."""
+        mem = self.mem
+        block_offset = self.offset + self.block_size * block_idx
+        pos = block_offset + SKIP_LIST_BLOCK_INDEX_BYTES + 1
+        block_end = pos + mem[block_offset + SKIP_LIST_BLOCK_INDEX_BYTES]
+        ids = []
+        children = []
+        while pos < block_end:
+            ids.append(decode_docid(mem, pos))
+            pos += bytes_docid(mem, pos)
+            children.append(decode_block_idx(mem, pos))
+            pos += bytes_block_idx(mem, pos)
+        return ids, children, int.from_bytes(mem[block_offset:block_offset + SKIP_LIST_BLOCK_INDEX_BYTES],
+                                             sys.byteorder)
+
+    def first_doc_id(self, block_idx):
+        return decode_docid(self.mem, self.offset + self.block_size * block_idx + SKIP_LIST_BLOCK_INDEX_BYTES + 1)
+
+    def decode_ids(self):
+        """Return the doc ids of level 0."""
+        ids, block_idx = self.decode_block(0)
+        while block_idx != 0:
+            block, block_idx = self.decode_block(block_idx)
+            ids.extend(block)
+        return ids
 
     def get_ids(self):
         block_offset = self.offset
@@ -181,134 +348,690 @@ class BlockSkipListExt(object):
 
 
 class BlockSkipListExtIter(object):
+    """
+    An iterator of the doc ids of a BlockSkipListExt.
 
-    def __init__(self, block_skip_list):
-        self.list = block_skip_list
-        self.mem = block_skip_list.mem
-        self.last_block_idx = [block_skip_list.level_block_idx[i] for i in range(block_skip_list.max_level + 1)]
-        self.last_pos = [self._get_block_offset(self.last_block_idx[i]) + SKIP_LIST_BLOCK_INDEX_BYTES + 1
-                         for i in range(block_skip_list.max_level + 1)]
-        self.last_cmp_pos = self.last_pos[:]
-        self.last_level = 0
-
-    def _get_block_offset(self, idx):
-        return self.list.offset + self.list.block_size * idx
-
-    def _get_first_pos(self, block_offset):
-        return block_offset + SKIP_LIST_BLOCK_INDEX_BYTES + 1
-
-    def _get_block_end(self, block_offset):
-        return self._get_first_pos(block_offset) + self.mem[block_offset + SKIP_LIST_BLOCK_INDEX_BYTES]
-
-    def _get_next_block_idx(self, block_offset):
-        return int.from_bytes(self.mem[block_offset:block_offset + SKIP_LIST_BLOCK_INDEX_BYTES], sys.byteorder)
-
-    def get_pos(self):
-        return self.last_pos[self.last_level]
-
-    def search(self, mem_a, pos_a):
-        # Check the start position.
-        level = self.last_level
-        while level < self.list.max_level:
-            if compare_docid(self.mem, self.last_cmp_pos[level + 1], mem_a, pos_a) >= 0:
-                break
-            level += 1
-        block_idx = self.last_block_idx[level]
-        block_offset = self._get_block_offset(block_idx)
-        block_end = self._get_block_end(block_offset)
-        pos = self.last_pos[level]
-        last_block_idx = block_idx
-        last_pos = pos
-
-        # skip list
-        while level > 0:
-            while True:
-                cmp = compare_docid(self.mem, pos, mem_a, pos_a)
-                if cmp < 0:
-                    last_block_idx = block_idx
-                    last_pos = pos
-                    pos += bytes_docid(self.mem, pos)
-                    pos += bytes_block_idx(self.mem, pos)
-                    if pos >= block_end:  # reached to the end of the block
-                        block_idx = self._get_next_block_idx(block_offset)
-                        if block_idx == 0:  # reached to the end of this level
-                            self.last_block_idx[level] = last_block_idx
-                            self.last_cmp_pos[level] = last_pos
-                            self.last_pos[level] = last_pos
-                            pos = last_pos
-                            break  # down the level
-                        block_offset = self._get_block_offset(block_idx)
-                        block_end = self._get_block_end(block_offset)
-                        pos = self._get_first_pos(block_offset)
-                elif cmp > 0:
-                    self.last_block_idx[level] = last_block_idx
-                    self.last_cmp_pos[level] = pos
-                    self.last_pos[level] = last_pos
-                    pos = last_pos
-                    break  # down the level
-                else:  # cmp == 0:
-                    self.last_block_idx[level] = block_idx
-                    self.last_cmp_pos[level] = pos
-                    self.last_pos[level] = pos
-                    self.last_level = level
-                    return pos, cmp
-            level -= 1
-            pos += bytes_docid(self.mem, pos)
-            block_idx = decode_block_idx(self.mem, pos)
-            block_offset = self._get_block_offset(block_idx)
-            block_end = self._get_block_end(block_offset)
-            pos = self._get_first_pos(block_offset)
+    The entries of the current block of each level are decoded once when the
+    iterator enters the block, and searched as ints. The decoded lists are
+    never modified, so the first blocks are shared with the list.
+    """
 
-        # ids
+    __slots__ = ('list', 'max_level', 'keys', 'children', 'idx', 'next_block', 'stats', 'doc_id')
+
+    def __init__(self, block_skip_list, stats=None):
+        self.list = block_skip_list
+        self.max_level = block_skip_list.max_level
+        self.reset(stats)
+
+    def reset(self, stats=None):
+        """Move back to the first doc id, so that the iterator can be reused."""
+        first_keys, first_children, first_next_block = self.list.get_first_blocks()
+        # the decoded doc ids, the lower level block of each entry, the
+        # current entry and the next block of the current block of each level
+        self.keys = first_keys[:]
+        self.children = first_children[:]
+        self.idx = [0] * (self.max_level + 1)
+        self.next_block = first_next_block[:]
+        self.stats = stats
+        self.doc_id = first_keys[0][0]
+
+    def _enter(self, level, block_idx):
+        if level == 0:
+            self.keys[0], self.next_block[0] = self.list.decode_block(block_idx)
+        else:
+            self.keys[level], self.children[level], self.next_block[level] = self.list.decode_skip_block(block_idx)
+        self.idx[level] = 0
+        if self.stats is not None:
+            self.stats.blocks += 1
+
+    def _next_key(self, level):
+        """Return the doc id of the entry after the current one on level, or END_DOC_ID."""
+        i = self.idx[level] + 1
+        keys = self.keys[level]
+        if i < len(keys):
+            return keys[i]
+        block_idx = self.next_block[level]
+        if block_idx == 0:
+            return END_DOC_ID
+        return self.list.first_doc_id(block_idx)
+
+    def _walk(self, level, target):
+        """Move the current entry of level to its last entry not greater than target."""
         while True:
-            cmp = compare_docid(self.mem, pos, mem_a, pos_a)
-            if cmp < 0:
-                last_block_idx = block_idx
-                last_pos = pos
-                pos += bytes_docid(self.mem, pos)
-                if pos >= block_end:  # reach to the end of the block
-                    block_idx = self._get_next_block_idx(block_offset)
-                    if block_idx == 0:  # reached to the end of id list
-                        self.last_block_idx[0] = last_block_idx
-                        self.last_pos[0] = last_pos
-                        self.last_level = 0
-                        return last_pos, cmp
-                    block_offset = self._get_block_offset(block_idx)
-                    block_end = self._get_block_end(block_offset)
-                    pos = self._get_first_pos(block_offset)
-            else:  # cmp >= 0
-                self.last_block_idx[0] = block_idx
-                self.last_pos[0] = pos
-                self.last_level = 0
-                return pos, cmp
-
-    def next_pos(self):
-        level = self.last_level
-        block_idx = self.last_block_idx[level]
-        block_offset = self._get_block_offset(block_idx)
-        pos = self.last_pos[level]
-        while level > 0:
+            keys = self.keys[level]
+            i = bisect_right(keys, target, self.idx[level]) - 1
+            if self.stats is not None:
+                self.stats.compares += (len(keys) - self.idx[level]).bit_length()
+            if i < len(keys) - 1:
+                self.idx[level] = i
+                return
+            block_idx = self.next_block[level]
+            if block_idx == 0 or self.list.first_doc_id(block_idx) > target:
+                self.idx[level] = i
+                return
+            self._enter(level, block_idx)
+
+    def search(self, target):
+        """Move to the first doc id not less than target and return it, or END_DOC_ID."""
+        if target <= self.doc_id:
+            return self.doc_id
+        stats = self.stats
+        if stats is not None:
+            stats.search_calls += 1
+            stats.compares += 2
+        keys = self.keys[0]
+        if target > keys[-1]:
+            # climb while the next entry of the upper level is not after target
+            level = 0
+            while level < self.max_level and self._next_key(level + 1) <= target:
+                level += 1
+            if stats is not None:
+                stats.levels_climbed += level
+                stats.compares += level + 1
+            while level > 0:
+                self._walk(level, target)
+                child = self.children[level][self.idx[level]]
+                level -= 1
+                self._enter(level, child)
+            keys = self.keys[0]
+            while keys[-1] < target:
+                block_idx = self.next_block[0]
+                if block_idx == 0:  # reached to the end of id list
+                    self.idx[0] = len(keys) - 1
+                    self.doc_id = END_DOC_ID
+                    return END_DOC_ID
+                self._enter(0, block_idx)
+                keys = self.keys[0]
+        i = bisect_left(keys, target, self.idx[0])
+        if stats is not None:
+            stats.compares += (len(keys) - self.idx[0]).bit_length()
+        self.idx[0] = i
+        self.doc_id = keys[i]
+        return self.doc_id
+
+    def next_doc(self):
+        """Move to the next doc id and return it, or END_DOC_ID."""
+        if self.stats is not None:
+            self.stats.next_calls += 1
+        i = self.idx[0] + 1
+        keys = self.keys[0]
+        if i >= len(keys):
+            block_idx = self.next_block[0]
+            if block_idx == 0:
+                self.doc_id = END_DOC_ID
+                return END_DOC_ID
+            self._enter(0, block_idx)
+            keys = self.keys[0]
+            i = 0
+        self.idx[0] = i
+        self.doc_id = keys[i]
+        return self.doc_id
+
+
+class FlatSkipList(object):
+    """
+    A doc id list split into blocks of block_ids doc ids, with the first doc
+    id of each block in a fixed width array in front of the blocks.
+
+    search() bisects the array of block heads instead of following skip
+    list levels, then scans one block.
+    """
+
+    def __init__(self):
+        self.heads = None
+        self.blocks = None
+        self.freq = 0
+
+    @staticmethod
+    def from_list(ids, block_ids=FLAT_BLOCK_IDS):
+        """
+        Return a FlatSkipList, DocIdList, or SingleDocId from the given ids.
+
+        Parameters
+        ----------
+        ids: list[int]
+            a list of doc ids
+        block_ids: int, default FLAT_BLOCK_IDS
+            the number of doc ids in a block
+
+        Returns
+        -------
+        list: FlatSkipList, DocIdList, or SingleDocId
+        """
+        if len(ids) == 1:
+            return SingleDocId(ids[0])
+        if len(ids) <= block_ids:
+            return DocIdList(ids)
+        s = FlatSkipList()
+        s.heads = ids[::block_ids]
+        s.blocks = [b''.join(encode_docid(doc_id) for doc_id in ids[i:i + block_ids])
+                    for i in range(0, len(ids), block_ids)]
+        s.freq = len(ids)
+        return s
+
+    def write(self, file):
+        write_flat_skip_list(self, file)
+
+
+class FlatSkipListExt(object):
+
+    __slots__ = ('mem', 'num_blocks', 'heads', 'offsets', 'freq', 'first_block')
+
+    def __init__(self, mem, freq):
+        self.mem = mem
+        # num_blocks heads[num_blocks] offsets[num_blocks + 1] blocks
+        self.num_blocks = int.from_bytes(mem[0:FLAT_BLOCK_OFFSET_BYTES], sys.byteorder)
+        heads_end = FLAT_BLOCK_OFFSET_BYTES + self.num_blocks * FLAT_BLOCK_HEAD_BYTES
+        offsets_end = heads_end + (self.num_blocks + 1) * FLAT_BLOCK_OFFSET_BYTES
+        view = memoryview(mem)
+        self.heads = view[FLAT_BLOCK_OFFSET_BYTES:heads_end].cast('I')
+        self.offsets = view[heads_end:offsets_end].cast('I')
+        self.freq = freq
+        self.first_block = None
+
+    def get_iter(self, stats=None):
+        return FlatSkipListExtIter(self, stats)
+
+    def get_first_block(self):
+        if self.first_block is None:
+            self.first_block = self.decode_block(0)
+        return self.first_block
+
+    def decode_block(self, block):
+        return self.decode_range(self.offsets[block], self.offsets[block + 1])
+
+    def decode_ids(self):
+        return self.decode_range(self.offsets[0], self.offsets[self.num_blocks])
+
+    def decode_range(self, pos, end):
+        mem = self.mem
+        ids = []
+        while pos < end:
+            ids.append(decode_docid(mem, pos))
+            pos += bytes_docid(mem, pos)
+        return ids
+
+    def get_ids(self):
+        pos = self.offsets[0]
+        end = self.offsets[self.num_blocks]
+        result = []
+        while pos < end:
+            result.append(pos)
             pos += bytes_docid(self.mem, pos)
-            block_idx = decode_block_idx(self.mem, pos)
-            block_offset = self._get_block_offset(block_idx)
-            pos = self._get_first_pos(block_offset)
-            level -= 1
-            self.last_block_idx[level] = block_idx
-            self.last_cmp_pos[level] = pos
-            self.last_pos[level] = pos
-
-        pos += bytes_docid(self.mem, pos)
-        block_end = self._get_block_end(block_offset)
-        if pos >= block_end:  # reach to the end of the block
-            block_idx = self._get_next_block_idx(block_offset)
-            if block_idx == 0:  # reached to the end of id list
-                return self.last_pos[0], -1
-            block_offset = self._get_block_offset(block_idx)
-            pos = self._get_first_pos(block_offset)
-            self.last_block_idx[0] = block_idx
-        self.last_pos[0] = pos
-        self.last_level = 0
-        return pos, 1
+        return result
+
+
+class FlatSkipListExtIter(object):
+
+    __slots__ = ('list', 'heads', 'last_block', 'block', 'keys', 'idx', 'doc_id', 'stats')
+
+    def __init__(self, flat_skip_list, stats=None):
+        self.list = flat_skip_list
+        self.heads = flat_skip_list.heads
+        self.last_block = flat_skip_list.num_blocks - 1
+        self.reset(stats)
+
+    def reset(self, stats=None):
+        """Move back to the first doc id, so that the iterator can be reused."""
+        self.block = 0
+        self.keys = self.list.get_first_block()
+        self.idx = 0
+        self.doc_id = self.keys[0]
+        self.stats = stats
+
+    def search(self, target):
+        """Move to the first doc id not less than target and return it, or END_DOC_ID."""
+        if target <= self.doc_id:
+            return self.doc_id
+        stats = self.stats
+        if stats is not None:
+            stats.search_calls += 1
+            stats.compares += 2
+        keys = self.keys
+        i = self.idx
+        if target > keys[-1]:
+            block = self.block
+            if block == self.last_block:  # reached to the end of id list
+                self.idx = len(keys) - 1
+                self.doc_id = END_DOC_ID
+                return END_DOC_ID
+            # the last block whose head is not greater than target, or the next
+            # block if its head is already greater
+            block = max(bisect_right(self.heads, target, block + 1) - 1, block + 1)
+            keys = self.list.decode_block(block)
+            if stats is not None:
+                stats.compares += (self.last_block - self.block).bit_length() + 1
+                stats.blocks += 1
+            if target > keys[-1]:
+                # target is between this block and the head of the next one
+                if block == self.last_block:
+                    self.block = block
+                    self.keys = keys
+                    self.idx = len(keys) - 1
+                    self.doc_id = END_DOC_ID
+                    return END_DOC_ID
+                block += 1
+                keys = self.list.decode_block(block)
+                if stats is not None:
+                    stats.blocks += 1
+            self.block = block
+            self.keys = keys
+            i = 0
+        i = bisect_left(keys, target, i)
+        if stats is not None:
+            stats.compares += (len(keys) - i).bit_length()
+        self.idx = i
+        self.doc_id = keys[i]
+        return self.doc_id
+
+    def next_doc(self):
+        """Move to the next doc id and return it, or END_DOC_ID."""
+        if self.stats is not None:
+            self.stats.next_calls += 1
+        i = self.idx + 1
+        if i >= len(self.keys):
+            if self.block == self.last_block:
+                self.doc_id = END_DOC_ID
+                return END_DOC_ID
+            self.block += 1
+            self.keys = self.list.decode_block(self.block)
+            if self.stats is not None:
+                self.stats.blocks += 1
+            i = 0
+        self.idx = i
+        self.doc_id = self.keys[i]
+        return self.doc_id
+
+
+class BitmapList(object):
+    """
+    A doc id list as a bitmap with a bit for each doc id up to the last one.
+
+    It is written for the lists whose doc ids are dense, where it is smaller
+    than the varints. Lists are intersected with a bitwise AND of bitmaps or
+    a probe of the bit of each doc id of the other lists.
+    """
+
+    def __init__(self):
+        self.bitmap = None
+        self.freq = 0
+
+    @staticmethod
+    def is_dense(ids, density=BITMAP_DENSITY, min_df=BITMAP_MIN_DF):
+        return len(ids) >= min_df and len(ids) >= density * (ids[-1] + 1)
+
+    @staticmethod
+    def from_list(ids):
+        """
+        Return a BitmapList, or SingleDocId from the given ids.
+
+        Parameters
+        ----------
+        ids: list[int]
+            a list of doc ids
+
+        Returns
+        -------
+        list: BitmapList, or SingleDocId
+        """
+        if len(ids) == 1:
+            return SingleDocId(ids[0])
+        bitmap = bytearray((ids[-1] >> 3) + 1)
+        for doc_id in ids:
+            bitmap[doc_id >> 3] |= 1 << (doc_id & 7)
+        s = BitmapList()
+        s.bitmap = bitmap
+        s.freq = len(ids)
+        return s
+
+    def write(self, file):
+        write_bitmap(self, file)
+
+
+class BitmapListExt(object):
+
+    __slots__ = ('mem', 'bitmap', 'freq', 'first_doc_id')
+
+    def __init__(self, mem, freq):
+        self.mem = mem
+        # len(bitmap) bitmap
+        nbytes = int.from_bytes(mem[0:BITMAP_LEN_BYTES], sys.byteorder)
+        self.bitmap = memoryview(mem)[BITMAP_LEN_BYTES:BITMAP_LEN_BYTES + nbytes]
+        self.freq = freq
+        self.first_doc_id = next_set_bit(self.bitmap, 0)
+
+    def get_iter(self, stats=None):
+        return BitmapListExtIter(self, stats)
+
+    def get_bits(self):
+        """Return the bitmap as an int whose bit doc_id is set for each doc id."""
+        return int.from_bytes(self.bitmap, 'little')
+
+    def decode_ids(self):
+        return bitmap_ids(self.bitmap)
+
+    def filter(self, ids):
+        """Return the doc ids of ids which are in the list."""
+        bitmap = self.bitmap
+        end = len(bitmap) << 3
+        return [doc_id for doc_id in ids if doc_id < end and bitmap[doc_id >> 3] >> (doc_id & 7) & 1]
+
+
+class BitmapListExtIter(object):
+
+    __slots__ = ('list', 'bitmap', 'doc_id', 'stats')
+
+    def __init__(self, bitmap_list, stats=None):
+        self.list = bitmap_list
+        self.bitmap = bitmap_list.bitmap
+        self.reset(stats)
+
+    def reset(self, stats=None):
+        """Move back to the first doc id, so that the iterator can be reused."""
+        self.doc_id = self.list.first_doc_id
+        self.stats = stats
+
+    def search(self, target):
+        """Move to the first doc id not less than target and return it, or END_DOC_ID."""
+        if target <= self.doc_id:
+            return self.doc_id
+        if self.stats is not None:
+            self.stats.search_calls += 1
+            self.stats.compares += 1
+        self.doc_id = next_set_bit(self.bitmap, target)
+        return self.doc_id
+
+    def next_doc(self):
+        """Move to the next doc id and return it, or END_DOC_ID."""
+        if self.stats is not None:
+            self.stats.next_calls += 1
+        if self.doc_id != END_DOC_ID:
+            self.doc_id = next_set_bit(self.bitmap, self.doc_id + 1)
+        return self.doc_id
+
+
+class RoaringList(object):
+    """
+    A doc id list split into chunks of 65536 doc ids, each stored in the
+    smallest of an array, a bitmap or a run container.
+
+    The containers of lists are intersected and united chunk by chunk, as
+    ints for bitmaps and runs and as lists of uint16 for arrays, see
+    roaring_and and roaring_or.
+    """
+
+    def __init__(self):
+        self.keys = None
+        self.types = None
+        self.containers = None
+        self.freq = 0
+
+    @staticmethod
+    def from_list(ids, min_df=ROARING_MIN_DF):
+        """
+        Return a RoaringList, DocIdList, or SingleDocId from the given ids.
+
+        Parameters
+        ----------
+        ids: list[int]
+            a list of doc ids
+        min_df: int, default ROARING_MIN_DF
+            the shorter lists are DocIdList
+
+        Returns
+        -------
+        list: RoaringList, DocIdList, or SingleDocId
+        """
+        if len(ids) == 1:
+            return SingleDocId(ids[0])
+        if len(ids) < min_df:
+            return DocIdList(ids)
+        s = RoaringList()
+        s.keys = []
+        s.types = []
+        s.containers = []
+        start = 0
+        while start < len(ids):
+            key = ids[start] >> ROARING_CHUNK_BITS
+            end = bisect_left(ids, (key + 1) << ROARING_CHUNK_BITS, start)
+            container_type, container = encode_container([doc_id & 0xffff for doc_id in ids[start:end]])
+            s.keys.append(key)
+            s.types.append(container_type)
+            s.containers.append(container)
+            start = end
+        s.freq = len(ids)
+        return s
+
+    def write(self, file):
+        write_roaring_list(self, file)
+
+
+def encode_container(lows):
+    """Return the type and bytes of the smallest container of the sorted uint16 doc ids lows."""
+    runs = array('H')
+    run_start = prev = lows[0]
+    for low in lows[1:]:
+        if low != prev + 1:
+            runs.extend((run_start, prev - run_start))
+            run_start = low
+        prev = low
+    runs.extend((run_start, prev - run_start))
+    size = min(2 * len(lows), ROARING_BITMAP_BYTES, 2 * len(runs))
+    if 2 * len(lows) == size:
+        return ROARING_ARRAY, array('H', lows).tobytes()
+    elif 2 * len(runs) == size:
+        return ROARING_RUN, runs.tobytes()
+    bitmap = bytearray(ROARING_BITMAP_BYTES)
+    for low in lows:
+        bitmap[low >> 3] |= 1 << (low & 7)
+    return ROARING_BITMAP, bytes(bitmap)
+
+
+def lows_to_bits(lows):
+    bitmap = bytearray(ROARING_BITMAP_BYTES)
+    for low in lows:
+        bitmap[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bitmap, 'little')
+
+
+def container_and(a, b):
+    """
+    Return the intersection of two containers.
+
+    A container is a list of uint16 doc ids or an int whose bit of each doc
+    id is set.
+    """
+    if type(a) is int:
+        if type(b) is int:
+            return a & b
+        a, b = b, a
+    if type(b) is int:
+        bitmap = b.to_bytes(ROARING_BITMAP_BYTES, 'little')
+        return [low for low in a if bitmap[low >> 3] >> (low & 7) & 1]
+    if len(a) > len(b):
+        a, b = b, a
+    b = set(b)
+    return [low for low in a if low in b]
+
+
+def container_or(a, b):
+    """Return the union of two containers, see container_and."""
+    if type(a) is not int and type(b) is not int and len(a) + len(b) <= ROARING_BITMAP_BYTES // 2:
+        return sorted(set(a).union(b))
+    if type(a) is not int:
+        a = lows_to_bits(a)
+    if type(b) is not int:
+        b = lows_to_bits(b)
+    return a | b
+
+
+def container_count(container):
+    return popcount(container) if type(container) is int else len(container)
+
+
+def roaring_and(roaring_lists):
+    """Return the intersection of RoaringListExt as a dict of key: container, see container_and."""
+    lists = sorted(roaring_lists, key=lambda roaring_list: roaring_list.num_containers)
+    result = {key: lists[0].container(i) for i, key in enumerate(lists[0].keys)}
+    for roaring_list in lists[1:]:
+        index = roaring_list.key_index()
+        merged = {}
+        for key, container in result.items():
+            i = index.get(key)
+            if i is not None:
+                container = container_and(container, roaring_list.container(i))
+                if container:
+                    merged[key] = container
+        result = merged
+    return result
+
+
+def roaring_or(roaring_lists):
+    """Return the union of RoaringListExt as a dict of key: container, see container_and."""
+    result = {}
+    for roaring_list in roaring_lists:
+        for i, key in enumerate(roaring_list.keys):
+            container = roaring_list.container(i)
+            result[key] = container_or(result[key], container) if key in result else container
+    return dict(sorted(result.items()))
+
+
+def roaring_count(containers):
+    return sum(container_count(container) for container in containers.values())
+
+
+def roaring_ids(containers):
+    """Return the doc ids of a dict of key: container."""
+    ids = []
+    for key, container in containers.items():
+        if type(container) is int:
+            container = bitmap_ids(container.to_bytes(ROARING_BITMAP_BYTES, 'little'))
+        base = key << ROARING_CHUNK_BITS
+        ids.extend([base + low for low in container])
+    return ids
+
+
+class RoaringListExt(object):
+
+    __slots__ = ('mem', 'num_containers', 'offsets', 'keys', 'types', 'freq', 'first_container')
+
+    def __init__(self, mem, freq):
+        self.mem = mem
+        # num_containers offsets[num_containers + 1] keys[num_containers] types[num_containers] containers
+        self.num_containers = n = int.from_bytes(mem[0:ROARING_OFFSET_BYTES], sys.byteorder)
+        offsets_end = ROARING_OFFSET_BYTES * (n + 2)
+        keys_end = offsets_end + ROARING_KEY_BYTES * n
+        view = memoryview(mem)
+        self.offsets = view[ROARING_OFFSET_BYTES:offsets_end].cast('I')
+        self.keys = view[offsets_end:keys_end].cast('H')
+        self.types = view[keys_end:keys_end + n]
+        self.freq = freq
+        self.first_container = None
+
+    def get_iter(self, stats=None):
+        return RoaringListExtIter(self, stats)
+
+    def key_index(self):
+        return {key: i for i, key in enumerate(self.keys)}
+
+    def container(self, i):
+        """Return the container i as a list of uint16 doc ids if it is an array, otherwise as an int."""
+        data = memoryview(self.mem)[self.offsets[i]:self.offsets[i + 1]]
+        container_type = self.types[i]
+        if container_type == ROARING_ARRAY:
+            return data.cast('H').tolist()
+        elif container_type == ROARING_BITMAP:
+            return int.from_bytes(data, 'little')
+        bits = 0
+        runs = data.cast('H')
+        for j in range(0, len(runs), 2):
+            bits |= ((1 << (runs[j + 1] + 1)) - 1) << runs[j]
+        return bits
+
+    def get_first_container(self):
+        if self.first_container is None:
+            self.first_container = self.decode_container(0)
+        return self.first_container
+
+    def decode_container(self, i):
+        """Return the doc ids of the container i."""
+        return roaring_ids({self.keys[i]: self.container(i)})
+
+    def decode_ids(self):
+        return roaring_ids({key: self.container(i) for i, key in enumerate(self.keys)})
+
+
+class RoaringListExtIter(object):
+
+    __slots__ = ('list', 'keys', 'last_container', 'container', 'ids', 'idx', 'doc_id', 'stats')
+
+    def __init__(self, roaring_list, stats=None):
+        self.list = roaring_list
+        self.keys = roaring_list.keys
+        self.last_container = roaring_list.num_containers - 1
+        self.reset(stats)
+
+    def reset(self, stats=None):
+        """Move back to the first doc id, so that the iterator can be reused."""
+        self.container = 0
+        self.ids = self.list.get_first_container()
+        self.idx = 0
+        self.doc_id = self.ids[0]
+        self.stats = stats
+
+    def _enter(self, container):
+        self.container = container
+        self.ids = self.list.decode_container(container)
+        if self.stats is not None:
+            self.stats.blocks += 1
+
+    def search(self, target):
+        """Move to the first doc id not less than target and return it, or END_DOC_ID."""
+        if target <= self.doc_id:
+            return self.doc_id
+        stats = self.stats
+        if stats is not None:
+            stats.search_calls += 1
+            stats.compares += 2
+        i = self.idx
+        if target > self.ids[-1]:
+            # the first container of the chunk of target or after it
+            container = bisect_left(self.keys, target >> ROARING_CHUNK_BITS, self.container + 1)
+            if stats is not None:
+                stats.compares += (self.last_container - self.container).bit_length()
+            if container <= self.last_container:
+                self._enter(container)
+                if target > self.ids[-1]:
+                    # target is after the last doc id of its chunk
+                    container += 1
+                    if container <= self.last_container:
+                        self._enter(container)
+            if container > self.last_container:  # reached to the end of id list
+                self.idx = len(self.ids) - 1
+                self.doc_id = END_DOC_ID
+                return END_DOC_ID
+            i = 0
+        i = bisect_left(self.ids, target, i)
+        if stats is not None:
+            stats.compares += (len(self.ids) - i).bit_length()
+        self.idx = i
+        self.doc_id = self.ids[i]
+        return self.doc_id
+
+    def next_doc(self):
+        """Move to the next doc id and return it, or END_DOC_ID."""
+        if self.stats is not None:
+            self.stats.next_calls += 1
+        i = self.idx + 1
+        if i >= len(self.ids):
+            if self.container == self.last_container:
+                self.doc_id = END_DOC_ID
+                return END_DOC_ID
+            self._enter(self.container + 1)
+            i = 0
+        self.idx = i
+        self.doc_id = self.ids[i]
+        return self.doc_id
 
 
 class DocIdList(object):
@@ -323,12 +1046,27 @@ class DocIdList(object):
 
 class DocIdListExt(object):
 
+    __slots__ = ('freq', 'mem', 'ids')
+
     def __init__(self, mem, freq):
         self.freq = freq
         self.mem = mem
-
-    def get_iter(self):
-        return DocIdListExtIter(self)
+        self.ids = None
+
+    def get_iter(self, stats=None):
+        return DocIdListExtIter(self, stats)
+
+    def decode_ids(self):
+        """Return the doc ids, decoded on first use. The list is shared and must not be modified."""
+        if self.ids is None:
+            mem = self.mem
+            pos = 0
+            ids = []
+            for _ in range(self.freq):
+                ids.append(decode_docid(mem, pos))
+                pos += bytes_docid(mem, pos)
+            self.ids = ids
+        return self.ids
 
     def get_ids(self):
         pos = 0
@@ -341,38 +1079,63 @@ class DocIdListExt(object):
 
 class DocIdListExtIter(object):
 
-    def __init__(self, doc_id_list):
-        self.list = doc_id_list
-        self.mem = doc_id_list.mem
-        self.current_idx = 0
-        self.current_pos = 0
+    __slots__ = ('keys', 'idx', 'doc_id', 'stats')
+
+    def __init__(self, doc_id_list, stats=None):
+        self.keys = doc_id_list.decode_ids()
+        self.reset(stats)
+
+    def reset(self, stats=None):
+        """Move back to the first doc id, so that the iterator can be reused."""
+        self.idx = 0
+        self.doc_id = self.keys[0]
+        self.stats = stats
+
+    def search(self, target):
+        """Move to the first doc id not less than target and return it, or END_DOC_ID."""
+        if target <= self.doc_id:
+            return self.doc_id
+        keys = self.keys
+        i = bisect_left(keys, target, self.idx + 1)
+        if self.stats is not None:
+            self.stats.search_calls += 1
+            self.stats.compares += 1 + (len(keys) - self.idx).bit_length()
+        if i == len(keys):  # reached to the end of id list
+            self.idx = i - 1
+            self.doc_id = END_DOC_ID
+            return END_DOC_ID
+        self.idx = i
+        self.doc_id = keys[i]
+        return self.doc_id
+
+    def next_doc(self):
+        """Move to the next doc id and return it, or END_DOC_ID."""
+        if self.stats is not None:
+            self.stats.next_calls += 1
+        i = self.idx + 1
+        if i >= len(self.keys):
+            self.doc_id = END_DOC_ID
+            return END_DOC_ID
+        self.idx = i
+        self.doc_id = self.keys[i]
+        return self.doc_id
+
+
+class ArrayListExt(object):
+    """The doc ids of a posting list held in memory as an array('I'), e.g. a cached result."""
+
+    __slots__ = ('freq', 'ids')
 
-    def get_pos(self):
-        return self.current_pos
+    def __init__(self, ids):
+        self.freq = len(ids)
+        self.ids = ids
 
-    def search(self, mem_a, pos_a):
-        i = self.current_idx
-        pos = self.current_pos
-        while True:
-            cmp = compare_docid(self.mem, pos, mem_a, pos_a)
-            if cmp >= 0:
-                self.current_idx = i
-                self.current_pos = pos
-                return pos, cmp
-            i += 1
-            if i >= self.list.freq:
-                self.current_idx = i - 1
-                self.current_pos = pos
-                return pos, -1
-            pos += bytes_docid(self.mem, pos)
+    def get_iter(self, stats=None):
+        return DocIdListExtIter(self, stats)
 
-    def next_pos(self):
-        i = self.current_idx + 1
-        if i >= self.list.freq:
-            return self.current_pos, -1
-        self.current_pos += bytes_docid(self.mem, self.current_pos)
-        self.current_idx = i
-        return self.current_pos, 1
+    def decode_ids(self):
+        """Return the doc ids. The array is shared and must not be modified."""
+        return self.ids
 
 
 class SingleDocId(object):
@@ -386,11 +1149,18 @@ class SingleDocId(object):
 
 class SingleDocIdExt(object):
 
+    __slots__ = ('mem', 'freq', 'doc_id')
+
     def __init__(self, mem):
         self.mem = mem
+        self.freq = 1
+        self.doc_id = decode_docid(mem, 0)
 
-    def get_iter(self):
-        return SingleDocIdExtIter(self)
+    def get_iter(self, stats=None):
+        return SingleDocIdExtIter(self, stats)
+
+    def decode_ids(self):
+        return [self.doc_id]
 
     def get_ids(self):
         return [0]
@@ -398,15 +1168,26 @@ class SingleDocIdExt(object):
 
 class SingleDocIdExtIter(object):
 
-    def __init__(self, single_doc_id):
-        self.mem = single_doc_id.mem
-
-    def get_pos(self):
-        return 0
-
-    def search(self, mem_a, pos_a):
-        cmp = compare_docid(self.mem, 0, mem_a, pos_a)
-        return 0, cmp
-
-    def next_pos(self):
-        return 0, -1
+    __slots__ = ('list', 'doc_id', 'stats')
+
+    def __init__(self, single_doc_id, stats=None):
+        self.list = single_doc_id
+        self.reset(stats)
+
+    def reset(self, stats=None):
+        """Move back to the doc id, so that the iterator can be reused."""
+        self.doc_id = self.list.doc_id
+        self.stats = stats
+
+    def search(self, target):
+        """Return the doc id if it is not less than target, or END_DOC_ID."""
+        if self.stats is not None:
+            self.stats.search_calls += 1
+            self.stats.compares += 1
+        if target > self.doc_id:
+            self.doc_id = END_DOC_ID
+        return self.doc_id
+
+    def next_doc(self):
+        self.doc_id = END_DOC_ID
+        return END_DOC_ID
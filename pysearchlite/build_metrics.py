@@ -0,0 +1,96 @@
+import json
+import sys
+import time
+
+from .metrics import current_rss, peak_rss
+
+DEFAULT_INTERVAL = 10.0
+
+
+class BuildMetrics(object):
+    """
+    Progress and timings of an index build, written as JSON lines.
+
+    The indexing loop reports each document with `add_document()` and the
+    end of indexing and of saving, and an inverted index whose build_metrics
+    is set reports its spills, merge rounds and skip list conversion.
+    A line with the totals so far is written every interval seconds while
+    indexing, after each merge round and the conversion, and at the end.
+
+    Parameters
+    ----------
+    output: file, optional
+        the text file the lines are written to. Defaults to sys.stderr.
+    interval: float, default DEFAULT_INTERVAL
+        the seconds between progress lines while documents are added.
+    """
+
+    def __init__(self, output=None, interval=DEFAULT_INTERVAL):
+        self.output = output if output is not None else sys.stderr
+        self.interval = interval
+        self.start_time = time.perf_counter()
+        self.next_report = self.start_time + interval
+        self.docs = 0
+        self.tokens = 0
+        self.tokenize_seconds = 0.0
+        self.add_seconds = 0.0
+        self.index_seconds = 0.0
+        self.spills = []
+        self.merge_rounds = []
+        self.convert = None
+        self.save_seconds = None
+
+    def add_document(self, num_tokens, tokenize_seconds, add_seconds):
+        self.docs += 1
+        self.tokens += num_tokens
+        self.tokenize_seconds += tokenize_seconds
+        self.add_seconds += add_seconds
+        now = time.perf_counter()
+        if now >= self.next_report:
+            self.next_report = now + self.interval
+            self.report('index')
+
+    def end_indexing(self):
+        self.index_seconds = time.perf_counter() - self.start_time
+        self.report('indexed')
+
+    def spill(self, seconds, terms, nbytes):
+        self.spills.append({'seconds': seconds, 'terms': terms, 'bytes': nbytes})
+
+    def merge_round(self, files, seconds, nbytes):
+        self.merge_rounds.append({'files': files, 'seconds': seconds, 'bytes': nbytes})
+        self.report('merge')
+
+    def convert_to_skip_list(self, seconds, nbytes):
+        self.convert = {'seconds': seconds, 'bytes': nbytes}
+        self.report('convert')
+
+    def end_save(self, seconds):
+        self.save_seconds = seconds
+        self.report('done')
+
+    def snapshot(self, phase):
+        elapsed = time.perf_counter() - self.start_time
+        index_seconds = self.index_seconds or elapsed
+        return {
+            'phase': phase,
+            'elapsed': elapsed,
+            'docs': self.docs,
+            'tokens': self.tokens,
+            'docs_per_sec': self.docs / index_seconds if index_seconds else None,
+            'tokens_per_sec': self.tokens / index_seconds if index_seconds else None,
+            'tokenize_seconds': self.tokenize_seconds,
+            'add_seconds': self.add_seconds,
+            'spills': len(self.spills),
+            'spill_seconds': sum(s['seconds'] for s in self.spills),
+            'spill_bytes': sum(s['bytes'] for s in self.spills),
+            'merge_rounds': self.merge_rounds,
+            'convert': self.convert,
+            'save_seconds': self.save_seconds,
+            'rss_bytes': current_rss(),
+            'peak_rss_bytes': peak_rss(),
+        }
+
+    def report(self, phase):
+        self.output.write(json.dumps(self.snapshot(phase)) + '\n')
+        self.output.flush()
@@ -0,0 +1,254 @@
+import os
+from collections import Counter, OrderedDict
+from itertools import combinations
+
+PAIR_CACHE_BYTES = int(os.environ.get('PYSEARCHLITE_PAIR_CACHE_BYTES', '0'))
+# the number of queries in which a pair of live traffic has to appear to be cached
+PAIR_CACHE_MIN_COUNT = int(os.environ.get('PYSEARCHLITE_PAIR_CACHE_MIN_COUNT', '3'))
+PAIR_CACHE_FILENAME = "pair_cache"
+# the parsed posting lists of the terms queried, see InvertedIndexBlockSkipList.get_list
+PARSED_LISTS_BYTES = int(os.environ.get('PYSEARCHLITE_PARSED_LISTS_BYTES', '64000000'))
+# the decoded posting lists of hot terms, see InvertedIndexBlockSkipList.get_decoded
+POSTINGS_CACHE_BYTES = int(os.environ.get('PYSEARCHLITE_POSTINGS_CACHE_BYTES', '0'))
+RESULT_CACHE_BYTES = int(os.environ.get('PYSEARCHLITE_RESULT_CACHE_BYTES', '0'))
+# 'lru', 'lfu' or 'fifo', see ResultCache
+RESULT_CACHE_POLICY = os.environ.get('PYSEARCHLITE_RESULT_CACHE_POLICY', 'lru')
+EVICTION_POLICIES = ('lru', 'lfu', 'fifo')
+# If set, count queries also decode and cache their results, which makes a first count slower
+RESULT_CACHE_COUNTS = os.environ.get('PYSEARCHLITE_RESULT_CACHE_COUNTS', '0') == '1'
+# the size of an entry without its value
+ENTRY_BYTES = 100
+
+
+class LRUCache(object):
+    """
+    A least recently used cache bounded by the total size of its values.
+
+    Parameters
+    ----------
+    max_bytes: int
+        the total size of the values, the least recently used ones are
+        evicted beyond it
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        # key: (value, size), the least recently used first
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.touch(key)
+        return entry[0]
+
+    def touch(self, key):
+        """Record a hit of key."""
+        self.entries.move_to_end(key)
+
+    def victim(self):
+        """Return the key to evict."""
+        return next(iter(self.entries))
+
+    def evict(self, key):
+        _, size = self.entries.pop(key)
+        self.bytes -= size
+        self.evictions += 1
+
+    def put(self, key, value, size):
+        """Add value, and return False if it is larger than the whole cache."""
+        size += ENTRY_BYTES
+        if size > self.max_bytes:
+            return False
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        while self.entries and self.bytes + size > self.max_bytes:
+            self.evict(self.victim())
+        self.entries[key] = (value, size)
+        self.bytes += size
+        return True
+
+    def items(self):
+        """Return the keys and values, the least recently used first."""
+        return [(key, value) for key, (value, _) in self.entries.items()]
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else None,
+            'evictions': self.evictions,
+        }
+
+
+def token_pair(a, b):
+    return (a, b) if a <= b else (b, a)
+
+
+def query_pairs(tokens):
+    """Return the pairs of distinct tokens of a query."""
+    return [token_pair(a, b) for a, b in combinations(sorted(set(tokens)), 2)]
+
+
+def mine_pairs(queries, min_count=2):
+    """Return the token pairs which appear in at least min_count of queries, the most frequent first."""
+    counts = Counter(pair for tokens in queries for pair in query_pairs(tokens))
+    return [pair for pair, count in counts.most_common() if count >= min_count]
+
+
+class PairCache(LRUCache):
+    """
+    The intersections of frequent token pairs, as posting lists.
+
+    The pairs are mined from a query log, or counted in live traffic by
+    observe(), and InvertedIndexBlockSkipList.prepare_state substitutes a
+    cached pair for the lists of its two tokens. An empty intersection is
+    cached as None.
+
+    Parameters
+    ----------
+    max_bytes: int, default PAIR_CACHE_BYTES
+    min_count: int, default PAIR_CACHE_MIN_COUNT
+        the number of queries in which a pair of live traffic has to appear
+    max_tracked: int, default 100_000
+        the number of pairs counted in live traffic, the counts are halved
+        and the pairs seen once are dropped beyond it
+    """
+
+    def __init__(self, max_bytes=PAIR_CACHE_BYTES, min_count=PAIR_CACHE_MIN_COUNT, max_tracked=100_000):
+        super().__init__(max_bytes)
+        self.min_count = min_count
+        self.max_tracked = max_tracked
+        self.counts = Counter()
+
+    def observe(self, tokens):
+        """Count the pairs of a query, and return those which have just become frequent."""
+        hot = []
+        for pair in query_pairs(tokens):
+            self.counts[pair] += 1
+            if self.counts[pair] == self.min_count and pair not in self.entries:
+                hot.append(pair)
+        if len(self.counts) > self.max_tracked:
+            self.counts = Counter({pair: count // 2 for pair, count in self.counts.items() if count > 1})
+        return hot
+
+    def cover(self, tokens):
+        """
+        Return the cached pairs of tokens with their lists, sharing no token,
+        the shortest lists first. Each pair which is not cached is a miss.
+        """
+        cached = []
+        for pair in query_pairs(tokens):
+            entry = self.entries.get(pair)
+            if entry is None:
+                self.misses += 1
+                continue
+            doc_list = entry[0]
+            cached.append((doc_list.freq if doc_list is not None else 0, pair))
+        cached.sort()
+        used = set()
+        result = []
+        for _, pair in cached:
+            if pair[0] not in used and pair[1] not in used:
+                used.update(pair)
+                result.append((pair, self.get(pair)))
+        return result
+
+
+class ResultCache(LRUCache):
+    """
+    The results of conjunctions, keyed by their set of tokens.
+
+    InvertedIndexBlockSkipList.prepare_state starts a query from the result
+    of the largest cached subset of its tokens and intersects it with the
+    lists of the other tokens only. The doc ids are held as ArrayListExt,
+    or BitmapListExt when that is smaller, and an empty result as None.
+
+    Parameters
+    ----------
+    max_bytes: int, default RESULT_CACHE_BYTES
+    policy: str, default RESULT_CACHE_POLICY
+        'lru' evicts the least recently used result, 'lfu' the least
+        frequently used one, the oldest first among equals, and 'fifo' the
+        oldest one
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_BYTES, policy=RESULT_CACHE_POLICY):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unsupported eviction policy: {policy}")
+        super().__init__(max_bytes)
+        self.policy = policy
+        # the number of hits of each key for 'lfu'
+        self.uses = {}
+
+    def touch(self, key):
+        if self.policy == 'lru':
+            self.entries.move_to_end(key)
+        elif self.policy == 'lfu':
+            self.uses[key] = self.uses.get(key, 0) + 1
+
+    def victim(self):
+        if self.policy == 'lfu':
+            uses = self.uses
+            return min(self.entries, key=lambda key: uses.get(key, 0))
+        return next(iter(self.entries))
+
+    def evict(self, key):
+        super().evict(key)
+        self.uses.pop(key, None)
+
+    def clear(self):
+        super().clear()
+        self.uses = {}
+
+    def largest_subset(self, tokens):
+        """
+        Return the largest cached set of at least two of tokens and its
+        result, or (None, None).
+        """
+        tokens = frozenset(tokens)
+        best = None
+        if len(self.entries) < 1 << len(tokens):
+            for key in self.entries:
+                if len(key) > 1 and (best is None or len(key) > len(best)) and key <= tokens:
+                    best = key
+        else:
+            for n in range(len(tokens), 1, -1):
+                for key in combinations(tokens, n):
+                    key = frozenset(key)
+                    if key in self.entries:
+                        best = key
+                        break
+                if best is not None:
+                    break
+        if best is None:
+            self.misses += 1
+            return None, None
+        return best, self.get(best)
+
+    def stats(self):
+        stats = super().stats()
+        stats['policy'] = self.policy
+        return stats
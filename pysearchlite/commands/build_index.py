@@ -1,16 +1,60 @@
+import argparse
 import json
 import sys
+import time
 
 import pysearchlite as psl
+from pysearchlite import search_engine
+from pysearchlite.build_metrics import DEFAULT_INTERVAL, BuildMetrics
+from pysearchlite.implementations import DEFAULT_IMPLEMENTATION, INVERTED_INDEX_IMPLEMENTATIONS, new_index
+from pysearchlite.tokenize import normalized_tokens
 
 
-def main(idx_dir):
-    psl.init(idx_dir)
+def main(idx_dir, implementation=None, metrics=None):
+    """
+    Index the JSON lines of stdin with implementation, or the index of
+    pysearchlite.init if it is None, and report to metrics if it is given.
+    """
+    if implementation is None:
+        psl.init(idx_dir)
+        doc_list, inverted_index = search_engine.DOC_LIST, search_engine.INVERTED_INDEX
+    else:
+        doc_list, inverted_index = new_index(idx_dir, implementation)
+    if metrics is not None:
+        inverted_index.build_metrics = metrics
     for line in sys.stdin:
         doc = json.loads(line)
-        psl.index(doc['id'], doc['text'])
-    psl.save_index()
+        if metrics is None:
+            inverted_index.add(doc_list.add(doc['id']), normalized_tokens(doc['text']))
+            continue
+        start = time.perf_counter()
+        tokens = normalized_tokens(doc['text'])
+        tokenized = time.perf_counter()
+        inverted_index.add(doc_list.add(doc['id']), tokens)
+        metrics.add_document(len(tokens), tokenized - start, time.perf_counter() - tokenized)
+    if metrics is not None:
+        metrics.end_indexing()
+    start = time.perf_counter()
+    doc_list.save()
+    inverted_index.save()
+    if metrics is not None:
+        metrics.end_save(time.perf_counter() - start)
 
 
 if __name__ == '__main__':
-    main(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Build an index from JSON lines of id and text read from stdin.")
+    parser.add_argument('idx_dir')
+    parser.add_argument('--impl', choices=sorted(INVERTED_INDEX_IMPLEMENTATIONS), default=None,
+                        help=f"inverted index implementation (defaults to {DEFAULT_IMPLEMENTATION})")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="write progress and build metrics as JSON lines to this file, '-' for stderr")
+    parser.add_argument('--metrics-interval', type=float, default=DEFAULT_INTERVAL,
+                        help="seconds between progress lines while indexing")
+    args = parser.parse_args()
+    if args.metrics == '-':
+        main(args.idx_dir, args.impl, BuildMetrics(sys.stderr, args.metrics_interval))
+    elif args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            main(args.idx_dir, args.impl, BuildMetrics(f, args.metrics_interval))
+    else:
+        main(args.idx_dir, args.impl)
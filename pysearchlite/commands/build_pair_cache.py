@@ -0,0 +1,50 @@
+import argparse
+import sys
+
+from pysearchlite.cache import PairCache, mine_pairs
+from pysearchlite.commands.replay import read_queries
+from pysearchlite.inverted_index_skip_list import InvertedIndexBlockSkipList
+from pysearchlite.tokenize import normalized_tokens
+
+
+def build_pair_cache(inverted_index, queries, max_bytes, min_count=2, log=None):
+    """
+    Cache the intersections of the token pairs which appear in at least
+    min_count of queries, up to max_bytes, and return the cache.
+
+    The pairs are added from the least frequent, so that the most frequent
+    ones are kept when they do not all fit.
+    """
+    pairs = mine_pairs(queries, min_count)
+    inverted_index.pair_cache = PairCache(max_bytes)
+    inverted_index.add_pairs(reversed(pairs))
+    if log is not None:
+        log.write(f"{len(pairs)} pairs, {len(inverted_index.pair_cache)} cached "
+                  f"in {inverted_index.pair_cache.bytes} bytes\n")
+    return inverted_index.pair_cache
+
+
+def main(idx_dir, query_file, max_bytes, min_count=2, max_queries=None):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    inverted_index.restore()
+    with open(query_file, 'r', encoding='utf-8') as f:
+        queries = [normalized_tokens(query) for _, query in read_queries(f)]
+    if max_queries is not None:
+        queries = queries[:max_queries]
+    build_pair_cache(inverted_index, queries, max_bytes, min_count, sys.stderr)
+    inverted_index.save_pair_cache()
+    inverted_index.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Cache the intersections of the frequent token pairs of a query log next to the index. "
+                    "restore() loads them, and saving the index removes them.")
+    parser.add_argument('idx_dir')
+    parser.add_argument('query_file', help="queries in the COMMAND<TAB>query format")
+    parser.add_argument('--max-bytes', type=int, default=10_000_000)
+    parser.add_argument('--min-count', type=int, default=2,
+                        help="the number of queries in which a pair has to appear")
+    parser.add_argument('--max-queries', type=int, default=None, help="use the first queries of the file only")
+    args = parser.parse_args()
+    main(args.idx_dir, args.query_file, args.max_bytes, args.min_count, args.max_queries)
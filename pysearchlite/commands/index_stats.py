@@ -0,0 +1,29 @@
+import argparse
+import json
+import sys
+
+from pysearchlite.index_stats import format_index_stats, index_stats
+from pysearchlite.inverted_index_skip_list import InvertedIndexBlockSkipList
+
+
+def main(idx_dir, as_json=False):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir, use_mmap=True)
+    inverted_index.restore()
+    try:
+        stats = index_stats(inverted_index)
+    finally:
+        inverted_index.close()
+    if as_json:
+        json.dump(stats, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        sys.stdout.write(format_index_stats(stats) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Report the term count, posting list lengths and where the bytes of an index go.")
+    parser.add_argument('idx_dir')
+    parser.add_argument('--json', action='store_true', help="write the report as JSON")
+    args = parser.parse_args()
+    main(args.idx_dir, args.json)
@@ -0,0 +1,117 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import pysearchlite as psl
+from .protocol import run_command
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+RESTART_INTERVAL = 1.0
+STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+
+def serve_connection(conn):
+    with conn, conn.makefile('r', encoding='utf-8') as reader, conn.makefile('w', encoding='utf-8') as writer:
+        for line in reader:
+            command, _, query = line.partition('\t')
+            writer.write(str(run_command(command, query)) + '\n')
+            writer.flush()
+
+
+def worker_loop(listener):
+    for signum in STOP_SIGNALS:
+        signal.signal(signum, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+    while True:
+        conn, _ = listener.accept()
+        try:
+            serve_connection(conn)
+        except (ConnectionError, UnicodeDecodeError) as e:
+            sys.stderr.write(f"[{os.getpid()}] {e!r}\n")
+
+
+def spawn_worker(listener):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            worker_loop(listener)
+        except BaseException:  # pylint: disable=broad-except
+            # os._exit drops the exception, so report it before exiting.
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stderr.flush()
+            os._exit(code)  # pylint: disable=protected-access
+    return pid
+
+
+def supervise(listener, num_workers):
+    """Fork num_workers workers and restart the ones which exit, until SIGTERM or SIGINT."""
+    workers = set()
+    stopping = []
+
+    def stop(signum, frame):  # pylint: disable=unused-argument
+        stopping.append(signum)
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+    def start_worker():
+        # A stop signal is held until the worker has reset its handlers and
+        # its pid is in workers, or the worker would be left running.
+        mask = signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+        try:
+            workers.add(spawn_worker(listener))
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+
+    for signum in STOP_SIGNALS:
+        signal.signal(signum, stop)
+    for _ in range(num_workers):
+        start_worker()
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if stopping:
+            continue
+        sys.stderr.write(f"Worker {pid} exited with status {status}, restarting\n")
+        # Avoid a tight restart loop if workers fail right away.
+        time.sleep(RESTART_INTERVAL)
+        start_worker()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve the COMMAND<TAB>query protocol over TCP from pre-forked workers.")
+    parser.add_argument('idx_dir')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    # Open the index once in the parent. The posting lists are views of the
+    # mapped file, so the workers share them through the page cache, and the
+    # term dictionary is inherited copy-on-write.
+    psl.init(args.idx_dir, use_mmap=True)
+    psl.restore_index()
+    # Keep the GC of the workers from touching, and so copying, the pages of
+    # the objects created so far.
+    gc.collect()
+    gc.freeze()
+
+    listener = socket.create_server((args.host, args.port), backlog=128)
+    sys.stderr.write(f"Listening on {listener.getsockname()} with {args.workers} workers\n")
+    supervise(listener, args.workers)
+
+
+if __name__ == '__main__':
+    main()
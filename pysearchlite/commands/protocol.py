@@ -0,0 +1,37 @@
+import sys
+
+import pysearchlite as psl
+
+
+def run_command(command, query):
+    """Answer a query of the COMMAND<TAB>query protocol and return the count written for it."""
+    if command == 'COUNT':
+        count = psl.count(query)
+    elif command == 'TOP_10':
+        psl.top_k(query, 10)
+        count = 1
+    elif command == 'TOP_10_COUNT':
+        count = len(psl.search(query))
+    else:
+        sys.stderr.write("UNSUPPORTED\n")
+        count = 0
+    return count
+
+
+def run_batch(command_queries):
+    """
+    Answer a block of (command, query) and return their counts. The count
+    commands are counted with count_batch, without reading doc names, and
+    the TOP_10 ones stop after 10 docs with top_k, as in run_command.
+    """
+    counted = [i for i, (command, _) in enumerate(command_queries) if command in ('COUNT', 'TOP_10_COUNT')]
+    counts = [0] * len(command_queries)
+    for i, count in zip(counted, psl.count_batch([command_queries[i][1] for i in counted])):
+        counts[i] = count
+    for i, (command, query) in enumerate(command_queries):
+        if command == 'TOP_10':
+            psl.top_k(query, 10)
+            counts[i] = 1
+        elif command not in ('COUNT', 'TOP_10_COUNT'):
+            sys.stderr.write("UNSUPPORTED\n")
+    return counts
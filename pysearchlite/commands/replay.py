@@ -0,0 +1,186 @@
+import argparse
+import json
+import sys
+import time
+
+from pysearchlite.implementations import DEFAULT_IMPLEMENTATION, INVERTED_INDEX_IMPLEMENTATIONS, open_reader
+from pysearchlite.metrics import latency_summary, posting_bucket
+from pysearchlite.query_stats import QueryStats
+from pysearchlite.tokenize import normalized_tokens
+
+GROUPS = ('command', 'terms', 'shortest_df')
+SUMMARY_COLUMNS = ('p50', 'p90', 'p99', 'max')
+
+
+def read_queries(f):
+    for line in f:
+        command, _, query = line.rstrip('\n').partition('\t')
+        yield command, query
+
+
+def run_query(reader, command, query):
+    if command == 'COUNT':
+        return reader.count(query)
+    elif command == 'TOP_10':
+        return reader.top_k(query, 10)
+    elif command == 'TOP_10_COUNT':
+        return len(reader.search(query))
+    raise ValueError(f"Unsupported command: {command}")
+
+
+def replay(reader, command_queries, collect_stats=False):
+    """
+    Run the queries on reader and return a record with the wall time of each,
+    and with its iterator counters if collect_stats is set and the index supports them.
+    """
+    inverted_index = reader.inverted_index
+    collect_stats = collect_stats and hasattr(inverted_index, 'collect_stats')
+    if collect_stats:
+        inverted_index.collect_stats = True
+    records = []
+    for command, query in command_queries:
+        tokens = normalized_tokens(query)
+        shortest_df = min((inverted_index.get_freq(t) for t in tokens), default=0)
+        if collect_stats:
+            inverted_index.last_stats = None
+        start = time.perf_counter()
+        result = run_query(reader, command, query)
+        elapsed = time.perf_counter() - start
+        record = {
+            'command': command,
+            'query': query,
+            'terms': len(tokens),
+            'shortest_df': shortest_df,
+            'seconds': elapsed,
+            'result': result,
+        }
+        if collect_stats and inverted_index.last_stats is not None:
+            record['stats'] = inverted_index.last_stats.as_dict()
+        records.append(record)
+    return records
+
+
+def group_key(record, group):
+    if group == 'shortest_df':
+        return posting_bucket(record['shortest_df'])
+    return str(record[group])
+
+
+def summarize_records(records):
+    summary = latency_summary([r['seconds'] for r in records])
+    stats = [r['stats'] for r in records if 'stats' in r]
+    if stats:
+        summary['mean_stats'] = {field: sum(s[field] for s in stats) / len(stats) for field in QueryStats.FIELDS}
+    return summary
+
+
+def summarize(records):
+    summary = {'all': summarize_records(records)}
+    for group in GROUPS:
+        groups = {}
+        for r in records:
+            groups.setdefault(group_key(r, group), []).append(r)
+        summary[group] = {key: summarize_records(groups[key]) for key in sorted(groups, key=sort_key)}
+    return summary
+
+
+def sort_key(key):
+    head = key.split('-')[0]
+    return (0, int(head), key) if head.isdigit() else (1, 0, key)
+
+
+def format_report(names, summaries):
+    header = f"{'group':<24}" + ''.join(
+        f" | {name[-30:]:>30}" for name in names)
+    sub = f"{'':<24}" + ''.join(
+        " | " + f"{'n':>6}" + ''.join(f"{c:>6}" for c in SUMMARY_COLUMNS) for _ in names)
+    lines = [header, sub]
+    rows = [('all', lambda s: s['all'])]
+    for group in GROUPS:
+        keys = []
+        for s in summaries:
+            keys.extend(k for k in s[group] if k not in keys)
+        for key in sorted(keys, key=sort_key):
+            rows.append((f"{group}={key}", lambda s, group=group, key=key: s[group].get(key)))
+    for label, get in rows:
+        line = f"{label:<24}"
+        for s in summaries:
+            stats = get(s)
+            if stats is None:
+                line += " | " + ' ' * 30
+            else:
+                line += " | " + f"{stats['count']:>6}" + ''.join(
+                    f"{stats[c] * 1000:>6.2f}" if stats[c] < 10 else f"{stats[c]:>5.0f}s" for c in SUMMARY_COLUMNS)
+        lines.append(line)
+    lines.append("(latencies in milliseconds)")
+    for name, s in zip(names, summaries):
+        if 'mean_stats' in s['all']:
+            lines.append(f"mean counters per query of {name}:")
+            for label, get in rows:
+                stats = get(s)
+                if stats is not None and 'mean_stats' in stats:
+                    lines.append(f"{label:<24} " + ' '.join(
+                        f"{field}={value:.1f}" for field, value in stats['mean_stats'].items()))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a COUNT/TOP_10/TOP_10_COUNT query file and report latency percentiles.")
+    parser.add_argument('query_file', help="queries in the COMMAND<TAB>query format, '-' for stdin")
+    parser.add_argument('idx_dir', nargs='+', help="index directory; give two to compare them")
+    parser.add_argument('--impl', action='append', choices=sorted(INVERTED_INDEX_IMPLEMENTATIONS),
+                        help="inverted index implementation for each index directory, "
+                             f"may be repeated to compare engines (defaults to {DEFAULT_IMPLEMENTATION})")
+    parser.add_argument('--stats', action='store_true', help="collect the iterator counters of each query")
+    parser.add_argument('--json', action='store_true', help="write the report as JSON")
+    parser.add_argument('--records', action='store_true', help="include every query in the JSON report")
+    args = parser.parse_args()
+
+    idx_dirs = args.idx_dir
+    impls = args.impl or [DEFAULT_IMPLEMENTATION]
+    runs = max(len(idx_dirs), len(impls))
+    if len(idx_dirs) not in (1, runs) or len(impls) not in (1, runs):
+        parser.error("give either one index directory or one --impl, or the same number of both")
+    idx_dirs = idx_dirs * runs if len(idx_dirs) == 1 else idx_dirs
+    impls = impls * runs if len(impls) == 1 else impls
+
+    if args.query_file == '-':
+        command_queries = list(read_queries(sys.stdin))
+    else:
+        with open(args.query_file, 'r', encoding='utf-8') as f:
+            command_queries = list(read_queries(f))
+
+    names = []
+    all_records = []
+    for idx_dir, impl in zip(idx_dirs, impls):
+        reader = open_reader(idx_dir, impl)
+        try:
+            all_records.append(replay(reader, command_queries, args.stats))
+        finally:
+            reader.retire()
+        names.append(f"{idx_dir} ({impl})")
+    summaries = [summarize(records) for records in all_records]
+
+    mismatches = None
+    if len(all_records) > 1:
+        mismatches = sum(1 for rs in zip(*all_records) if any(r['result'] != rs[0]['result'] for r in rs))
+
+    if args.json:
+        report = {'runs': []}
+        for name, summary, records in zip(names, summaries, all_records):
+            run = {'name': name, 'summary': summary}
+            if args.records:
+                run['records'] = records
+            report['runs'].append(run)
+        report['mismatches'] = mismatches
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        sys.stdout.write(format_report(names, summaries) + '\n')
+        if mismatches is not None:
+            sys.stdout.write(f"queries with different results: {mismatches}\n")
+
+
+if __name__ == '__main__':
+    main()
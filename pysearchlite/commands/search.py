@@ -1,22 +1,62 @@
-import json
+import argparse
 import sys
 
 import pysearchlite as psl
+from pysearchlite.commands.protocol import run_batch, run_command
 
 
-def main():
-    psl.init('idx')
+def main(idx_dir, batch_size=0, slow_query_log=None):
+    psl.init(idx_dir)
     psl.restore_index()
-    # Search
-    print(psl.count('st petersburg high school'))
-    print(psl.search('united states constitution'))
-    print(psl.search('search'))
-    print(psl.search('los angeles'))
-    print(psl.search('the national football league'))
-    print(psl.search('the book of life'))
-    print(psl.search('care a lot'))
-    print(psl.search('usb hub'))
+    if slow_query_log is not None:
+        psl.set_slow_query_log(slow_query_log)
+    if batch_size > 0:
+        main_batch(batch_size)
+        return
+    for line in sys.stdin:
+        command_query = line.split('\t')
+        command = command_query[0]
+        query = command_query[1]
+        count = run_command(command, query)
+        sys.stdout.write(str(count) + '\n')
+        sys.stdout.flush()
+
+
+def main_batch(batch_size):
+    batch = []
+    for line in sys.stdin:
+        command, _, query = line.partition('\t')
+        batch.append((command, query))
+        if len(batch) >= batch_size:
+            write_batch(batch)
+            batch = []
+    if batch:
+        write_batch(batch)
+
+
+def write_batch(batch):
+    sys.stdout.write(''.join(f"{count}\n" for count in run_batch(batch)))
+    sys.stdout.flush()
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Answer COUNT, TOP_10 and TOP_10_COUNT queries from stdin.")
+    parser.add_argument('idx_dir')
+    parser.add_argument('--batch', type=int, default=0,
+                        help="evaluate the queries in blocks of this size, for offline runs")
+    parser.add_argument('--slow-query-log', metavar='FILE',
+                        help="write a JSON line for each query slower than --slow-query-ms to this file")
+    parser.add_argument('--slow-query-ms', type=float, default=100.0)
+    parser.add_argument('--slow-query-sample', type=float, default=1.0,
+                        help="the fraction of the slow queries which are logged")
+    parser.add_argument('--slow-query-max-bytes', type=int, default=10 * 1024 * 1024,
+                        help="rotate the log file at this size")
+    parser.add_argument('--slow-query-stats', action='store_true',
+                        help="log the iterator counters of the slow queries")
+    args = parser.parse_args()
+    slow_query_log = None
+    if args.slow_query_log:
+        slow_query_log = psl.SlowQueryLog(args.slow_query_log, args.slow_query_ms / 1000.0,
+                                          args.slow_query_sample, args.slow_query_max_bytes,
+                                          collect_stats=args.slow_query_stats)
+    main(args.idx_dir, args.batch, slow_query_log)
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import json
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+from pysearchlite.async_search import AsyncSearchEngine
+from .protocol import run_command
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_MAX_PENDING = 1024
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+
+def execute(command, query):
+    return run_command(command, query)
+
+
+class QueryServer(object):
+    """
+    Serve the `COMMAND\\tquery` protocol of commands/search.py over TCP,
+    and a small HTTP/JSON endpoint, dispatching queries to worker processes.
+    """
+
+    def __init__(self, idx_dir, workers=None, max_pending=DEFAULT_MAX_PENDING):
+        self.max_pending = max_pending
+        self.engine = AsyncSearchEngine(idx_dir, max_workers=workers, max_pending=max_pending)
+
+    async def start(self):
+        await self.engine.start()
+
+    def close(self):
+        self.engine.close()
+
+    async def handle_tcp(self, reader, writer):
+        # Results are written in the order of the queries, while the queries
+        # of one client are evaluated concurrently.
+        pending = asyncio.Queue(self.max_pending)
+
+        async def write_results():
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                try:
+                    count = await task
+                except Exception as e:  # pylint: disable=broad-except
+                    sys.stderr.write(f"ERROR {e!r}\n")
+                    count = 0
+                writer.write(f"{count}\n".encode('utf-8'))
+                if pending.empty():
+                    await writer.drain()
+
+        writer_task = asyncio.create_task(write_results())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, query = line.decode('utf-8').partition('\t')
+                await pending.put(asyncio.ensure_future(self.engine.run(execute, command, query)))
+            await pending.put(None)
+            await writer_task
+        finally:
+            writer.close()
+
+    async def handle_http(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            url = urlsplit(target)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if method == 'POST':
+                body = await reader.readexactly(int(headers.get('content-length', '0')))
+                params.update(json.loads(body))
+            status, payload = await self.dispatch_http(url.path, params)
+        except (ValueError, KeyError, asyncio.IncompleteReadError) as e:
+            status, payload = 400, {'error': repr(e)}
+        except Exception as e:  # pylint: disable=broad-except
+            status, payload = 500, {'error': repr(e)}
+        body = json.dumps(payload).encode('utf-8')
+        writer.write(f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode('latin-1'))
+        writer.write(body)
+        await writer.drain()
+        writer.close()
+
+    async def dispatch_http(self, path, params):
+        if path == '/query':
+            command = params.get('command', 'COUNT')
+            query = params['query']
+            count = await self.engine.run(execute, command, query)
+            return 200, {'command': command, 'query': query, 'count': count}
+        elif path == '/search':
+            query = params['query']
+            docs = await self.engine.top_k(query, int(params.get('k', 10)))
+            return 200, {'query': query, 'docs': docs}
+        return 404, {'error': f"Unknown path: {path}"}
+
+
+async def serve(args):
+    server = QueryServer(args.idx_dir, workers=args.workers, max_pending=args.max_pending)
+    await server.start()
+    try:
+        servers = [await asyncio.start_server(server.handle_tcp, args.host, args.port)]
+        if args.http_port:
+            servers.append(await asyncio.start_server(server.handle_http, args.host, args.http_port))
+        for s in servers:
+            for sock in s.sockets:
+                sys.stderr.write(f"Listening on {sock.getsockname()}\n")
+        await asyncio.gather(*(s.serve_forever() for s in servers))
+    finally:
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve queries over TCP and HTTP.")
+    parser.add_argument('idx_dir')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help="port of the COMMAND<TAB>query line protocol")
+    parser.add_argument('--http-port', type=int, default=None,
+                        help="port of the HTTP/JSON endpoint (disabled by default)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of worker processes (defaults to the number of CPUs)")
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                        help="maximum number of queries waiting for a worker")
+    args = parser.parse_args()
+    asyncio.run(serve(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import sys
+import time
+
+from pysearchlite.commands.replay import read_queries
+from pysearchlite.intersection import INTERSECTIONS, IntersectionCostModel, intersection_bucket
+from pysearchlite.inverted_index_skip_list import InvertedIndexBlockSkipList
+from pysearchlite.tokenize import normalized_tokens
+
+
+def calibrate(inverted_index, queries, algorithms=tuple(INTERSECTIONS), repeat=3, log=None):
+    """
+    Measure the cost of each intersection algorithm for each bucket of queries.
+
+    Each query of more than one term is evaluated with each algorithm, and
+    the best time of repeat runs is added to the bucket of the query, see
+    intersection_bucket. The cost is the total divided by the number of
+    queries of the bucket. Queries intersected as bitmaps or roaring lists
+    are left out.
+
+    Returns an IntersectionCostModel with these costs.
+    """
+    totals = {}
+    counts = {}
+    for command, tokens in queries:
+        if len(tokens) < 2:
+            continue
+        state = inverted_index.prepare_state(tokens)
+        if not state or inverted_index.algorithm(state) not in INTERSECTIONS:
+            continue
+        bucket = intersection_bucket([freq for freq, _ in state])
+        counts[bucket] = counts.get(bucket, 0) + 1
+        bucket_totals = totals.setdefault(bucket, {algorithm: 0.0 for algorithm in algorithms})
+        for algorithm in algorithms:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                inverted_index.evaluate(algorithm, state, count=command == 'COUNT')
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            bucket_totals[algorithm] += best
+    bucket_costs = {bucket: {algorithm: seconds / counts[bucket] for algorithm, seconds in per_algorithm.items()}
+                    for bucket, per_algorithm in totals.items()}
+    if log is not None:
+        for bucket, per_algorithm in sorted(bucket_costs.items()):
+            log.write(f"{bucket}: {counts[bucket]} queries, {min(per_algorithm, key=per_algorithm.get)}\n")
+    return IntersectionCostModel(bucket_costs)
+
+
+def main(idx_dir, query_file, output, algorithms=tuple(INTERSECTIONS), max_queries=None, repeat=3):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    inverted_index.restore()
+    with open(query_file, 'r', encoding='utf-8') as f:
+        queries = [(command, normalized_tokens(query)) for command, query in read_queries(f)]
+    if max_queries is not None:
+        queries = queries[:max_queries]
+    model = calibrate(inverted_index, queries, algorithms, repeat, sys.stderr)
+    model.save(output)
+    inverted_index.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Calibrate the intersection algorithm of each bucket of queries on a query log. "
+                    "Search with PYSEARCHLITE_INTERSECTION_COSTS set to the output to apply it.")
+    parser.add_argument('idx_dir')
+    parser.add_argument('query_file', help="queries in the COMMAND<TAB>query format")
+    parser.add_argument('--output', default='intersection_costs.json')
+    parser.add_argument('--algorithms', type=lambda s: s.split(','), default=tuple(INTERSECTIONS),
+                        help=f"comma separated algorithms (defaults to {','.join(INTERSECTIONS)})")
+    parser.add_argument('--max-queries', type=int, default=None, help="use the first queries of the file only")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    unknown = set(args.algorithms) - set(INTERSECTIONS)
+    if unknown:
+        parser.error(f"unknown algorithms: {','.join(sorted(unknown))}")
+    main(args.idx_dir, args.query_file, args.output, args.algorithms, args.max_queries, args.repeat)
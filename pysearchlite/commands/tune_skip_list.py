@@ -0,0 +1,121 @@
+import argparse
+import io
+import sys
+import time
+
+from pysearchlite.block_skip_list import BlockSkipList, LIST_TYPE_DOC_ID, SKIPLIST_MAX_LEVEL
+from pysearchlite.commands.replay import read_queries
+from pysearchlite.gamma_codecs import DOCID_LEN_BYTES
+from pysearchlite.inverted_index_skip_list import InvertedIndexBlockSkipList
+from pysearchlite.metrics import posting_bucket
+from pysearchlite.skip_list_layout import SkipListLayout
+from pysearchlite.tokenize import normalized_tokens
+
+# a block holds at least its header and a doc id with a block index
+BLOCK_SIZES = (16, 24, 32, 44, 64, 96, 128, 192, 255)
+MAX_LEVELS = (0, 1, 2, 3, SKIPLIST_MAX_LEVEL)
+
+
+def encode_list(ids, block_size, max_level):
+    """Return the (freq, list_type, mem) entry of a restored index for ids laid out with this configuration."""
+    f = io.BytesIO()
+    BlockSkipList.from_list(ids, block_size, max_level).write(f)
+    data = f.getvalue()
+    # the block type byte has the value of the list type
+    list_type = data[0]
+    if list_type == LIST_TYPE_DOC_ID:
+        return len(ids), list_type, data[1:]
+    return len(ids), list_type, data[1 + DOCID_LEN_BYTES:]
+
+
+def run_queries(inverted_index, queries):
+    for command, tokens in queries:
+        if command == 'COUNT':
+            inverted_index.count_and(tokens)
+        else:
+            inverted_index.search_and(tokens)
+
+
+def calibrate(inverted_index, queries, configs, repeat=3, log=None):
+    """
+    Measure the cost of each configuration for each decade of posting list length.
+
+    For each decade, the lists of that length used by the queries are laid
+    out with each configuration in turn, the others keeping their layout in
+    inverted_index, and the queries which use them are timed. The best time
+    of repeat runs divided by the number of these queries is the cost.
+    Each configuration is timed on a new index without caches, which parses
+    the lists again.
+
+    Returns a SkipListLayout with these costs.
+    """
+    queries = [(command, tokens) for command, tokens in queries if len(tokens) > 1]
+    ids = {t: inverted_index.get(t) for _, tokens in queries for t in tokens if inverted_index.get_freq(t) > 1}
+    buckets = {}
+    for t in ids:
+        buckets.setdefault(posting_bucket(len(ids[t])), []).append(t)
+    costs = {}
+    for bucket, bucket_tokens in buckets.items():
+        bucket_set = set(bucket_tokens)
+        bucket_queries = [q for q in queries if bucket_set.intersection(q[1])]
+        costs[bucket] = {}
+        for config in configs:
+            # a new index, so that no list parsed or cached with another layout is timed,
+            # and without the caches, which would time the repeats as hits
+            scratch = InvertedIndexBlockSkipList(None)
+            scratch.pair_cache = scratch.result_cache = scratch.postings_cache = None
+            scratch.data = dict(inverted_index.data)
+            for t in bucket_tokens:
+                scratch.data[t] = encode_list(ids[t], *config)
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run_queries(scratch, bucket_queries)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            costs[bucket][config] = best / len(bucket_queries)
+            scratch.close()
+        if log is not None:
+            block_size, max_level = min(costs[bucket], key=costs[bucket].get)
+            log.write(f"df {bucket}: {len(bucket_tokens)} terms, {len(bucket_queries)} queries, "
+                      f"block_size={block_size} max_level={max_level}\n")
+    return SkipListLayout(costs)
+
+
+def main(idx_dir, query_file, output, block_sizes=BLOCK_SIZES, max_levels=MAX_LEVELS, max_queries=None, repeat=3):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    inverted_index.restore()
+    with open(query_file, 'r', encoding='utf-8') as f:
+        queries = [(command, normalized_tokens(query)) for command, query in read_queries(f)]
+    if max_queries is not None:
+        queries = queries[:max_queries]
+    # without levels the list is a plain doc id list whatever the block size
+    configs = [(block_size, max_level) for max_level in max_levels
+               for block_size in (block_sizes if max_level > 0 else block_sizes[:1])]
+    layout = calibrate(inverted_index, queries, configs, repeat, sys.stderr)
+    layout.save(output)
+    inverted_index.close()
+
+
+def int_list(s):
+    return [int(x) for x in s.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Calibrate the skip list block size and maximum level of each posting list length "
+                    "on a query log. Build with PYSEARCHLITE_SKIPLIST_LAYOUT set to the output to apply it.")
+    parser.add_argument('idx_dir')
+    parser.add_argument('query_file', help="queries in the COMMAND<TAB>query format")
+    parser.add_argument('--output', default='skip_list_layout.json')
+    parser.add_argument('--block-sizes', type=int_list, default=BLOCK_SIZES,
+                        help=f"comma separated block sizes, at most 255 (defaults to {BLOCK_SIZES})")
+    parser.add_argument('--max-levels', type=int_list, default=MAX_LEVELS,
+                        help=f"comma separated maximum levels, 0 for no skip list (defaults to {MAX_LEVELS})")
+    parser.add_argument('--max-queries', type=int, default=None, help="use the first queries of the file only")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    if not all(16 <= block_size <= 255 for block_size in args.block_sizes):
+        parser.error("block sizes must be between 16 and 255")
+    main(args.idx_dir, args.query_file, args.output, args.block_sizes, args.max_levels, args.max_queries,
+         args.repeat)
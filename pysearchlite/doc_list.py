@@ -29,6 +29,9 @@ class DocList(abc.ABC):
     def clear(self):
         pass
 
+    def close(self):
+        self.clear()
+
     def get_doc_filename(self):
         return os.path.join(self.idx_dir, DOC_LIST_FILENAME)
 
@@ -27,6 +27,15 @@ VAR_ENCODE_BYTES = [1] * 128 + [2] * 64 + [3] * 32 + [4] * 16 + [5] * 8
 BLOCK_TYPE_DOC_ID = b"\x01"
 BLOCK_TYPE_DOC_IDS_LIST = b"\x02"
 BLOCK_TYPE_SKIP_LIST = b"\x03"
+BLOCK_TYPE_FLAT_SKIP_LIST = b"\x04"
+BLOCK_TYPE_BITMAP = b"\x05"
+BLOCK_TYPE_ROARING = b"\x06"
+
+FLAT_BLOCK_HEAD_BYTES = 4
+FLAT_BLOCK_OFFSET_BYTES = 4
+BITMAP_LEN_BYTES = 4
+ROARING_OFFSET_BYTES = 4
+ROARING_KEY_BYTES = 2
 
 
 def write_token(f, token):
@@ -201,6 +210,13 @@ def copy_ids(dst, src):
     dst.write(doc_ids_bytes)
 
 
+def skip_ids(f):
+    """Skip the doc ids of a token and return their number."""
+    doc_ids_len = int.from_bytes(f.read(DOCID_LEN_BYTES), sys.byteorder)
+    f.seek(doc_ids_len * DOCID_BYTES, 1)
+    return doc_ids_len
+
+
 def merge_ids(dst, src1, src2):
     doc_ids_len1 = int.from_bytes(src1.read(DOCID_LEN_BYTES), sys.byteorder)
     doc_ids_len2 = int.from_bytes(src2.read(DOCID_LEN_BYTES), sys.byteorder)
@@ -233,6 +249,56 @@ def write_block_skip_list(skip_list, file):
         file.write(b)
 
 
+def write_flat_skip_list(skip_list, file):
+    # BLOCK_TYPE_FLAT_SKIP_LIST(1) freq(DOCID_LEN_BYTES) num_blocks(FLAT_BLOCK_OFFSET_BYTES)
+    file.write(BLOCK_TYPE_FLAT_SKIP_LIST)
+    file.write(skip_list.freq.to_bytes(DOCID_LEN_BYTES, sys.byteorder))
+    num_blocks = len(skip_list.blocks)
+    file.write(num_blocks.to_bytes(FLAT_BLOCK_OFFSET_BYTES, sys.byteorder))
+    # [head[i](FLAT_BLOCK_HEAD_BYTES) for each block], the first doc id of each block
+    for head in skip_list.heads:
+        file.write(head.to_bytes(FLAT_BLOCK_HEAD_BYTES, sys.byteorder))
+    # [offset[i](FLAT_BLOCK_OFFSET_BYTES) for each block and the end], from num_blocks
+    offset = FLAT_BLOCK_OFFSET_BYTES + num_blocks * (FLAT_BLOCK_HEAD_BYTES + FLAT_BLOCK_OFFSET_BYTES) \
+        + FLAT_BLOCK_OFFSET_BYTES
+    for block in skip_list.blocks:
+        file.write(offset.to_bytes(FLAT_BLOCK_OFFSET_BYTES, sys.byteorder))
+        offset += len(block)
+    file.write(offset.to_bytes(FLAT_BLOCK_OFFSET_BYTES, sys.byteorder))
+    for block in skip_list.blocks:
+        file.write(block)
+
+
+def write_bitmap(bitmap, file):
+    # BLOCK_TYPE_BITMAP(1) freq(DOCID_LEN_BYTES) len(bitmap)(BITMAP_LEN_BYTES) bitmap
+    # the bit (doc_id & 7) of the byte (doc_id >> 3) is set for each doc id
+    file.write(BLOCK_TYPE_BITMAP)
+    file.write(bitmap.freq.to_bytes(DOCID_LEN_BYTES, sys.byteorder))
+    file.write(len(bitmap.bitmap).to_bytes(BITMAP_LEN_BYTES, sys.byteorder))
+    file.write(bitmap.bitmap)
+
+
+def write_roaring_list(roaring_list, file):
+    # BLOCK_TYPE_ROARING(1) freq(DOCID_LEN_BYTES) num_containers(ROARING_OFFSET_BYTES)
+    file.write(BLOCK_TYPE_ROARING)
+    file.write(roaring_list.freq.to_bytes(DOCID_LEN_BYTES, sys.byteorder))
+    num_containers = len(roaring_list.containers)
+    file.write(num_containers.to_bytes(ROARING_OFFSET_BYTES, sys.byteorder))
+    # [offset[i](ROARING_OFFSET_BYTES) for each container and the end], from num_containers
+    offset = ROARING_OFFSET_BYTES * (num_containers + 2) + (ROARING_KEY_BYTES + 1) * num_containers
+    for container in roaring_list.containers:
+        file.write(offset.to_bytes(ROARING_OFFSET_BYTES, sys.byteorder))
+        offset += len(container)
+    file.write(offset.to_bytes(ROARING_OFFSET_BYTES, sys.byteorder))
+    # [key[i](ROARING_KEY_BYTES) for each container], the high 16 bits of its doc ids
+    for key in roaring_list.keys:
+        file.write(key.to_bytes(ROARING_KEY_BYTES, sys.byteorder))
+    # [type[i](1) for each container]
+    file.write(bytes(roaring_list.types))
+    for container in roaring_list.containers:
+        file.write(container)
+
+
 def write_doc_ids_list(doc_ids, file):
     file.write(BLOCK_TYPE_DOC_IDS_LIST)
     file.write(len(doc_ids.ids).to_bytes(DOCID_LEN_BYTES, sys.byteorder))
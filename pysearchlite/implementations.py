@@ -0,0 +1,30 @@
+from .doc_list import MemoryDocList
+from .index_reader import IndexReader
+from .inverted_index_skip_list import InvertedIndexBlockSkipList
+from .memory_inverted_index import MemoryInvertedIndex
+from .spim_inverted_index import SinglePassInMemoryInvertedIndex
+from .spim_inverted_index_memory import SinglePassInMemoryInvertedIndexMemory
+from .spim_inverted_index_memory_binary import SinglePassInMemoryInvertedIndexMemoryBinary
+
+DEFAULT_IMPLEMENTATION = 'block_skip_list'
+
+INVERTED_INDEX_IMPLEMENTATIONS = {
+    'block_skip_list': InvertedIndexBlockSkipList,
+    'spim': SinglePassInMemoryInvertedIndex,
+    'spim_memory': SinglePassInMemoryInvertedIndexMemory,
+    'spim_memory_binary': SinglePassInMemoryInvertedIndexMemoryBinary,
+    'memory': MemoryInvertedIndex,
+}
+
+
+def new_index(idx_dir, implementation=DEFAULT_IMPLEMENTATION):
+    """Return a doc list and an inverted index of the named implementation in idx_dir."""
+    return MemoryDocList(idx_dir), INVERTED_INDEX_IMPLEMENTATIONS[implementation](idx_dir)
+
+
+def open_reader(idx_dir, implementation=DEFAULT_IMPLEMENTATION):
+    """Restore the index in idx_dir with the named implementation and return an IndexReader of it."""
+    doc_list, inverted_index = new_index(idx_dir, implementation)
+    doc_list.restore()
+    inverted_index.restore()
+    return IndexReader(doc_list, inverted_index)
@@ -0,0 +1,171 @@
+import threading
+import time
+from itertools import islice
+
+from .query_stats import QueryTrace
+from .tokenize import normalized_tokens
+
+
+class IndexReader(object):
+    """
+    A reference-counted view of a restored doc list and inverted index.
+
+    The owner holds the initial reference. Queries take an extra reference
+    with `acquire()` for their duration, so an index which has been swapped
+    out by `retire()` stays usable until the last in-flight query releases
+    it, and only then its resources are closed.
+    """
+
+    def __init__(self, doc_list, inverted_index):
+        self.doc_list = doc_list
+        self.inverted_index = inverted_index
+        self.ref_count = 1
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def acquire(self):
+        with self.lock:
+            if self.ref_count <= 0:
+                raise ValueError("IndexReader is already closed")
+            self.ref_count += 1
+        return self
+
+    def release(self):
+        with self.lock:
+            self.ref_count -= 1
+            closing = self.ref_count == 0
+        if closing:
+            self.close()
+
+    def retire(self):
+        """Drop the owner's reference. The reader closes once all queries release it."""
+        self.release()
+
+    def close(self):
+        self.doc_list.close()
+        self.inverted_index.close()
+
+    @property
+    def closed(self):
+        return self.ref_count <= 0
+
+    def search_ids(self, query):
+        query_tokens = normalized_tokens(query)
+        if len(query_tokens) == 1:
+            return self.inverted_index.get(query_tokens[0])
+        return self.inverted_index.search_and(query_tokens)
+
+    def search(self, query):
+        return [self.doc_list.get(doc_id) for doc_id in self.search_ids(query)]
+
+    def top_k(self, query, k):
+        return [self.doc_list.get(doc_id) for doc_id in islice(self.iter_search_ids(query), k)]
+
+    def iter_search_ids(self, query):
+        return self.inverted_index.iter_and(normalized_tokens(query))
+
+    def iter_search(self, query):
+        """Yield the docs of search(query) as they are found."""
+        for doc_id in self.iter_search_ids(query):
+            yield self.doc_list.get(doc_id)
+
+    def search_after(self, query, last_doc_id=-1, n=10):
+        """
+        Return the next page of n docs of search(query) after the doc id
+        last_doc_id, -1 for the first page, and the doc id to pass for the
+        page after it, or None if this page is empty.
+        """
+        doc_ids = self.inverted_index.search_after(normalized_tokens(query), last_doc_id, n)
+        return [self.doc_list.get(doc_id) for doc_id in doc_ids], (doc_ids[-1] if doc_ids else None)
+
+    def explain(self, query):
+        """
+        Run query as search() does and return how it was evaluated.
+
+        Returns a dict with the normalized tokens, the df and list type of
+        each term, the evaluation order, the algorithm, the number of
+        results, the time of each phase in seconds and the iterator counters.
+        """
+        return self.explain_query(query)[1]
+
+    def explain_query(self, query, count=False, k=None, collect_stats=True):
+        """
+        Run query as search() does, or as top_k(query, k) if k is given, or as
+        count() if count is set, and return its result with the explanation.
+        """
+        start = time.perf_counter()
+        query_tokens = normalized_tokens(query)
+        tokenize_time = time.perf_counter() - start
+        result, plan = self.inverted_index.explain_and(query_tokens, count=count, collect_stats=collect_stats)
+        timings = {'tokenize': tokenize_time}
+        timings.update(plan['timings'])
+        explanation = {'query': query, 'tokens': query_tokens}
+        explanation.update(plan)
+        if count:
+            explanation['result_count'] = result
+        else:
+            explanation['result_count'] = len(result)
+            start = time.perf_counter()
+            result = [self.doc_list.get(doc_id) for doc_id in (result if k is None else result[:k])]
+            timings['materialize'] = time.perf_counter() - start
+        explanation['timings'] = timings
+        return result, explanation
+
+    def trace_query(self, command, query, k=None, collect_stats=False):
+        """
+        Run query as command ('search', 'top_k' or 'count') does and return
+        its result with a QueryTrace of its tokens, algorithm, number of
+        results, the time of each phase in seconds and, if collect_stats is
+        set, the iterator counters. top_k counts the first k results only.
+        """
+        trace = QueryTrace(collect_stats)
+        trace.tokens = query_tokens = normalized_tokens(query)
+        trace.mark('tokenize')
+        if len(query_tokens) == 1:
+            phase = 'lookup' if command == 'count' else 'decode'
+        else:
+            phase = 'intersect'
+        with self.inverted_index.tracing(trace):
+            if command == 'count':
+                result = self.inverted_index.count_and(query_tokens)
+            elif command == 'top_k':
+                result = list(islice(self.inverted_index.iter_and(query_tokens), k))
+            elif len(query_tokens) == 1:
+                result = self.inverted_index.get(query_tokens[0])
+            else:
+                result = self.inverted_index.search_and(query_tokens)
+        trace.mark(phase)
+        if trace.algorithm is None:
+            trace.algorithm = 'df' if command == 'count' else 'decode'
+        if command == 'count':
+            trace.result_count = result
+        else:
+            trace.result_count = len(result)
+            result = [self.doc_list.get(doc_id) for doc_id in result]
+            trace.mark('materialize')
+        return result, trace
+
+    def search_ids_batch(self, queries):
+        return self.inverted_index.search_and_batch([normalized_tokens(query) for query in queries])
+
+    def search_batch(self, queries):
+        return [[self.doc_list.get(doc_id) for doc_id in doc_ids] for doc_ids in self.search_ids_batch(queries)]
+
+    def count_batch(self, queries):
+        return self.inverted_index.search_and_batch([normalized_tokens(query) for query in queries], count=True)
+
+    def count(self, query):
+        query_tokens = normalized_tokens(query)
+        return self.inverted_index.count_and(query_tokens)
+
+    def search_phrase(self, query):
+        doc_ids = self.inverted_index.search_phrase(normalized_tokens(query))
+        return [self.doc_list.get(doc_id) for doc_id in doc_ids]
+
+    def count_phrase(self, query):
+        return self.inverted_index.count_phrase(normalized_tokens(query))
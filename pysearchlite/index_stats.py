@@ -0,0 +1,182 @@
+import os
+import sys
+
+from .block_skip_list import (
+    BlockSkipListExt,
+    FlatSkipListExt,
+    LIST_TYPE_BITMAP,
+    LIST_TYPE_DOC_ID,
+    LIST_TYPE_DOC_IDS_LIST,
+    LIST_TYPE_FLAT_SKIP_LIST,
+    LIST_TYPE_NAMES,
+    LIST_TYPE_ROARING,
+    LIST_TYPE_SKIP_LIST,
+    RoaringListExt,
+)
+from .gamma_codecs import BITMAP_LEN_BYTES, DOCID_LEN_BYTES, SKIP_LIST_BLOCK_INDEX_BYTES, TOKEN_LEN_BYTES, bytes_docid
+from .metrics import percentile, posting_bucket
+
+BYTE_FIELDS = ('dictionary_bytes', 'payload_bytes', 'skip_bytes', 'padding_bytes')
+# the object sizes of a restored term: the (freq, list_type, mem) tuple, and
+# the posting list as a bytes copy or as a memoryview of the mapped file.
+TUPLE_SIZE = sys.getsizeof((0, 0, None))
+BYTES_SIZE = sys.getsizeof(b'')
+MEMORYVIEW_SIZE = sys.getsizeof(memoryview(b''))
+
+
+def docid_widths(mem, pos, end, widths):
+    while pos < end:
+        n = bytes_docid(mem, pos)
+        widths[n] += 1
+        pos += n
+
+
+def skip_list_bytes(mem, freq, widths, level_blocks):
+    """
+    Return the payload, skip and padding bytes of a skip list.
+
+    The payload is the doc ids of level 0. The skip bytes are the list
+    header, the header of each block and the entries of the upper levels.
+    """
+    skip_list = BlockSkipListExt(mem, freq)
+    block_size = skip_list.block_size
+    payload = 0
+    skip = skip_list.offset
+    padding = 0
+    for level, block_idx in enumerate(skip_list.level_block_idx):
+        while True:
+            block_offset = skip_list.offset + block_size * block_idx
+            pos = block_offset + SKIP_LIST_BLOCK_INDEX_BYTES + 1
+            length = mem[block_offset + SKIP_LIST_BLOCK_INDEX_BYTES]
+            if level == 0:
+                payload += length
+                docid_widths(mem, pos, pos + length, widths)
+            else:
+                skip += length
+            skip += SKIP_LIST_BLOCK_INDEX_BYTES + 1
+            padding += block_size - SKIP_LIST_BLOCK_INDEX_BYTES - 1 - length
+            level_blocks[level] = level_blocks.get(level, 0) + 1
+            block_idx = int.from_bytes(mem[block_offset:block_offset + SKIP_LIST_BLOCK_INDEX_BYTES], sys.byteorder)
+            if block_idx == 0:
+                break
+    return payload, skip, padding
+
+
+def index_stats(inverted_index):
+    """
+    Scan the restored terms of an InvertedIndexBlockSkipList and return
+    where the bytes of its index file go.
+
+    Returns a dict with:
+
+    file_bytes: the size of the index file
+    terms, postings: the number of terms and of doc ids in their lists
+    df: the percentiles of the posting list lengths and the number of terms
+        by the decade of their length
+    list_types: for each list type, the number of terms and postings and its
+        bytes, split into the term dictionary (token, type and length),
+        the doc id payload, the skip list overhead and the block padding
+    docid_widths: the number of doc ids by the bytes of their varint, for
+        the lists which are varint coded
+    skip_levels: the number of skip list blocks on each level
+    memory: the estimated size in bytes of the term dictionary after
+        restore(), with bytes copies and with views of the mapped file
+    """
+    list_types = {name: {'terms': 0, 'postings': 0, **{field: 0 for field in BYTE_FIELDS}}
+                  for name in LIST_TYPE_NAMES.values()}
+    widths = {n: 0 for n in range(1, 6)}
+    level_blocks = {}
+    dfs = []
+    memory_copy = memory_mmap = sys.getsizeof(inverted_index.data)
+    for token, (freq, list_type, mem) in inverted_index.data.items():
+        dfs.append(freq)
+        stats = list_types[LIST_TYPE_NAMES[list_type]]
+        stats['terms'] += 1
+        stats['postings'] += freq
+        dictionary = TOKEN_LEN_BYTES + len(token.encode('utf-8')) + 1
+        if list_type == LIST_TYPE_DOC_ID:
+            payload, skip, padding = len(mem), 0, 0
+            docid_widths(mem, 0, len(mem), widths)
+        elif list_type == LIST_TYPE_DOC_IDS_LIST:
+            dictionary += DOCID_LEN_BYTES
+            payload, skip, padding = len(mem), 0, 0
+            docid_widths(mem, 0, len(mem), widths)
+        elif list_type == LIST_TYPE_SKIP_LIST:
+            dictionary += DOCID_LEN_BYTES
+            payload, skip, padding = skip_list_bytes(mem, freq, widths, level_blocks)
+        elif list_type == LIST_TYPE_FLAT_SKIP_LIST:
+            dictionary += DOCID_LEN_BYTES
+            # the block heads and offsets are the skip overhead
+            skip = FlatSkipListExt(mem, freq).offsets[0]
+            payload, padding = len(mem) - skip, 0
+            docid_widths(mem, skip, len(mem), widths)
+        elif list_type == LIST_TYPE_ROARING:
+            dictionary += DOCID_LEN_BYTES
+            # the container offsets, keys and types are the skip overhead
+            skip = RoaringListExt(mem, freq).offsets[0]
+            payload, padding = len(mem) - skip, 0
+        elif list_type == LIST_TYPE_BITMAP:
+            dictionary += DOCID_LEN_BYTES
+            payload, skip, padding = len(mem) - BITMAP_LEN_BYTES, BITMAP_LEN_BYTES, 0
+        for field, value in zip(BYTE_FIELDS, (dictionary, payload, skip, padding)):
+            stats[field] += value
+        # small ints are shared, larger ones are allocated per term
+        term = sys.getsizeof(token) + TUPLE_SIZE + (sys.getsizeof(freq) if freq > 256 else 0)
+        memory_copy += term + BYTES_SIZE + len(mem)
+        memory_mmap += term + MEMORYVIEW_SIZE
+    for stats in list_types.values():
+        stats['total_bytes'] = sum(stats[field] for field in BYTE_FIELDS)
+
+    dfs.sort()
+    buckets = {}
+    for freq in dfs:
+        bucket = posting_bucket(freq)
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+    file_bytes = os.path.getsize(inverted_index.get_inverted_index_filename())
+    return {
+        'file_bytes': file_bytes,
+        'terms': len(dfs),
+        'postings': sum(dfs),
+        'df': {
+            'p50': percentile(dfs, 50),
+            'p90': percentile(dfs, 90),
+            'p99': percentile(dfs, 99),
+            'max': dfs[-1] if dfs else None,
+            'buckets': buckets,
+        },
+        'list_types': list_types,
+        'docid_widths': widths,
+        'skip_levels': dict(sorted(level_blocks.items())),
+        'memory': {
+            'copy_bytes': memory_copy,
+            'mmap_bytes': memory_mmap,
+            'mapped_file_bytes': file_bytes,
+        },
+    }
+
+
+def format_index_stats(stats):
+    lines = [
+        f"index file: {stats['file_bytes']:,} bytes",
+        f"terms: {stats['terms']:,}  postings: {stats['postings']:,}",
+        "df: " + '  '.join(f"{p}={stats['df'][p]}" for p in ('p50', 'p90', 'p99', 'max')),
+    ]
+    for bucket, count in stats['df']['buckets'].items():
+        lines.append(f"  df {bucket:<16} {count:>12,} terms")
+    lines.append(f"{'list type':<28}{'terms':>12}{'postings':>14}" + ''.join(
+        f"{field[:-6]:>14}" for field in BYTE_FIELDS + ('total_bytes',)))
+    for name, s in stats['list_types'].items():
+        lines.append(f"{name:<28}{s['terms']:>12,}{s['postings']:>14,}" + ''.join(
+            f"{s[field]:>14,}" for field in BYTE_FIELDS + ('total_bytes',)))
+    total_ids = sum(stats['docid_widths'].values()) or 1
+    lines.append("doc id varint widths:")
+    for width, count in stats['docid_widths'].items():
+        lines.append(f"  {width} byte{'s' if width > 1 else ' '} {count:>14,} ({count / total_ids:.1%})")
+    if stats['skip_levels']:
+        lines.append("skip list blocks by level: " + '  '.join(
+            f"{level}={count:,}" for level, count in stats['skip_levels'].items()))
+    memory = stats['memory']
+    lines.append(f"estimated memory after restore(): {memory['copy_bytes']:,} bytes, "
+                 f"or {memory['mmap_bytes']:,} bytes with use_mmap "
+                 f"plus {memory['mapped_file_bytes']:,} bytes of shared page cache")
+    return '\n'.join(lines)
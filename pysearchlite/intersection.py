@@ -0,0 +1,334 @@
+import json
+import os
+from bisect import bisect_left
+
+from .block_skip_list import END_DOC_ID
+from .metrics import posting_bucket
+
+# calibration file written by pysearchlite.commands.tune_intersection
+INTERSECTION_COSTS = os.environ.get('PYSEARCHLITE_INTERSECTION_COSTS')
+# the length of the ranges double_binary_search scans with one binary search per doc id
+DBS_SCAN = 8
+# the algorithm of the queries whose bucket was not calibrated
+DEFAULT_INTERSECTION = os.environ.get('PYSEARCHLITE_INTERSECTION', 'svs')
+
+
+def leapfrog(doc_lists, stats=None, count=False):
+    """
+    Intersect the lists with their iterators: find a doc id common to the
+    first two lists, then check it against the others.
+
+    Parameters
+    ----------
+    doc_lists: list
+        the posting lists, shortest first
+    stats: QueryStats, optional
+    count: bool, default False
+        return the number of common doc ids instead of the doc ids
+
+    Returns
+    -------
+    result: list[int] or int
+    """
+    result = []
+    n = 0
+    iters = [doc_list.get_iter(stats) for doc_list in doc_lists]
+
+    a_iter = iters[0]
+    b_iter = iters[1]
+    iters2 = iters[2:]
+    doc_id = a_iter.doc_id
+    while True:
+        # find a common doc id in the first and second list.
+        doc_b = b_iter.search(doc_id)
+        if doc_b != doc_id:
+            if doc_b == END_DOC_ID:
+                break
+            doc_id = a_iter.search(doc_b)
+            if doc_id == END_DOC_ID:
+                break
+            continue
+
+        if stats is not None:
+            stats.candidates += 1
+        # check the common doc id against the remains.
+        for it in iters2:
+            doc_it = it.search(doc_id)
+            if doc_it != doc_id:
+                doc_id = END_DOC_ID if doc_it == END_DOC_ID else a_iter.search(doc_it)
+                break
+        else:
+            if stats is not None:
+                stats.matches += 1
+            if count:
+                n += 1
+            else:
+                result.append(doc_id)
+            doc_id = a_iter.next_doc()
+        if doc_id == END_DOC_ID:
+            break
+    return n if count else result
+
+
+def iter_leapfrog(doc_lists, start=0, stats=None):
+    """
+    Yield the doc ids common to the lists from start on, in order, searching
+    their iterators only as far as the doc ids consumed so far.
+
+    Parameters
+    ----------
+    doc_lists: list
+        the posting lists, shortest first, or a single list
+    start: int, default 0
+        the least doc id to yield
+    stats: QueryStats, optional
+    """
+    iters = [doc_list.get_iter(stats) for doc_list in doc_lists]
+    a_iter = iters[0]
+    others = iters[1:]
+    doc_id = a_iter.search(start)
+    while doc_id != END_DOC_ID:
+        for it in others:
+            doc_it = it.search(doc_id)
+            if doc_it != doc_id:
+                doc_id = END_DOC_ID if doc_it == END_DOC_ID else a_iter.search(doc_it)
+                break
+        else:
+            if stats is not None:
+                stats.matches += 1
+            yield doc_id
+            doc_id = a_iter.next_doc()
+
+
+def svs(doc_lists, stats=None, count=False):
+    """
+    Intersect the lists set by set: decode the shortest list, and keep the
+    doc ids found by the iterator of each longer list in turn.
+    """
+    candidates = doc_lists[0].decode_ids()
+    for i, doc_list in enumerate(doc_lists[1:]):
+        it = doc_list.get_iter(stats)
+        search = it.search
+        result = []
+        for doc_id in candidates:
+            found = search(doc_id)
+            if found == doc_id:
+                result.append(doc_id)
+            elif found == END_DOC_ID:
+                break
+        candidates = result
+        if i == 0 and stats is not None:
+            stats.candidates += len(candidates)
+        if not candidates:
+            break
+    if stats is not None:
+        stats.matches += len(candidates)
+    return len(candidates) if count else candidates
+
+
+def gallop(ids, target, lo):
+    """Return the index of the first doc id of ids from lo which is not less than target."""
+    n = len(ids)
+    step = 1
+    hi = lo
+    while hi < n and ids[hi] < target:
+        lo = hi + 1
+        hi += step
+        step <<= 1
+    return bisect_left(ids, target, lo, min(hi, n))
+
+
+def galloping(doc_lists, stats=None, count=False):
+    """
+    Intersect the decoded lists set by set, finding each doc id of the
+    shorter list by an exponential search from the previous position.
+    """
+    candidates = doc_lists[0].decode_ids()
+    for i, doc_list in enumerate(doc_lists[1:]):
+        ids = doc_list.decode_ids()
+        n = len(ids)
+        result = []
+        pos = 0
+        for doc_id in candidates:
+            start = pos
+            pos = gallop(ids, doc_id, pos)
+            if stats is not None:
+                stats.compares += 2 * (pos - start + 1).bit_length()
+            if pos == n:
+                break
+            if ids[pos] == doc_id:
+                result.append(doc_id)
+        candidates = result
+        if stats is not None:
+            stats.blocks += 1
+            if i == 0:
+                stats.candidates += len(candidates)
+        if not candidates:
+            break
+    if stats is not None:
+        stats.matches += len(candidates)
+    return len(candidates) if count else candidates
+
+
+def double_binary_search(a, b, result, stats=None):
+    """
+    Append the doc ids common to the sorted sequences a and b to result, by
+    Baeza-Yates' double binary search: the median of the shorter range is
+    searched in the longer one, which splits both ranges in two.
+
+    The ranges left to intersect are kept on an explicit stack instead of
+    recursing, so that long lists have no recursion limit, and the doc ids
+    are only indexed, so that a and b can be lists, array('I') or
+    memoryview.cast('I') views without copies.
+    """
+    # (left_a, right_a, left_b, right_b) of the ranges right of a median,
+    # or (doc_id, -1, 0, 0) to append doc_id once the ranges left of it are done
+    stack = [(0, len(a), 0, len(b))]
+    push = stack.append
+    pop = stack.pop
+    append = result.append
+    while stack:
+        left_a, right_a, left_b, right_b = pop()
+        if right_a < 0:
+            append(left_a)
+            continue
+        # go on with the left ranges, pushing the right ones
+        while left_a < right_a and left_b < right_b:
+            if right_a - left_a <= DBS_SCAN or right_b - left_b <= DBS_SCAN:
+                # the ranges before are done, so the doc ids of a short range
+                # are searched one by one and appended in order
+                if right_a - left_a > right_b - left_b:
+                    a, left_a, right_a, b, left_b, right_b = b, left_b, right_b, a, left_a, right_a
+                    swapped = True
+                else:
+                    swapped = False
+                for i in range(left_a, right_a):
+                    doc_id = a[i]
+                    left_b = bisect_left(b, doc_id, left_b, right_b)
+                    if stats is not None:
+                        stats.compares += (right_b - left_b).bit_length()
+                    if left_b == right_b:
+                        break
+                    if b[left_b] == doc_id:
+                        append(doc_id)
+                if swapped:
+                    a, b = b, a
+                break
+            if right_a - left_a <= right_b - left_b:
+                ma = (left_a + right_a) >> 1
+                doc_id = a[ma]
+                mb = bisect_left(b, doc_id, left_b, right_b)
+                if stats is not None:
+                    stats.compares += (right_b - left_b).bit_length()
+                if mb < right_b and b[mb] == doc_id:
+                    if ma + 1 < right_a and mb + 1 < right_b:
+                        push((ma + 1, right_a, mb + 1, right_b))
+                    push((doc_id, -1, 0, 0))
+                elif ma + 1 < right_a and mb < right_b:
+                    push((ma + 1, right_a, mb, right_b))
+            else:
+                mb = (left_b + right_b) >> 1
+                doc_id = b[mb]
+                ma = bisect_left(a, doc_id, left_a, right_a)
+                if stats is not None:
+                    stats.compares += (right_a - left_a).bit_length()
+                if ma < right_a and a[ma] == doc_id:
+                    if ma + 1 < right_a and mb + 1 < right_b:
+                        push((ma + 1, right_a, mb + 1, right_b))
+                    push((doc_id, -1, 0, 0))
+                elif ma < right_a and mb + 1 < right_b:
+                    push((ma, right_a, mb + 1, right_b))
+            right_a = ma
+            right_b = mb
+
+
+def dbs(doc_lists, stats=None, count=False):
+    """Intersect the decoded lists pairwise by double binary search, shortest first."""
+    candidates = doc_lists[0].decode_ids()
+    for i, doc_list in enumerate(doc_lists[1:]):
+        ids = doc_list.decode_ids()
+        result = []
+        double_binary_search(candidates, ids, result, stats)
+        candidates = result
+        if stats is not None:
+            stats.blocks += 1
+            if i == 0:
+                stats.candidates += len(candidates)
+        if not candidates:
+            break
+    if stats is not None:
+        stats.matches += len(candidates)
+    return len(candidates) if count else candidates
+
+
+INTERSECTIONS = {
+    'leapfrog': leapfrog,
+    'svs': svs,
+    'galloping': galloping,
+    'dbs': dbs,
+}
+
+
+def intersection_bucket(freqs):
+    """
+    Return the bucket of a query by the df of its shortest list and the
+    ratio of the df of the second shortest to it, e.g. '100-999/10-99'.
+    """
+    return f"{posting_bucket(freqs[0])}/{posting_bucket(freqs[1] // freqs[0])}"
+
+
+class IntersectionCostModel(object):
+    """
+    Choose the intersection algorithm of each query.
+
+    The cost model holds, for each bucket of queries by the df of the
+    shortest list and the ratio of the second shortest to it, the measured
+    cost of each algorithm, and a query is intersected with the cheapest
+    algorithm of its bucket. Buckets which were not calibrated use the
+    default algorithm.
+
+    Parameters
+    ----------
+    costs: dict, optional
+        {bucket: {algorithm: seconds per query}}
+    default: str, default DEFAULT_INTERSECTION
+    """
+
+    def __init__(self, costs=None, default=DEFAULT_INTERSECTION):
+        self.costs = costs or {}
+        self.default = default
+        self.best = {bucket: min(algorithms, key=algorithms.get)
+                     for bucket, algorithms in self.costs.items() if algorithms}
+
+    def choose(self, freqs):
+        """Return the name of the algorithm for lists of freqs doc ids, shortest first."""
+        return self.best.get(intersection_bucket(freqs), self.default)
+
+    def to_json(self):
+        return {
+            'default': self.default,
+            'buckets': {
+                bucket: dict(sorted(algorithms.items(), key=lambda a: a[1]))
+                for bucket, algorithms in self.costs.items()
+            },
+        }
+
+    @staticmethod
+    def from_json(obj):
+        return IntersectionCostModel(obj.get('buckets'), obj.get('default', DEFAULT_INTERSECTION))
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    @staticmethod
+    def load(filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            return IntersectionCostModel.from_json(json.load(f))
+
+    @staticmethod
+    def from_env():
+        """Return the model of PYSEARCHLITE_INTERSECTION_COSTS, or the default one if it is not set."""
+        if INTERSECTION_COSTS:
+            return IntersectionCostModel.load(INTERSECTION_COSTS)
+        return IntersectionCostModel()
@@ -1,6 +1,10 @@
 import abc
 import os
 import tempfile
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from itertools import islice
 
 INVERTED_INDEX_FILENAME = "inverted_index"
 
@@ -21,6 +25,9 @@ class InvertedIndex(abc.ABC):
     def get(self, token):
         pass
 
+    def get_freq(self, token):
+        return len(self.get(token))
+
     @abc.abstractmethod
     def search_and(self, tokens):
         pass
@@ -29,6 +36,55 @@ class InvertedIndex(abc.ABC):
     def count_and(self, tokens):
         pass
 
+    def iter_and(self, tokens, start=0):
+        """
+        Yield the doc ids of search_and(tokens), or of get for a single
+        token, from start on, in order.
+
+        This evaluates the whole query first. Implementations which can find
+        the doc ids one by one override it.
+        """
+        doc_ids = self.get(tokens[0]) if len(tokens) == 1 else self.search_and(tokens)
+        if start > 0:
+            doc_ids = doc_ids[bisect_left(doc_ids, start):]
+        return iter(doc_ids)
+
+    def search_after(self, tokens, last_doc_id, n):
+        """Return the first n doc ids of the query greater than last_doc_id, -1 for the first page."""
+        return list(islice(self.iter_and(tokens, last_doc_id + 1), n))
+
+    def explain_and(self, tokens, count=False, collect_stats=True):
+        """
+        Evaluate search_and(tokens), or count_and(tokens) if count is set,
+        and return its result with a plan of how it was evaluated.
+        """
+        start = time.perf_counter()
+        if count:
+            result = self.count_and(tokens)
+        else:
+            result = self.get(tokens[0]) if len(tokens) == 1 else self.search_and(tokens)
+        plan = {
+            'terms': self.explain_terms(tokens),
+            'order': list(tokens),
+            'algorithm': type(self).__name__,
+            'timings': {'count' if count else 'search': time.perf_counter() - start},
+            'stats': None,
+        }
+        return result, plan
+
+    def explain_terms(self, tokens):
+        """Return the token, df and list type of each of tokens, as in the plan of explain_and."""
+        return [{'token': t, 'df': self.get_freq(t), 'list_type': None} for t in tokens]
+
+    @contextmanager
+    def tracing(self, trace):
+        """
+        Record the queries of this thread in trace, a QueryTrace, while in
+        the block. This index only names itself as the algorithm.
+        """
+        trace.algorithm = type(self).__name__
+        yield trace
+
     @abc.abstractmethod
     def save(self):
         pass
@@ -41,5 +97,8 @@ class InvertedIndex(abc.ABC):
     def clear(self):
         pass
 
+    def close(self):
+        self.clear()
+
     def get_inverted_index_filename(self):
         return os.path.join(self.idx_dir, INVERTED_INDEX_FILENAME)
@@ -1,51 +1,159 @@
+import io
+import json
+import logging
 import mmap
 import os
 import shutil
 import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from contextlib import contextmanager
 from operator import itemgetter
 
 
 from .block_skip_list import (
+    ArrayListExt,
+    BITMAP_DENSITY,
+    BITMAP_MIN_DF,
+    BitmapList,
+    BitmapListExt,
     BlockSkipList,
     BlockSkipListExt,
     DocIdListExt,
+    FLAT_BLOCK_IDS,
+    FlatSkipList,
+    FlatSkipListExt,
+    LIST_TYPE_BITMAP,
     LIST_TYPE_DOC_ID,
     LIST_TYPE_DOC_IDS_LIST,
+    LIST_TYPE_FLAT_SKIP_LIST,
+    LIST_TYPE_NAMES,
+    LIST_TYPE_ROARING,
     LIST_TYPE_SKIP_LIST,
+    ROARING_MIN_DF,
+    RoaringList,
+    RoaringListExt,
+    SKIPLIST_FORMAT,
+    bitmap_ids,
+    popcount,
+    roaring_and,
+    roaring_count,
+    roaring_ids,
 )
 from .gamma_codecs import (
+    BITMAP_LEN_BYTES,
+    BLOCK_TYPE_BITMAP,
     BLOCK_TYPE_DOC_ID,
     BLOCK_TYPE_DOC_IDS_LIST,
+    BLOCK_TYPE_FLAT_SKIP_LIST,
+    BLOCK_TYPE_ROARING,
     BLOCK_TYPE_SKIP_LIST,
     DOCID_LEN_BYTES,
+    FLAT_BLOCK_HEAD_BYTES,
+    FLAT_BLOCK_OFFSET_BYTES,
+    ROARING_OFFSET_BYTES,
     SKIP_LIST_BLOCK_INDEX_BYTES,
     copy_ids,
     decode_docid,
     merge_ids,
     read_doc_ids,
     read_token,
+    skip_ids,
     write_doc_ids,
     write_token,
 )
 from .gamma_codecs import bytes_docid
+from .cache import (
+    ENTRY_BYTES,
+    PARSED_LISTS_BYTES,
+    PAIR_CACHE_BYTES,
+    PAIR_CACHE_FILENAME,
+    POSTINGS_CACHE_BYTES,
+    RESULT_CACHE_BYTES,
+    RESULT_CACHE_COUNTS,
+    LRUCache,
+    PairCache,
+    ResultCache,
+)
+from .intersection import INTERSECTIONS, IntersectionCostModel, iter_leapfrog
 from .inverted_index import InvertedIndex
+from .query_stats import QUERY_STATS, QueryStats
+from .skip_list_layout import SkipListLayout
 
 
 POS_SIZE = 10
 TOKEN_SIZE = 20
+# the adjacent token pairs with a token of at least this df are indexed as bigrams, 0 disables them
+BIGRAM_MIN_DF = int(os.environ.get('PYSEARCHLITE_BIGRAM_MIN_DF', '0'))
+BIGRAMS_FILENAME = "bigrams.json"
+# the lists of varint coded doc ids, which postings_cache holds decoded
+DECODED_LIST_TYPES = (LIST_TYPE_DOC_IDS_LIST, LIST_TYPE_SKIP_LIST, LIST_TYPE_FLAT_SKIP_LIST)
+# the itemsize of array('I')
+DECODED_ID_BYTES = array('I').itemsize
+# the estimated memory of a doc id decoded into a list, and of the header and
+# first blocks of a parsed list, see parsed_list_bytes
+PARSED_ID_BYTES = 36
+PARSED_HEADER_BYTES = 512
+
+
+def parsed_list_bytes(freq, list_type):
+    """Return the estimated memory of a parsed list, with its doc ids decoded for a DocIdListExt."""
+    if list_type == LIST_TYPE_DOC_IDS_LIST:
+        return freq * PARSED_ID_BYTES
+    return PARSED_HEADER_BYTES
 
 
 class InvertedIndexBlockSkipList(InvertedIndex):
 
-    def __init__(self, idx_dir, mem_limit=1000_000_000):
+    def __init__(self, idx_dir, mem_limit=1000_000_000, use_mmap=False):
         super().__init__(idx_dir)
         self.raw_data = {}
         self.data = {}
+        # the parsed posting lists of the terms queried recently
+        self.lists = LRUCache(PARSED_LISTS_BYTES)
         self.tmp_index_num = 0
         self.raw_data_size = 0
         self.mem_limit = mem_limit
+        # If use_mmap is set, restore() keeps the index file mapped and the
+        # posting lists are zero-copy views of it instead of bytes copies.
+        self.use_mmap = use_mmap
+        self.file = None
+        self.mmap = None
+        # If collect_stats is set, each query records QueryStats in last_stats,
+        # which is kept per thread so that concurrent queries keep their own,
+        # as is the QueryTrace set by tracing().
+        self.collect_stats = QUERY_STATS
+        self.thread_stats = threading.local()
+        # If build_metrics is set, spills, merges and the conversion report to it.
+        self.build_metrics = None
+        # the layout of the skip lists written by save(), see SkipListLayout.from_env
+        self.layout = None
+        # 'block' writes BlockSkipList, 'flat' writes FlatSkipList, 'roaring' writes RoaringList
+        self.skip_list_format = SKIPLIST_FORMAT
+        # the dense lists written as bitmaps, see BitmapList.is_dense
+        self.bitmap_density = BITMAP_DENSITY
+        self.bitmap_min_df = BITMAP_MIN_DF
+        # the choice of the intersection algorithm of each query
+        self.intersection_model = IntersectionCostModel.from_env()
+        # the intersections of frequent token pairs, see PairCache
+        self.pair_cache = PairCache() if PAIR_CACHE_BYTES > 0 else None
+        # the decoded doc ids of hot terms, see get_decoded
+        self.postings_cache = LRUCache(POSTINGS_CACHE_BYTES) if POSTINGS_CACHE_BYTES > 0 else None
+        # the results of conjunctions, see ResultCache
+        self.result_cache = ResultCache() if RESULT_CACHE_BYTES > 0 else None
+        # If cache_counts is set, count_and also puts its results into result_cache.
+        self.cache_counts = RESULT_CACHE_COUNTS
+        # the bigrams save() writes, see search_phrase
+        self.bigram_min_df = BIGRAM_MIN_DF
+        # the bigram_min_df of the restored index, None if it has no bigrams
+        self.indexed_bigram_min_df = None
 
     def add(self, idx, tokens):
+        if self.bigram_min_df > 0:
+            # the bigrams of terms with a low df are dropped by convert_to_skip_list
+            tokens = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
         for token in set(tokens):
             if token in self.raw_data:
                 self.raw_data[token].append(idx)
@@ -60,12 +168,16 @@ class InvertedIndexBlockSkipList(InvertedIndex):
         return os.path.join(self.tmp_dir.name, f"{i}")
 
     def save_raw_data(self):
+        start = time.perf_counter()
         # [len(token)] [token] [len(ids)] [ids]
         with open(self.tmp_index_name(self.tmp_index_num), 'wb') as f:
             for token in sorted(self.raw_data.keys()):  # TODO this consumes a lot of memory
                 write_token(f, token)
                 doc_ids = self.raw_data[token]
                 write_doc_ids(f, doc_ids)
+            nbytes = f.tell()
+        if self.build_metrics is not None:
+            self.build_metrics.spill(time.perf_counter() - start, len(self.raw_data), nbytes)
         self.raw_data = {}
         self.raw_data_size = 0
         self.tmp_index_num += 1
@@ -109,27 +221,57 @@ class InvertedIndexBlockSkipList(InvertedIndex):
         return merged_index_name
 
     def convert_to_skip_list(self, idx):
+        layout = self.layout if self.layout is not None else SkipListLayout.from_env()
+        frequent = self.frequent_terms(idx) if self.bigram_min_df > 0 else None
         with open(idx, 'rb') as f:
             new_index_name = self.tmp_index_name(self.tmp_index_num)
             self.tmp_index_num += 1
             with open(new_index_name, 'wb') as out:
                 token = read_token(f)
                 while token:
+                    if frequent is not None and ' ' in token:
+                        a, b = token.split(' ')
+                        if a not in frequent and b not in frequent:
+                            skip_ids(f)
+                            token = read_token(f)
+                            continue
                     write_token(out, token)
-                    doc_ids = read_doc_ids(f)
-                    skip_list = BlockSkipList.from_list(doc_ids)
-                    skip_list.write(out)
+                    self.encode_list(read_doc_ids(f), layout).write(out)
                     token = read_token(f)
         os.remove(idx)
         return new_index_name
 
+    def frequent_terms(self, idx):
+        """Return the terms of the merged index file idx with at least bigram_min_df doc ids."""
+        terms = set()
+        with open(idx, 'rb') as f:
+            token = read_token(f)
+            while token:
+                freq = skip_ids(f)
+                if freq >= self.bigram_min_df and ' ' not in token:
+                    terms.add(token)
+                token = read_token(f)
+        return terms
+
+    def encode_list(self, doc_ids, layout):
+        """Return the posting list of doc_ids in the format save() writes."""
+        if BitmapList.is_dense(doc_ids, self.bitmap_density, self.bitmap_min_df):
+            return BitmapList.from_list(doc_ids)
+        elif self.skip_list_format == 'flat':
+            return FlatSkipList.from_list(doc_ids, FLAT_BLOCK_IDS)
+        elif self.skip_list_format == 'roaring':
+            return RoaringList.from_list(doc_ids, ROARING_MIN_DF)
+        return BlockSkipList.from_list(doc_ids, *layout.get(len(doc_ids)))
+
     def save(self):
+        metrics = self.build_metrics
         if self.raw_data_size > 0:
             self.save_raw_data()
         tmp_index_f = []
         for i in range(self.tmp_index_num):
             tmp_index_f.append(self.tmp_index_name(i))
         while len(tmp_index_f) > 1:
+            start = time.perf_counter()
             merged_index_f = []
             for i in range(0, len(tmp_index_f), 2):
                 xs = tmp_index_f[i:i + 2]
@@ -137,50 +279,124 @@ class InvertedIndexBlockSkipList(InvertedIndex):
                     merged_index_f.append(self.merge_index(*xs))
                 else:
                     merged_index_f.extend(xs)
+            if metrics is not None:
+                metrics.merge_round(len(tmp_index_f), time.perf_counter() - start,
+                                    sum(os.path.getsize(f) for f in merged_index_f))
             tmp_index_f = merged_index_f
         # add skip list to each doc id list
+        start = time.perf_counter()
         tmp_index_f = self.convert_to_skip_list(tmp_index_f[0])
+        if metrics is not None:
+            metrics.convert_to_skip_list(time.perf_counter() - start, os.path.getsize(tmp_index_f))
         # Copy the merged file into index
         shutil.copyfile(tmp_index_f, self.get_inverted_index_filename())
         os.remove(tmp_index_f)
+        if self.bigram_min_df > 0:
+            with open(self.get_bigrams_filename(), 'w', encoding='utf-8') as f:
+                json.dump({'min_df': self.bigram_min_df}, f)
+        elif os.path.exists(self.get_bigrams_filename()):
+            os.remove(self.get_bigrams_filename())
+        # the cached pairs are intersections of the previous index
+        if os.path.exists(self.get_pair_cache_filename()):
+            os.remove(self.get_pair_cache_filename())
+        if self.pair_cache is not None:
+            self.pair_cache.clear()
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        if self.postings_cache is not None:
+            self.postings_cache.clear()
 
     def restore(self):
         self.data = {}
-        with open(self.get_inverted_index_filename(), 'rb') as file:
-            with mmap.mmap(file.fileno(), length=0, access=mmap.ACCESS_READ) as mem:
-                token = read_token(mem)
-                while token:
-                    block_type = mem.read(1)
-                    if block_type == BLOCK_TYPE_DOC_ID:
-                        pos = mem.tell()
-                        docid = mem.read(bytes_docid(mem, pos))
-                        self.data[token] = (1, LIST_TYPE_DOC_ID, docid)
-                    elif block_type == BLOCK_TYPE_DOC_IDS_LIST:
-                        ids_len = int.from_bytes(mem.read(DOCID_LEN_BYTES), sys.byteorder)
-                        pos = mem.tell()
-                        end_pos = pos
-                        for _ in range(ids_len):
-                            end_pos += bytes_docid(mem, end_pos)
-                        docids = mem.read(end_pos - pos)
-                        self.data[token] = (ids_len, LIST_TYPE_DOC_IDS_LIST, docids)
-                    elif block_type == BLOCK_TYPE_SKIP_LIST:
-                        freq = int.from_bytes(mem.read(DOCID_LEN_BYTES), sys.byteorder)
-                        pos = mem.tell()
-                        block_size = int.from_bytes(mem.read(1), sys.byteorder)
-                        max_level = int.from_bytes(mem.read(1), sys.byteorder)
-                        mem.seek(SKIP_LIST_BLOCK_INDEX_BYTES * max_level, 1)
-                        blocks = int.from_bytes(mem.read(SKIP_LIST_BLOCK_INDEX_BYTES), sys.byteorder)
-                        mem.seek(blocks * block_size, 1)
-                        end_pos = mem.tell()
-                        mem.seek(pos)
-                        skip_list_mem = mem.read(end_pos - pos)
-                        self.data[token] = (freq, LIST_TYPE_SKIP_LIST, skip_list_mem)
-                    else:
-                        raise ValueError(f"Unsupported block type: {block_type}")
-                    token = read_token(mem)
+        self.lists.clear()
+        self.close_mmap()
+        if self.use_mmap:
+            self.file = open(self.get_inverted_index_filename(), 'rb')
+            self.mmap = mmap.mmap(self.file.fileno(), length=0, access=mmap.ACCESS_READ)
+            self.read_index(self.mmap, memoryview(self.mmap))
+        else:
+            with open(self.get_inverted_index_filename(), 'rb') as file:
+                with mmap.mmap(file.fileno(), length=0, access=mmap.ACCESS_READ) as mem:
+                    self.read_index(mem, None)
+        self.indexed_bigram_min_df = None
+        if os.path.exists(self.get_bigrams_filename()):
+            with open(self.get_bigrams_filename(), 'r', encoding='utf-8') as f:
+                self.indexed_bigram_min_df = json.load(f)['min_df']
+        if self.pair_cache is not None:
+            self.pair_cache.clear()
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        if self.postings_cache is not None:
+            self.postings_cache.clear()
+        if os.path.exists(self.get_pair_cache_filename()):
+            self.load_pair_cache(self.get_pair_cache_filename())
+
+    def read_index(self, mem, view, data=None):
+        """
+        Read the term dictionary from mem into data, self.data by default.
+
+        If view is given, posting lists are slices of view, otherwise copies.
+        """
+        if data is None:
+            data = self.data
+        token = read_token(mem)
+        while token:
+            block_type = mem.read(1)
+            if block_type == BLOCK_TYPE_DOC_ID:
+                freq = 1
+                list_type = LIST_TYPE_DOC_ID
+                pos = mem.tell()
+                end_pos = pos + bytes_docid(mem, pos)
+            elif block_type == BLOCK_TYPE_DOC_IDS_LIST:
+                freq = int.from_bytes(mem.read(DOCID_LEN_BYTES), sys.byteorder)
+                list_type = LIST_TYPE_DOC_IDS_LIST
+                pos = mem.tell()
+                end_pos = pos
+                for _ in range(freq):
+                    end_pos += bytes_docid(mem, end_pos)
+            elif block_type == BLOCK_TYPE_SKIP_LIST:
+                freq = int.from_bytes(mem.read(DOCID_LEN_BYTES), sys.byteorder)
+                list_type = LIST_TYPE_SKIP_LIST
+                pos = mem.tell()
+                block_size = int.from_bytes(mem.read(1), sys.byteorder)
+                max_level = int.from_bytes(mem.read(1), sys.byteorder)
+                mem.seek(SKIP_LIST_BLOCK_INDEX_BYTES * max_level, 1)
+                blocks = int.from_bytes(mem.read(SKIP_LIST_BLOCK_INDEX_BYTES), sys.byteorder)
+                end_pos = mem.tell() + blocks * block_size
+            elif block_type == BLOCK_TYPE_FLAT_SKIP_LIST:
+                freq = int.from_bytes(mem.read(DOCID_LEN_BYTES), sys.byteorder)
+                list_type = LIST_TYPE_FLAT_SKIP_LIST
+                pos = mem.tell()
+                blocks = int.from_bytes(mem.read(FLAT_BLOCK_OFFSET_BYTES), sys.byteorder)
+                # the last offset is the end of the blocks
+                mem.seek(blocks * (FLAT_BLOCK_HEAD_BYTES + FLAT_BLOCK_OFFSET_BYTES), 1)
+                end_pos = pos + int.from_bytes(mem.read(FLAT_BLOCK_OFFSET_BYTES), sys.byteorder)
+            elif block_type == BLOCK_TYPE_ROARING:
+                freq = int.from_bytes(mem.read(DOCID_LEN_BYTES), sys.byteorder)
+                list_type = LIST_TYPE_ROARING
+                pos = mem.tell()
+                containers = int.from_bytes(mem.read(ROARING_OFFSET_BYTES), sys.byteorder)
+                # the last offset is the end of the containers
+                mem.seek(containers * ROARING_OFFSET_BYTES, 1)
+                end_pos = pos + int.from_bytes(mem.read(ROARING_OFFSET_BYTES), sys.byteorder)
+            elif block_type == BLOCK_TYPE_BITMAP:
+                freq = int.from_bytes(mem.read(DOCID_LEN_BYTES), sys.byteorder)
+                list_type = LIST_TYPE_BITMAP
+                pos = mem.tell()
+                end_pos = pos + BITMAP_LEN_BYTES + int.from_bytes(mem.read(BITMAP_LEN_BYTES), sys.byteorder)
+            else:
+                raise ValueError(f"Unsupported block type: {block_type}")
+            if view is None:
+                data[token] = (freq, list_type, mem[pos:end_pos])
+            else:
+                data[token] = (freq, list_type, view[pos:end_pos])
+            mem.seek(end_pos)
+            token = read_token(mem)
 
     def get(self, token):
         freq, list_type, mem = self.data.get(token, (0, 0, None))
+        if self.postings_cache is not None and self.is_cacheable(freq, list_type):
+            return list(self.get_decoded(token))
         if freq == 0:
             return []
         elif freq == 1:
@@ -191,112 +407,537 @@ class InvertedIndexBlockSkipList(InvertedIndex):
         elif list_type == LIST_TYPE_SKIP_LIST:
             list_pos = BlockSkipListExt(mem, freq).get_ids()
             return [decode_docid(mem, pos) for pos in list_pos]
+        elif list_type == LIST_TYPE_FLAT_SKIP_LIST:
+            list_pos = FlatSkipListExt(mem, freq).get_ids()
+            return [decode_docid(mem, pos) for pos in list_pos]
+        elif list_type == LIST_TYPE_BITMAP:
+            return BitmapListExt(mem, freq).decode_ids()
+        elif list_type == LIST_TYPE_ROARING:
+            return RoaringListExt(mem, freq).decode_ids()
+
+    def get_freq(self, token):
+        freq, _, _ = self.data.get(token, (0, 0, None))
+        return freq
+
+    def get_list(self, token):
+        """
+        Return the parsed posting list of token, or None if it is not in the
+        index. The lists are kept in an LRUCache of PARSED_LISTS_BYTES, so
+        that the doc ids they decode do not pile up for every term queried.
+        """
+        doc_list = self.lists.get(token)
+        if doc_list is None:
+            freq, list_type, mem = self.data.get(token, (0, 0, None))
+            if freq == 0:
+                return None
+            doc_list = BlockSkipListExt.of(freq, list_type, mem)
+            self.lists.put(token, doc_list, parsed_list_bytes(freq, list_type))
+        return doc_list
+
+    def get_decoded(self, token):
+        """
+        Return the doc ids of token, a term of a list of DECODED_LIST_TYPES,
+        as an array('I') from postings_cache, decoded and put there on a miss.
+        The array is shared and must not be modified.
+        """
+        ids = self.postings_cache.get(token)
+        if ids is None:
+            ids = array('I', BlockSkipListExt.of(*self.data[token]).decode_ids())
+            self.postings_cache.put(token, ids, ids.itemsize * len(ids))
+        return ids
+
+    def is_cacheable(self, freq, list_type):
+        """Return whether postings_cache can hold the decoded list of freq doc ids of list_type."""
+        return (freq > 1 and list_type in DECODED_LIST_TYPES
+                and freq * DECODED_ID_BYTES + ENTRY_BYTES <= self.postings_cache.max_bytes)
+
+    def get_state_list(self, token):
+        """
+        Return the posting list of token for prepare_state, decoded by
+        get_decoded if postings_cache is set and can hold it. The lists
+        larger than the cache keep their skip lists.
+        """
+        if self.postings_cache is not None:
+            freq, list_type, _ = self.data.get(token, (0, 0, None))
+            if self.is_cacheable(freq, list_type):
+                return ArrayListExt(self.get_decoded(token))
+        return self.get_list(token)
+
+    def cache_stats(self):
+        """Return the stats of each cache which is set, e.g. their hit ratio and bytes."""
+        caches = {'lists': self.lists, 'postings': self.postings_cache, 'results': self.result_cache,
+                  'pairs': self.pair_cache}
+        return {name: cache.stats() for name, cache in caches.items() if cache is not None}
 
-    def prepare_state(self, tokens):
+    def prepare_state(self, tokens, cached=None):
+        """
+        Return the (freq, posting list) of tokens, shortest first, or [] if
+        their intersection is empty.
+
+        The lists of the largest subset of tokens whose result is in
+        result_cache, then of pairs of tokens whose intersection is in
+        pair_cache, are replaced by these. If cached is given, the subset is
+        set to its 'cached_result' and the pairs appended to its 'cached_pairs'.
+        """
+        if len(tokens) > 1 and (self.result_cache is not None or self.pair_cache is not None):
+            return self.prepare_cached_state(tokens, cached)
+        return self.prepare_lists(tokens)
+
+    def prepare_lists(self, tokens):
+        """Return the (freq, posting list) of tokens, shortest first, or [] if one is not in the index."""
         # confirm if all tokens are in index.
         state = []
         for t in tokens:
-            freq, list_type, mem = self.data.get(t, (0, 0, None))
-            if freq == 0:
+            doc_list = self.get_state_list(t)
+            if doc_list is None:
                 return []
-            doc_list = BlockSkipListExt.of(freq, list_type, mem)
-            state.append((freq, doc_list))
+            state.append((doc_list.freq, doc_list))
         state.sort(key=itemgetter(0))
         return state
 
+    def prepare_cached_state(self, tokens, cached=None):
+        tokens = list(dict.fromkeys(tokens))
+        state = []
+        if self.result_cache is not None:
+            subset, doc_list = self.result_cache.largest_subset(tokens)
+            if subset is not None:
+                if doc_list is None:
+                    return []
+                state.append((doc_list.freq, doc_list))
+                tokens = [t for t in tokens if t not in subset]
+                if cached is not None:
+                    cached['cached_result'] = sorted(subset)
+        if self.pair_cache is not None and len(tokens) > 1:
+            covered = set()
+            for pair, doc_list in self.pair_cache.cover(tokens):
+                if doc_list is None:
+                    return []
+                state.append((doc_list.freq, doc_list))
+                covered.update(pair)
+                if cached is not None:
+                    cached['cached_pairs'].append(' '.join(pair))
+            tokens = [t for t in tokens if t not in covered]
+        for t in tokens:
+            doc_list = self.get_state_list(t)
+            if doc_list is None:
+                return []
+            state.append((doc_list.freq, doc_list))
+        state.sort(key=itemgetter(0))
+        return state
+
+    def cache_result(self, tokens, doc_ids):
+        """Put the doc ids of the conjunction of tokens into result_cache, and return them."""
+        key = frozenset(tokens)
+        if len(key) > 1 and key not in self.result_cache:
+            if doc_ids:
+                self.result_cache.put(key, *self.compact_list(doc_ids))
+            else:
+                self.result_cache.put(key, None, 0)
+        return doc_ids
+
+    def compact_list(self, doc_ids):
+        """
+        Return doc_ids as a posting list held in memory, and its size: a
+        bitmap if it is smaller than an array of the doc ids.
+        """
+        if BitmapList.is_dense(doc_ids, 1 / 32, 2):
+            f = io.BytesIO()
+            BitmapList.from_list(doc_ids).write(f)
+            mem = f.getvalue()
+            return BlockSkipListExt.read(mem), len(mem)
+        ids = array('I', doc_ids)
+        return ArrayListExt(ids), ids.itemsize * len(ids)
+
+    def add_pairs(self, pairs):
+        """Intersect each pair of tokens, and put the result into pair_cache."""
+        layout = self.layout if self.layout is not None else SkipListLayout.from_env()
+        # the lists are intersected without the caches, which concurrent queries keep using
+        pair_cache = self.pair_cache
+        for a, b in pairs:
+            state = self.prepare_lists([a, b])
+            if not state:
+                continue
+            doc_ids = self.intersect(state)
+            if not doc_ids:
+                pair_cache.put((a, b), None, 0)
+                continue
+            f = io.BytesIO()
+            self.encode_list(doc_ids, layout).write(f)
+            mem = f.getvalue()
+            pair_cache.put((a, b), BlockSkipListExt.read(mem), len(mem))
+
+    def get_bigrams_filename(self):
+        return os.path.join(self.idx_dir, BIGRAMS_FILENAME)
+
+    def get_pair_cache_filename(self):
+        return os.path.join(self.idx_dir, PAIR_CACHE_FILENAME)
+
+    def save_pair_cache(self, filename=None):
+        """
+        Write pair_cache next to the index, in its format with the token pair
+        joined by a space as the token, the least recently used first.
+        An empty intersection is written as a list of no doc ids. Nothing is
+        written if pair_cache is not set.
+        """
+        if self.pair_cache is None:
+            return
+        layout = self.layout if self.layout is not None else SkipListLayout.from_env()
+        with open(filename or self.get_pair_cache_filename(), 'wb') as f:
+            for (a, b), doc_list in self.pair_cache.items():
+                write_token(f, f"{a} {b}")
+                if doc_list is None:
+                    f.write(BLOCK_TYPE_DOC_IDS_LIST)
+                    f.write((0).to_bytes(DOCID_LEN_BYTES, sys.byteorder))
+                    continue
+                self.encode_list(doc_list.decode_ids(), layout).write(f)
+
+    def load_pair_cache(self, filename=None):
+        """
+        Read the pairs written by save_pair_cache into pair_cache, which is
+        created as large as them if it is not set.
+        """
+        data = {}
+        with open(filename or self.get_pair_cache_filename(), 'rb') as file:
+            with mmap.mmap(file.fileno(), length=0, access=mmap.ACCESS_READ) as mem:
+                self.read_index(mem, None, data)
+        pair_cache = self.pair_cache if self.pair_cache is not None else PairCache(sys.maxsize)
+        for token, (freq, list_type, mem) in data.items():
+            a, b = token.split(' ')
+            if freq == 0:
+                pair_cache.put((a, b), None, 0)
+            else:
+                pair_cache.put((a, b), BlockSkipListExt.of(freq, list_type, mem), len(mem))
+        if self.pair_cache is None:
+            pair_cache.max_bytes = pair_cache.bytes
+            self.pair_cache = pair_cache
+
+    @property
+    def last_stats(self):
+        """The QueryStats of the last query of this thread, or None."""
+        return getattr(self.thread_stats, 'last_stats', None)
+
+    @last_stats.setter
+    def last_stats(self, stats):
+        self.thread_stats.last_stats = stats
+
+    @contextmanager
+    def tracing(self, trace):
+        """
+        Record the queries of this thread in trace, a QueryTrace, while in
+        the block: the end of the prepare phase, the algorithm, and the stats
+        if trace.collect_stats is set.
+        """
+        self.thread_stats.trace = trace
+        try:
+            yield trace
+        finally:
+            self.thread_stats.trace = None
+
+    def new_stats(self):
+        trace = getattr(self.thread_stats, 'trace', None)
+        if trace is None:
+            stats = QueryStats() if self.collect_stats else None
+        else:
+            stats = trace.stats = QueryStats() if self.collect_stats or trace.collect_stats else None
+        self.last_stats = stats
+        return stats
+
+    def trace_state(self, state):
+        trace = getattr(self.thread_stats, 'trace', None)
+        if trace is not None:
+            trace.mark('prepare')
+            trace.algorithm = self.algorithm(state) if state else 'none'
+
+    def observe(self, tokens):
+        """Count the token pairs of a query, and cache those which have become frequent."""
+        hot = self.pair_cache.observe(tokens)
+        if hot:
+            self.add_pairs(hot)
+
     def search_and(self, tokens):
+        if self.pair_cache is not None and len(tokens) > 1:
+            self.observe(tokens)
+        stats = self.new_stats()
         if len(tokens) == 1:
             return self.get(tokens[0])
 
         state = self.prepare_state(tokens)
+        self.trace_state(state)
         if not state:
             return []
+        if self.result_cache is not None:
+            return self.cache_result(tokens, self.intersect(state, stats))
+        return self.intersect(state, stats)
 
-        result = []
-        iters = [skip_list.get_iter() for _, skip_list in state]
-
-        # find a common doc id in the first and second list.
-        a_iter = iters[0]
-        pos_a = a_iter.get_pos()
-        b_iter = iters[1]
-        while True:
-            while True:
-                pos_b, cmp = b_iter.search(a_iter.mem, pos_a)
-                if cmp > 0:
-                    pos_a, cmp_a = a_iter.search(b_iter.mem, pos_b)
-                    if cmp_a == 0:
-                        break
-                    elif cmp_a < 0:
-                        return result
-                elif cmp == 0:
-                    break
-                else:  # reach to the end of b
-                    return result
-
-            # check the common doc id against the remains.
-            for it in iters[2:]:
-                pos_it, cmp = it.search(a_iter.mem, pos_a)
-                if cmp > 0:
-                    pos_a, cmp_a = a_iter.search(it.mem, pos_it)
-                    if cmp_a < 0:
-                        return result
-                    break
-                elif cmp < 0:  # reach to the end of the list
-                    return result
-            else:
-                result.append(decode_docid(a_iter.mem, pos_a))
-                pos_a, cmp = a_iter.next_pos()
-                if cmp < 0:
-                    return result
+    def iter_and(self, tokens, start=0):
+        """
+        Yield the doc ids of search_and(tokens) from start on, in order, as
+        the iterators of the lists find them, so that reading the first doc
+        ids of a page costs about a page of searches and no result list.
+        """
+        stats = self.new_stats()
+        state = self.prepare_state(tokens)
+        self.trace_state(state)
+        if state:
+            yield from iter_leapfrog([doc_list for _, doc_list in state], start, stats)
+
+    def intersect(self, state, stats=None):
+        return self.evaluate(self.algorithm(state), state, stats)
 
     def count_and(self, tokens):
+        if self.pair_cache is not None and len(tokens) > 1:
+            self.observe(tokens)
+        stats = self.new_stats()
         if len(tokens) == 1:
-            # TODO self.data.get is overkill if there is a method to get freq of data.
-            freq, _, _ = self.data.get(tokens[0], (0, 0, None))
-            return freq
+            return self.get_freq(tokens[0])
 
         state = self.prepare_state(tokens)
+        self.trace_state(state)
         if not state:
             return 0
+        if self.cache_counts and self.result_cache is not None and frozenset(tokens) not in self.result_cache:
+            # the doc ids are cached for the queries which extend this one
+            return len(self.cache_result(tokens, self.intersect(state, stats)))
+        return self.count_intersection(state, stats)
 
-        count = 0
-        iters = [skip_list.get_iter() for _, skip_list in state]
-
-        # find a common doc id in the first and second list.
-        a_iter = iters[0]
-        pos_a = a_iter.get_pos()
-        b_iter = iters[1]
-        iters2 = iters[2:]
-        while True:
-            while True:
-                pos_b, cmp = b_iter.search(a_iter.mem, pos_a)
-                if cmp > 0:
-                    pos_a, cmp_a = a_iter.search(b_iter.mem, pos_b)
-                    if cmp_a == 0:
-                        break
-                    elif cmp_a < 0:
-                        return count
-                elif cmp == 0:
-                    break
-                else:  # reach to the end of b
-                    return count
-
-            # check the common doc id against the remains.
-            for it in iters2:
-                pos_it, cmp = it.search(a_iter.mem, pos_a)
-                if cmp > 0:
-                    pos_a, cmp_a = a_iter.search(it.mem, pos_it)
-                    if cmp_a < 0:
-                        return count
-                    break
-                elif cmp < 0:  # reach to the end of the list
-                    return count
+    def count_intersection(self, state, stats=None):
+        return self.evaluate(self.algorithm(state), state, stats, count=True)
+
+    def search_phrase(self, tokens):
+        """
+        Return the doc ids which contain tokens as a phrase, as far as the
+        bigrams of the index tell: each adjacent pair with a term of at least
+        indexed_bigram_min_df doc ids must occur next to each other, and the
+        other tokens anywhere. Without bigrams, this is search_and.
+        """
+        stats = self.new_stats()
+        if len(tokens) == 1:
+            return self.get(tokens[0])
+        state = self.prepare_phrase_state(tokens)
+        if not state:
+            return []
+        return self.intersect(state, stats)
+
+    def count_phrase(self, tokens):
+        stats = self.new_stats()
+        if len(tokens) == 1:
+            return self.get_freq(tokens[0])
+        state = self.prepare_phrase_state(tokens)
+        if not state:
+            return 0
+        return self.count_intersection(state, stats)
+
+    def prepare_phrase_state(self, tokens):
+        """
+        Return the state of the bigram list of each adjacent pair of tokens
+        which has one, and of the lists of the tokens in no such pair.
+        """
+        min_df = self.indexed_bigram_min_df
+        if min_df is None:
+            return self.prepare_state(tokens)
+        terms = []
+        covered = set()
+        for a, b in zip(tokens, tokens[1:]):
+            bigram = f"{a} {b}"
+            if bigram in self.data:
+                terms.append(bigram)
+                covered.update((a, b))
+            elif self.get_freq(a) >= min_df or self.get_freq(b) >= min_df:
+                # every bigram of a frequent term is indexed, so no doc has this one
+                return []
+        terms.extend(t for t in tokens if t not in covered)
+        state = []
+        for t in dict.fromkeys(terms):
+            doc_list = self.get_state_list(t)
+            if doc_list is None:
+                return []
+            state.append((doc_list.freq, doc_list))
+        state.sort(key=itemgetter(0))
+        return state
+
+    def evaluate(self, algorithm, state, stats=None, count=False):
+        """Intersect the lists of state with algorithm, see algorithm()."""
+        if algorithm == 'decode':
+            freq, doc_list = state[0]
+            return freq if count else list(doc_list.decode_ids())
+        elif algorithm == 'roaring_and':
+            if stats is not None:
+                stats.blocks += sum(doc_list.num_containers for _, doc_list in state)
+            containers = roaring_and([doc_list for _, doc_list in state])
+            return roaring_count(containers) if count else roaring_ids(containers)
+        elif algorithm in ('bitmap_and', 'bitmap_probe'):
+            return self.intersect_bitmaps(state, stats, count)
+        return INTERSECTIONS[algorithm]([doc_list for _, doc_list in state], stats, count)
+
+    def intersect_bitmaps(self, state, stats=None, count=False):
+        """
+        Intersect lists some of which are bitmaps.
+
+        The bitmaps are ANDed as ints if all lists are bitmaps. Otherwise the
+        other lists are intersected, and their common doc ids are probed in
+        the bitmaps.
+        """
+        bitmaps = [doc_list for _, doc_list in state if type(doc_list) is BitmapListExt]
+        lists = [(freq, doc_list) for freq, doc_list in state if type(doc_list) is not BitmapListExt]
+        if not lists:
+            bits = bitmaps[0].get_bits()
+            for bitmap in bitmaps[1:]:
+                bits &= bitmap.get_bits()
+            if stats is not None:
+                stats.blocks += len(bitmaps)
+            if count:
+                return popcount(bits)
+            return bitmap_ids(bits.to_bytes((bits.bit_length() + 7) >> 3, 'little'))
+        if len(lists) == 1:
+            candidates = lists[0][1].decode_ids()
+        else:
+            candidates = self.intersect(lists, stats)
+        if stats is not None:
+            stats.candidates += len(candidates)
+        for bitmap in bitmaps:
+            if stats is not None:
+                stats.compares += len(candidates)
+            candidates = bitmap.filter(candidates)
+        if stats is not None:
+            stats.matches += len(candidates)
+        return len(candidates) if count else candidates
+
+    def explain_and(self, tokens, count=False, collect_stats=True):
+        """
+        Evaluate search_and(tokens), or count_and(tokens) if count is set,
+        and return its result with the plan.
+
+        The plan holds the df and list type of each term, the order in which
+        the lists are intersected, the algorithm, the cached result and pairs
+        used in place of the lists of their terms, the time of each phase in
+        seconds, and the iterator counters if collect_stats is set.
+        """
+        terms = self.explain_terms(tokens)
+        stats = QueryStats() if collect_stats else None
+        timings = {}
+        cached = {'cached_result': None, 'cached_pairs': []}
+        start = time.perf_counter()
+        if len(tokens) == 1 and count:
+            algorithm = 'df'
+            result = terms[0]['df']
+            timings['lookup'] = time.perf_counter() - start
+        elif len(tokens) == 1:
+            algorithm = 'decode'
+            result = self.get(tokens[0])
+            timings['decode'] = time.perf_counter() - start
+        else:
+            state = self.prepare_state(tokens, cached)
+            timings['prepare'] = time.perf_counter() - start
+            if not state:
+                algorithm = 'none'
+                result = 0 if count else []
             else:
-                count += 1
-                pos_a, cmp = a_iter.next_pos()
-                if cmp < 0:
-                    return count
+                algorithm = self.algorithm(state)
+                start = time.perf_counter()
+                result = self.evaluate(algorithm, state, stats, count)
+                timings['intersect'] = time.perf_counter() - start
+        plan = {
+            'terms': terms,
+            # the same stable sort by df as prepare_state
+            'order': [term['token'] for term in sorted(terms, key=itemgetter('df'))],
+            'algorithm': algorithm,
+            'cached_result': cached['cached_result'],
+            'cached_pairs': cached['cached_pairs'],
+            'timings': timings,
+            'stats': stats.as_dict() if stats is not None else None,
+        }
+        return result, plan
+
+    def explain_terms(self, tokens):
+        terms = []
+        for t in tokens:
+            freq, list_type, _ = self.data.get(t, (0, 0, None))
+            terms.append({'token': t, 'df': freq, 'list_type': LIST_TYPE_NAMES.get(list_type)})
+        return terms
+
+    def algorithm(self, state):
+        """
+        Return the name of the algorithm which intersects the lists of state:
+        decode if it is a single cached pair, roaring_and if they are all
+        roaring lists, bitmap_and or bitmap_probe if some are bitmaps,
+        otherwise the choice of intersection_model.
+        """
+        if len(state) == 1:
+            return 'decode'
+        if all(type(doc_list) is RoaringListExt for _, doc_list in state):
+            return 'roaring_and'
+        bitmaps = sum(1 for _, doc_list in state if type(doc_list) is BitmapListExt)
+        if bitmaps == len(state):
+            return 'bitmap_and'
+        elif bitmaps:
+            return 'bitmap_probe'
+        return self.intersection_model.choose([freq for freq, _ in state])
+
+    def batch_driver(self, tokens):
+        """Return the token of the shortest posting list of tokens, or None if one of them is not in the index."""
+        freqs = [(self.get_freq(t), t) for t in tokens]
+        if not freqs or min(freqs)[0] == 0:
+            return None
+        return min(freqs)[1]
+
+    def search_and_batch(self, queries, count=False):
+        """
+        Return the results of search_and, or of count_and if count is set,
+        for each list of tokens in queries.
+
+        Each query is driven by its shortest posting list. A list which
+        drives more than one query in the batch is decoded once, and the doc
+        ids of these queries are probed in their other lists with iterators,
+        which are reset rather than built again for each query of a list.
+        The other queries are evaluated as usual.
+        """
+        drivers = [self.batch_driver(tokens) for tokens in queries]
+        shared = {t for t, n in Counter(drivers).items() if n > 1 and t is not None}
+        decoded = {}
+        iters = {}
+        results = []
+        for tokens, driver in zip(queries, drivers):
+            if driver not in shared:
+                results.append(self.count_and(tokens) if count else self.search_and(tokens))
+                continue
+            if driver not in decoded:
+                decoded[driver] = self.get(driver)
+            candidates = list(decoded[driver])
+            others = [t for t in set(tokens) if t != driver]
+            state = self.prepare_state(others) if others else []
+            if others and not state:
+                candidates = []
+            for _, doc_list in state:
+                it = iters.get(doc_list)
+                if it is None:
+                    it = iters[doc_list] = doc_list.get_iter()
+                else:
+                    it.reset()
+                candidates = [doc_id for doc_id in candidates if it.search(doc_id) == doc_id]
+                if not candidates:
+                    break
+            results.append(len(candidates) if count else candidates)
+        return results
 
     def clear(self):
         self.raw_data = {}
         self.data = {}
+        self.lists.clear()
+
+    def close(self):
+        self.clear()
+        self.close_mmap()
+
+    def close_mmap(self):
+        if self.mmap is not None:
+            # The views into the mmap are gone with self.data, unless a caller
+            # still holds one, in which case the mapping is left to the GC.
+            try:
+                self.mmap.close()
+            except BufferError:
+                logging.getLogger(__name__).warning(
+                    "The index of %s is still referenced, its mapping is left to the GC", self.idx_dir)
+            self.mmap = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,56 @@
+import math
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def percentile(sorted_values, p):
+    """Return the p-th percentile (0 <= p <= 100) of sorted_values by the nearest-rank method."""
+    if not sorted_values:
+        return None
+    # the smallest value which at least p percent of the values are less than or equal to
+    rank = max(math.ceil(p * len(sorted_values) / 100), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def latency_summary(values):
+    """Return count, mean, p50, p90, p99 and max of values."""
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else None,
+    }
+
+
+def posting_bucket(freq):
+    """Return the decade of freq as a label, e.g. '100-999'."""
+    if freq == 0:
+        return '0'
+    low = 10 ** (len(str(freq)) - 1)
+    return f"{low}-{low * 10 - 1}"
+
+
+def current_rss():
+    """Return the resident set size of this process in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm', 'r', encoding='ascii') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes, or None if unknown."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
@@ -0,0 +1,60 @@
+import os
+import time
+
+QUERY_STATS = os.environ.get('PYSEARCHLITE_QUERY_STATS', '0') == '1'
+
+
+class QueryStats(object):
+    """
+    Counters of the work done by the posting iterators during one query.
+
+    search_calls: calls of search() on the iterators
+    next_calls: calls of next_doc() on the iterators
+    compares: doc id comparisons, counting a bisection of n doc ids as n.bit_length()
+    blocks: blocks decoded by the iterators, at any level
+    levels_climbed: skip list levels climbed at the start of search()
+    candidates: doc ids common to the two shortest lists, checked against the others
+    matches: doc ids in the result
+    """
+
+    FIELDS = ('search_calls', 'next_calls', 'compares', 'blocks', 'levels_climbed', 'candidates', 'matches')
+
+    def __init__(self):
+        self.search_calls = 0
+        self.next_calls = 0
+        self.compares = 0
+        self.blocks = 0
+        self.levels_climbed = 0
+        self.candidates = 0
+        self.matches = 0
+
+    def add(self, other):
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class QueryTrace(object):
+    """
+    The phases of one query, timed on its usual path.
+
+    mark(phase) adds the time since the previous mark, or since the trace
+    was created, to timings[phase]. The reader sets tokens and result_count,
+    and the index the algorithm and, if collect_stats is set, the stats.
+    """
+
+    def __init__(self, collect_stats=False):
+        self.collect_stats = collect_stats
+        self.tokens = None
+        self.algorithm = None
+        self.result_count = None
+        self.stats = None
+        self.timings = {}
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0.0) + now - self.last
+        self.last = now
@@ -1,9 +1,12 @@
+import threading
 from typing import Optional
 
 from .codecs import BYTEORDER
 from .doc_list import DocList, MemoryDocList
+from .index_reader import IndexReader
 from .inverted_index import InvertedIndex
 from .inverted_index_skip_list import InvertedIndexBlockSkipList
+from .query_stats import QUERY_STATS
 # from .memory_inverted_index import MemoryInvertedIndex
 # from .spim_inverted_index import SinglePassInMemoryInvertedIndex
 # from .spim_inverted_index_memory import SinglePassInMemoryInvertedIndexMemory
@@ -14,14 +17,55 @@ from .tokenize import normalized_tokens
 
 DOC_LIST = None
 INVERTED_INDEX = None
+READER = None
+READER_LOCK = threading.Lock()
+USE_MMAP = False
+# applied to each index opened, see collect_query_stats
+COLLECT_QUERY_STATS = QUERY_STATS
+SLOW_QUERY_LOG = None
 
 
-def init(idx_dir):
-    global DOC_LIST, INVERTED_INDEX
-    DOC_LIST = MemoryDocList(idx_dir)
-    # INVERTED_INDEX = SinglePassInMemoryInvertedIndexMemory(idx_dir)
-    # INVERTED_INDEX = SinglePassInMemoryInvertedIndexSkipListMemory(idx_dir)
-    INVERTED_INDEX = InvertedIndexBlockSkipList(idx_dir)
+def new_doc_list(idx_dir):
+    return MemoryDocList(idx_dir)
+
+
+def new_inverted_index(idx_dir):
+    # return SinglePassInMemoryInvertedIndexMemory(idx_dir)
+    # return SinglePassInMemoryInvertedIndexSkipListMemory(idx_dir)
+    return InvertedIndexBlockSkipList(idx_dir, use_mmap=USE_MMAP)
+
+
+def init(idx_dir, use_mmap=False):
+    """
+    Initialize the index in idx_dir.
+
+    If use_mmap is set, the restored posting lists are views of the mapped
+    index file, shared through the page cache instead of copied per process.
+    """
+    global USE_MMAP
+    USE_MMAP = use_mmap
+    swap_reader(IndexReader(new_doc_list(idx_dir), new_inverted_index(idx_dir)))
+
+
+def swap_reader(reader):
+    """Serve new queries from reader, which also becomes DOC_LIST and INVERTED_INDEX, and retire the old one."""
+    global DOC_LIST, INVERTED_INDEX, READER
+    with READER_LOCK:
+        old_reader = READER
+        READER = reader
+        DOC_LIST = reader.doc_list
+        INVERTED_INDEX = reader.inverted_index
+        if hasattr(INVERTED_INDEX, 'collect_stats'):
+            INVERTED_INDEX.collect_stats = COLLECT_QUERY_STATS
+    if old_reader is not None and old_reader is not reader:
+        old_reader.retire()
+
+
+def acquire_reader():
+    with READER_LOCK:
+        if READER is None:
+            raise ValueError("pysearchlite is not initialized, call init() first")
+        return READER.acquire()
 
 
 def index(name, text):
@@ -46,15 +90,137 @@ def restore_index():
     INVERTED_INDEX.restore()
 
 
+def reopen(idx_dir=None):
+    """
+    Open a committed index and switch new queries over to it.
+
+    The new index is restored next to the current one, so queries keep being
+    served while it loads. Queries already running finish on the old index,
+    which is closed when the last of them releases it.
+
+    Parameters
+    ----------
+    idx_dir: str, optional
+        the index directory to open. Defaults to the current index directory.
+    """
+    if idx_dir is None:
+        idx_dir = INVERTED_INDEX.idx_dir
+    doc_list = new_doc_list(idx_dir)
+    inverted_index = new_inverted_index(idx_dir)
+    doc_list.restore()
+    inverted_index.restore()
+    swap_reader(IndexReader(doc_list, inverted_index))
+
+
+def set_slow_query_log(slow_query_log):
+    """
+    Log the slow queries of search, top_k and count to slow_query_log,
+    a SlowQueryLog, or stop logging them if it is None.
+
+    Returns the previous log, which is not closed.
+    """
+    global SLOW_QUERY_LOG
+    old_log = SLOW_QUERY_LOG
+    SLOW_QUERY_LOG = slow_query_log
+    return old_log
+
+
 def search(query):
-    query_tokens = normalized_tokens(query)
-    if len(query_tokens) == 1:
-        doc_ids = INVERTED_INDEX.get(query_tokens[0])
-    else:
-        doc_ids = INVERTED_INDEX.search_and(query_tokens)
-    return [DOC_LIST.get(doc_id) for doc_id in doc_ids]
+    with acquire_reader() as reader:
+        slow_query_log = SLOW_QUERY_LOG
+        if slow_query_log is None:
+            return reader.search(query)
+        return slow_query_log.run(reader, 'search', query)
+
+
+def top_k(query, k=10):
+    with acquire_reader() as reader:
+        slow_query_log = SLOW_QUERY_LOG
+        if slow_query_log is None:
+            return reader.top_k(query, k)
+        return slow_query_log.run(reader, 'top_k', query, k)
+
+
+def iter_search(query):
+    """
+    Yield the docs of search(query) as they are found. The index is held
+    until the generator is exhausted or closed.
+    """
+    with acquire_reader() as reader:
+        yield from reader.iter_search(query)
+
+
+def search_after(query, last_doc_id=-1, n=10):
+    """
+    Return a page of n docs of query after the cursor last_doc_id, -1 for the
+    first page, and the cursor of the next page, or None past the last one.
+    """
+    with acquire_reader() as reader:
+        return reader.search_after(query, last_doc_id, n)
 
 
 def count(query):
-    query_tokens = normalized_tokens(query)
-    return INVERTED_INDEX.count_and(query_tokens)
+    with acquire_reader() as reader:
+        slow_query_log = SLOW_QUERY_LOG
+        if slow_query_log is None:
+            return reader.count(query)
+        return slow_query_log.run(reader, 'count', query)
+
+
+def search_phrase(query):
+    """
+    Return the docs which contain query as a phrase, see
+    InvertedIndexBlockSkipList.search_phrase. The index has to be built with
+    PYSEARCHLITE_BIGRAM_MIN_DF set, otherwise this is search.
+    """
+    with acquire_reader() as reader:
+        return reader.search_phrase(query)
+
+
+def count_phrase(query):
+    with acquire_reader() as reader:
+        return reader.count_phrase(query)
+
+
+def explain(query):
+    """Run query and return its normalized tokens, the plan chosen for it and the time of each phase."""
+    with acquire_reader() as reader:
+        return reader.explain(query)
+
+
+def collect_query_stats(enabled=True):
+    """Enable or disable collecting QueryStats of the queries, on this index and those reopen() opens."""
+    global COLLECT_QUERY_STATS
+    with READER_LOCK:
+        COLLECT_QUERY_STATS = enabled
+        if INVERTED_INDEX is not None:
+            INVERTED_INDEX.collect_stats = enabled
+
+
+def last_query_stats():
+    """
+    Return the counters of the last query of this thread as a dict, or None
+    if they are not collected.
+    """
+    stats = INVERTED_INDEX.last_stats
+    return stats.as_dict() if stats is not None else None
+
+
+def cache_stats():
+    """Return the entries, bytes, hit ratio and evictions of each cache of the index which is set."""
+    return INVERTED_INDEX.cache_stats()
+
+
+def search_batch(queries):
+    """
+    Return the results of search for each query, sharing the posting lists
+    decoded for the batch. The queries are not written to the slow query log.
+    """
+    with acquire_reader() as reader:
+        return reader.search_batch(queries)
+
+
+def count_batch(queries):
+    """Return the results of count for each query, see search_batch."""
+    with acquire_reader() as reader:
+        return reader.count_batch(queries)
@@ -0,0 +1,70 @@
+import json
+import os
+
+from .block_skip_list import SKIPLIST_BLOCK_SIZE, SKIPLIST_MAX_LEVEL
+from .metrics import posting_bucket
+
+# calibration file written by pysearchlite.commands.tune_skip_list
+SKIPLIST_LAYOUT = os.environ.get('PYSEARCHLITE_SKIPLIST_LAYOUT')
+
+
+class SkipListLayout(object):
+    """
+    Choose the block size and maximum level of each posting list.
+
+    The cost model holds, for each decade of posting list length, the
+    measured search cost of each (block_size, max_level) configuration, and
+    a list is laid out with the cheapest configuration of its decade.
+    Lengths which were not calibrated get the default configuration.
+
+    Parameters
+    ----------
+    costs: dict, optional
+        {decade label: {(block_size, max_level): seconds per query}}
+    block_size: int, default SKIPLIST_BLOCK_SIZE
+    max_level: int, default SKIPLIST_MAX_LEVEL
+        the default configuration
+    """
+
+    def __init__(self, costs=None, block_size=SKIPLIST_BLOCK_SIZE, max_level=SKIPLIST_MAX_LEVEL):
+        self.costs = costs or {}
+        self.default = (block_size, max_level)
+        self.best = {bucket: min(configs, key=configs.get) for bucket, configs in self.costs.items() if configs}
+
+    def get(self, freq):
+        """Return (block_size, max_level) for a list of freq doc ids."""
+        return self.best.get(posting_bucket(freq), self.default)
+
+    def to_json(self):
+        return {
+            'default': {'block_size': self.default[0], 'max_level': self.default[1]},
+            'buckets': {
+                bucket: [{'block_size': block_size, 'max_level': max_level, 'seconds': seconds}
+                         for (block_size, max_level), seconds in sorted(configs.items(), key=lambda c: c[1])]
+                for bucket, configs in self.costs.items()
+            },
+        }
+
+    @staticmethod
+    def from_json(obj):
+        costs = {bucket: {(c['block_size'], c['max_level']): c['seconds'] for c in configs}
+                 for bucket, configs in obj.get('buckets', {}).items()}
+        default = obj.get('default', {})
+        return SkipListLayout(costs, default.get('block_size', SKIPLIST_BLOCK_SIZE),
+                              default.get('max_level', SKIPLIST_MAX_LEVEL))
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    @staticmethod
+    def load(filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            return SkipListLayout.from_json(json.load(f))
+
+    @staticmethod
+    def from_env():
+        """Return the layout of PYSEARCHLITE_SKIPLIST_LAYOUT, or the default one if it is not set."""
+        if SKIPLIST_LAYOUT:
+            return SkipListLayout.load(SKIPLIST_LAYOUT)
+        return SkipListLayout()
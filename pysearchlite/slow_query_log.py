@@ -0,0 +1,96 @@
+import json
+import logging
+import random
+import time
+from logging.handlers import RotatingFileHandler
+
+DEFAULT_THRESHOLD = 0.1
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+
+class SlowQueryLog(object):
+    """
+    Write a JSON line for each query which takes at least threshold seconds.
+
+    Each line holds the time, the command, the query, its tokens, the df and
+    list type of each term, the algorithm, the number of results, the total
+    and per-phase time in seconds and the iterator counters.
+
+    Queries run on the usual path with IndexReader.trace_query, which times
+    their phases as they go, so a slow query is not run again to explain it.
+    The dfs are looked up only for the logged ones. search_batch and
+    count_batch are not logged.
+
+    Parameters
+    ----------
+    filename: str
+        the log file. It is rotated into filename.1, filename.2, ... once it
+        reaches max_bytes.
+    threshold: float, default DEFAULT_THRESHOLD
+        the minimum time in seconds of a logged query.
+    sample_rate: float, default 1.0
+        the fraction of the slow queries which are logged.
+    max_bytes: int, default DEFAULT_MAX_BYTES
+        the size of the log file at which it is rotated.
+    backup_count: int, default DEFAULT_BACKUP_COUNT
+        the number of rotated files kept.
+    collect_stats: bool, default False
+        whether the logged queries collect the iterator counters.
+    seed: int, optional
+        the seed of the sampling.
+    """
+
+    def __init__(self, filename, threshold=DEFAULT_THRESHOLD, sample_rate=1.0, max_bytes=DEFAULT_MAX_BYTES,
+                 backup_count=DEFAULT_BACKUP_COUNT, collect_stats=False, seed=None):
+        self.filename = filename
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.collect_stats = collect_stats
+        self.random = random.Random(seed)
+        self.handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                           encoding='utf-8')
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+        # not registered with the logging module, so that it does not reach
+        # the handlers of the application.
+        self.logger = logging.Logger('pysearchlite.slow_query')
+        self.logger.addHandler(self.handler)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+    def run(self, reader, command, query, k=None):
+        """
+        Run query on reader as command ('search', 'top_k' or 'count') does
+        and return its result, logging it if it is slow.
+        """
+        start = time.perf_counter()
+        result, trace = reader.trace_query(command, query, k, self.collect_stats)
+        elapsed = time.perf_counter() - start
+        if elapsed >= self.threshold and (self.sample_rate >= 1.0 or self.random.random() < self.sample_rate):
+            explanation = {
+                'query': query,
+                'tokens': trace.tokens,
+                'terms': reader.inverted_index.explain_terms(trace.tokens),
+                'algorithm': trace.algorithm,
+                'result_count': trace.result_count,
+                'timings': trace.timings,
+                'stats': trace.stats.as_dict() if trace.stats is not None else None,
+            }
+            self.write(command, explanation, elapsed, k)
+        return result
+
+    def write(self, command, explanation, elapsed, k=None):
+        record = {'time': time.time(), 'command': command}
+        if k is not None:
+            record['k'] = k
+        record.update(explanation)
+        record['seconds'] = elapsed
+        self.logger.warning(json.dumps(record, ensure_ascii=False))
@@ -1,9 +1,13 @@
 import mmap
 import os
 import shutil
+import struct
+import sys
+from array import array
 from operator import itemgetter
 from typing import Optional, TextIO, BinaryIO, Union, Literal
 
+from .intersection import double_binary_search
 from .inverted_index import InvertedIndex
 
 TOKEN_LEN_BYTES = 2
@@ -16,6 +20,10 @@ B_INT32_0 = b"\x00\x00\x00\x00"
 POS_SIZE = 10
 TOKEN_SIZE = 20
 
+DOCID_STRUCT = struct.Struct(">I" if BYTEORDER == "big" else "<I")
+# the cost of a probe of MappedDocIds, in doc ids copied into an array
+MAPPED_PROBE_COST = 256
+
 
 def write_token(f: BinaryIO, token: str):
     encoded_token = token.encode('utf-8')
@@ -38,6 +46,24 @@ def write_doc_ids(f: BinaryIO, doc_ids: list[int]):
         f.write(doc_id.to_bytes(DOCID_BYTES, BYTEORDER))
 
 
+class MappedDocIds(object):
+    """
+    The doc ids of a list in the index file, unpacked as they are indexed,
+    so that a binary search reads only the doc ids it probes.
+    """
+
+    def __init__(self, mem, pos: int, ids_len: int):
+        self.mem = mem
+        self.pos = pos
+        self.ids_len = ids_len
+
+    def __len__(self):
+        return self.ids_len
+
+    def __getitem__(self, i: int) -> int:
+        return DOCID_STRUCT.unpack_from(self.mem, self.pos + i * DOCID_BYTES)[0]
+
+
 class SinglePassInMemoryInvertedIndex(InvertedIndex):
 
     def __init__(self, idx_dir: str, mem_limit=1000_000_000):
@@ -51,10 +77,16 @@ class SinglePassInMemoryInvertedIndex(InvertedIndex):
         self.mem_limit = mem_limit
 
     def __del__(self):
+        self.close()
+
+    def close(self):
+        self.clear()
         if self.mmap:
             self.mmap.close()
+            self.mmap = None
         if self.file:
             self.file.close()
+            self.file = None
 
     def add(self, idx: int, tokens: list[str]):
         for token in set(tokens):
@@ -176,6 +208,10 @@ class SinglePassInMemoryInvertedIndex(InvertedIndex):
             pos += DOCID_BYTES
         return ids
 
+    def get_freq(self, token: str) -> int:
+        ids_len, _ = self.data.get(token, (0, -1))
+        return ids_len
+
     def prepare_state(self, tokens: list[str]) -> list[(int, int)]:
         # confirm if all tokens are in index.
         state = []
@@ -187,183 +223,37 @@ class SinglePassInMemoryInvertedIndex(InvertedIndex):
         state.sort(key=itemgetter(0))
         return state
 
-    def binary_search(self, pos: int, doc_id: bytes, left: int, right: int) -> int:
-        while left < right:
-            m = (left + right) // 2
-            m_pos = pos + m * DOCID_BYTES
-            if self.mmap[m_pos:m_pos + DOCID_BYTES] < doc_id:
-                left = m + 1
-            else:
-                right = m
-        return left
-
-    def binary_search_a(self, a: list[bytes], doc_id: bytes, left: int, right: int) -> int:
-        while left < right:
-            m = (left + right) // 2
-            if a[m] < doc_id:
-                left = m + 1
-            else:
-                right = m
-        return left
-
-    def double_binary_search_pos(self,
-                                 pos_a: int, left_a: int, right_a: int,
-                                 pos_b: int, left_b: int, right_b: int,
-                                 result: list[bytes]):
-        if left_a >= right_a or left_b >= right_b:
-            return
-
-        if right_a - left_a == 1:
-            ma_pos = pos_a + left_a * DOCID_BYTES
-            ma_val = self.mmap[ma_pos:ma_pos + DOCID_BYTES]
-            if right_b - left_b == 1:
-                mb_pos = pos_b + left_b * DOCID_BYTES
-                mb_val = self.mmap[mb_pos:mb_pos + DOCID_BYTES]
-                if mb_val == ma_val:
-                    result.append(ma_val)
-                return
-
-            mb = self.binary_search(pos_b, ma_val, left_b, right_b)
-            if mb >= right_b:
-                return
-            mb_pos = pos_b + mb * DOCID_BYTES
-            mb_val = self.mmap[mb_pos:mb_pos + DOCID_BYTES]
-            if mb_val == ma_val:
-                result.append(ma_val)
-            return
-
-        ma = (left_a + right_a) // 2
-        ma_pos = pos_a + ma * DOCID_BYTES
-        ma_val = self.mmap[ma_pos:ma_pos + DOCID_BYTES]
-        mb = self.binary_search(pos_b, ma_val, left_b, right_b)
-        if mb >= right_b:
-            self.double_binary_search_pos(pos_a, left_a, ma, pos_b, left_b, right_b, result)
-            return
-
-        mb_pos = pos_b + mb * DOCID_BYTES
-        mb_val = self.mmap[mb_pos:mb_pos + DOCID_BYTES]
-        if mb_val > ma_val:
-            self.double_binary_search_pos(pos_a, left_a, ma, pos_b, left_b, mb, result)
-            self.double_binary_search_pos(pos_a, ma + 1, right_a, pos_b, mb, right_b, result)
-        else:  # mb_val == ma_val
-            self.double_binary_search_pos(pos_a, left_a, ma, pos_b, left_b, mb, result)
-            result.append(ma_val)
-            self.double_binary_search_pos(pos_a, ma + 1, right_a, pos_b, mb + 1, right_b, result)
-
-    def double_binary_search(self,
-                             a: list[bytes], left_a: int, right_a: int,
-                             pos_b: int, left_b: int, right_b: int,
-                             result: list[bytes]):
-        if left_a >= right_a or left_b >= right_b:
-            return
-
-        if right_a - left_a == 1:
-            ma_val = a[left_a]
-            if right_b - left_b == 1:
-                mb_pos = pos_b + left_b * DOCID_BYTES
-                mb_val = self.mmap[mb_pos:mb_pos + DOCID_BYTES]
-                if mb_val == ma_val:
-                    result.append(ma_val)
-                return
-
-            mb = self.binary_search(pos_b, ma_val, left_b, right_b)
-            if mb >= right_b:
-                return
-            mb_pos = pos_b + mb * DOCID_BYTES
-            mb_val = self.mmap[mb_pos:mb_pos + DOCID_BYTES]
-            if mb_val == ma_val:
-                result.append(ma_val)
-            return
-
-        ma = (left_a + right_a) // 2
-        ma_val = a[ma]
-        mb = self.binary_search(pos_b, ma_val, left_b, right_b)
-        if mb >= right_b:
-            self.double_binary_search(a, left_a, ma, pos_b, left_b, right_b, result)
-            return
-
-        mb_pos = pos_b + mb * DOCID_BYTES
-        mb_val = self.mmap[mb_pos:mb_pos + DOCID_BYTES]
-        if mb_val > ma_val:
-            self.double_binary_search(a, left_a, ma, pos_b, left_b, mb, result)
-            # According to the bench mark results, the follwoing branches were slower.
-            #
-            # if ma - left_a <= mb - left_b:
-            #     self.double_binary_search(a, left_a, ma, pos_b, left_b, mb, result)
-            # else:
-            #     self.double_binary_search_b(a, left_a, ma, pos_b, left_b, mb, result)
-            self.double_binary_search(a, ma + 1, right_a, pos_b, mb, right_b, result)
-            # if right_a - ma - 1 <= right_b - mb:
-            #     self.double_binary_search(a, ma + 1, right_a, pos_b, mb, right_b, result)
-            # else:
-            #     self.double_binary_search_b(a, ma + 1, right_a, pos_b, mb, right_b, result)
-        else:  # mb_val == ma_val
-            self.double_binary_search(a, left_a, ma, pos_b, left_b, mb, result)
-            # if ma - left_a <= mb - left_b:
-            #     self.double_binary_search(a, left_a, ma, pos_b, left_b, mb, result)
-            # else:
-            #     self.double_binary_search_b(a, left_a, ma, pos_b, left_b, mb, result)
-            result.append(ma_val)
-            self.double_binary_search(a, ma + 1, right_a, pos_b, mb + 1, right_b, result)
-            # if right_a - ma <= right_b < mb:
-            #     self.double_binary_search(a, ma + 1, right_a, pos_b, mb + 1, right_b, result)
-            # else:
-            #     self.double_binary_search_b(a, ma + 1, right_a, pos_b, mb + 1, right_b, result)
-
-    def double_binary_search_b(self,
-                               a: list[bytes], left_a: int, right_a: int,
-                               pos_b: int, left_b: int, right_b: int,
-                               result: list[bytes]):
-        if left_a >= right_a or left_b >= right_b:
-            return
-
-        if right_b - left_b == 1:
-            mb_pos = pos_b + left_b * DOCID_BYTES
-            mb_val = self.mmap[mb_pos:mb_pos + DOCID_BYTES]
-            if right_a - left_a == 1:
-                ma_val = a[left_a]
-                if mb_val == ma_val:
-                    result.append(mb_val)
-                return
-
-            ma = self.binary_search_a(a, mb_val, left_a, right_a)
-            if ma >= right_a:
-                return
-            ma_val = a[ma]
-            if ma_val == mb_val:
-                result.append(mb_val)
-            return
-
-        mb = (left_b + right_b) // 2
-        mb_pos = pos_b + mb * DOCID_BYTES
-        mb_val = self.mmap[mb_pos:mb_pos + DOCID_BYTES]
-        ma = self.binary_search_a(a, mb_val, left_a, right_a)
-        if ma >= right_a:
-            self.double_binary_search_b(a, left_a, right_a, pos_b, left_b, mb, result)
-            return
-
-        mb_pos = pos_b + mb * DOCID_BYTES
-        mb_val = self.mmap[mb_pos:mb_pos + DOCID_BYTES]
-        ma_val = a[ma]
-        if ma_val > mb_val:
-            if ma - left_a >= mb - left_b:
-                self.double_binary_search_b(a, left_a, ma, pos_b, left_b, mb, result)
-            else:
-                self.double_binary_search(a, left_a, ma, pos_b, left_b, mb, result)
-            if right_a - ma - 1 >= right_b - mb:
-                self.double_binary_search_b(a, ma + 1, right_a, pos_b, mb, right_b, result)
-            else:
-                self.double_binary_search(a, ma + 1, right_a, pos_b, mb, right_b, result)
-        else:  # ma_val == mb_val
-            if ma - left_a >= mb - left_b:
-                self.double_binary_search_b(a, left_a, ma, pos_b, left_b, mb, result)
-            else:
-                self.double_binary_search(a, left_a, ma, pos_b, left_b, mb, result)
-            result.append(ma_val)
-            if right_a - ma >= right_b - mb:
-                self.double_binary_search_b(a, ma + 1, right_a, pos_b, mb + 1, right_b, result)
-            else:
-                self.double_binary_search(a, ma + 1, right_a, pos_b, mb + 1, right_b, result)
+    def doc_ids_array(self, ids_len: int, pos: int) -> Union[array, memoryview]:
+        """Return the doc ids of a list as ints, a view of the mmap if its byte order is native."""
+        if sys.byteorder == BYTEORDER and array('I').itemsize == DOCID_BYTES:
+            return memoryview(self.mmap)[pos:pos + ids_len * DOCID_BYTES].cast('I')
+        ids = array('I')
+        ids.frombytes(self.mmap[pos:pos + ids_len * DOCID_BYTES])
+        if sys.byteorder != BYTEORDER:
+            ids.byteswap()
+        return ids
+
+    def probed_doc_ids(self, ids_len: int, pos: int, n: int) -> Union[array, memoryview, MappedDocIds]:
+        """
+        Return the doc ids of a list to be probed for n doc ids, searched in
+        place if copying them would cost more than the probes.
+        """
+        if sys.byteorder != BYTEORDER and n * ids_len.bit_length() * MAPPED_PROBE_COST < ids_len:
+            return MappedDocIds(self.mmap, pos, ids_len)
+        return self.doc_ids_array(ids_len, pos)
+
+    def intersect(self, state: list[(int, int)]) -> list[int]:
+        # The index keeps its big endian format, which the lists are cast
+        # to without copies on big endian hosts only. On the others a list
+        # much longer than the doc ids probed in it is searched in place.
+        doc_ids = self.doc_ids_array(*state[0])
+        for ids_len, pos in state[1:]:
+            result = []
+            double_binary_search(doc_ids, self.probed_doc_ids(ids_len, pos, len(doc_ids)), result)
+            doc_ids = result
+            if not doc_ids:
+                break
+        return doc_ids
 
     def search_and(self, tokens: list[str]) -> list[int]:
         if len(tokens) == 1:
@@ -372,18 +262,7 @@ class SinglePassInMemoryInvertedIndex(InvertedIndex):
         state = self.prepare_state(tokens)
         if not state:
             return []
-
-        result = []
-        n_a, pos_a = state[0]
-        n_b, pos_b = state[1]  # since len(tokens) >= 2
-        self.double_binary_search_pos(pos_a, 0, n_a, pos_b, 0, n_b, result)
-        doc_ids = result
-        # when len(tokens) >= 3
-        for i, (n_b, pos_b) in enumerate(state[2:]):
-            result = []
-            self.double_binary_search(doc_ids, 0, len(doc_ids), pos_b, 0, n_b, result)
-            doc_ids = result
-        return [int.from_bytes(doc_id, BYTEORDER) for doc_id in doc_ids]
+        return self.intersect(state)
 
     def count_and(self, tokens: list[str]) -> int:
         if len(tokens) == 1:
@@ -393,18 +272,7 @@ class SinglePassInMemoryInvertedIndex(InvertedIndex):
         state = self.prepare_state(tokens)
         if not state:
             return 0
-
-        result = []
-        n_a, pos_a = state[0]
-        n_b, pos_b = state[1]  # since len(tokens) >= 2
-        self.double_binary_search_pos(pos_a, 0, n_a, pos_b, 0, n_b, result)
-        doc_ids = result
-        # when len(tokens) >= 3
-        for i, (n_b, pos_b) in enumerate(state[2:]):
-            result = []
-            self.double_binary_search(doc_ids, 0, len(doc_ids), pos_b, 0, n_b, result)
-            doc_ids = result
-        return len(doc_ids)
+        return len(self.intersect(state))
 
     def clear(self):
         self.raw_data = {}
@@ -3,6 +3,7 @@ import shutil
 from operator import itemgetter
 from typing import Optional, TextIO, BinaryIO, Union, Literal
 
+from .intersection import double_binary_search
 from .inverted_index import InvertedIndex
 
 TOKEN_LEN_BYTES = 2
@@ -170,75 +171,6 @@ class SinglePassInMemoryInvertedIndexMemory(InvertedIndex):
         state.sort(key=itemgetter(0))
         return state
 
-    def binary_search(self, a: list[int], doc_id: int, left: int, right: int) -> int:
-        original_right = right
-        while left != right:
-            m = (left + right) // 2
-            if a[m] < doc_id:
-                left = m + 1
-            else:
-                right = m
-        if right < original_right and a[right] < doc_id:
-            return right + 1
-        return right
-
-    def double_binary_search(self,
-                             a: list[int], left_a: int, right_a: int,
-                             b: list[int], left_b: int, right_b: int,
-                             result: list[int]):
-        if left_a >= right_a or left_b >= right_b:
-            return
-
-        if right_a - left_a == 1:
-            ma_val = a[left_a]
-            if right_b - left_b == 1:
-                mb_val = b[left_b]
-                if mb_val == ma_val:
-                    result.append(ma_val)
-                return
-
-            mb = self.binary_search(b, ma_val, left_b, right_b)
-            if mb >= right_b:
-                return
-            mb_val = b[mb]
-            if mb_val == ma_val:
-                result.append(ma_val)
-            return
-
-        ma = (left_a + right_a) // 2
-        ma_val = a[ma]
-        mb = self.binary_search(b, ma_val, left_b, right_b)
-        if mb >= right_b:
-            self.double_binary_search(a, left_a, ma, b, left_b, right_b, result)
-            return
-
-        mb_val = b[mb]
-        if mb_val > ma_val:
-            self.double_binary_search(a, left_a, ma, b, left_b, mb, result)
-            # According to the bench mark results, the follwoing branches were slower.
-            #
-            # if ma - left_a <= mb - left_b:
-            #     self.double_binary_search(a, left_a, ma, b, left_b, mb, result)
-            # else:
-            #     self.double_binary_search_b(a, left_a, ma, pos_b, left_b, mb, result)
-            self.double_binary_search(a, ma + 1, right_a, b, mb, right_b, result)
-            # if right_a - ma - 1 <= right_b - mb:
-            #     self.double_binary_search(a, ma + 1, right_a, b, mb, right_b, result)
-            # else:
-            #     self.double_binary_search_b(a, ma + 1, right_a, b, mb, right_b, result)
-        else:  # mb_val == ma_val
-            self.double_binary_search(a, left_a, ma, b, left_b, mb, result)
-            # if ma - left_a <= mb - left_b:
-            #     self.double_binary_search(a, left_a, ma, b, left_b, mb, result)
-            # else:
-            #     self.double_binary_search_b(a, left_a, ma, b, left_b, mb, result)
-            result.append(ma_val)
-            self.double_binary_search(a, ma + 1, right_a, b, mb + 1, right_b, result)
-            # if right_a - ma <= right_b < mb:
-            #     self.double_binary_search(a, ma + 1, right_a, b, mb + 1, right_b, result)
-            # else:
-            #     self.double_binary_search_b(a, ma + 1, right_a, b, mb + 1, right_b, result)
-
     def search_and(self, tokens: list[str]) -> list[int]:
         if len(tokens) == 1:
             return self.get(tokens[0])
@@ -253,7 +185,7 @@ class SinglePassInMemoryInvertedIndexMemory(InvertedIndex):
         # find common doc ids
         for i, (n_b, ids_b) in enumerate(state[1:]):
             result = []
-            self.double_binary_search(doc_ids, 0, len(doc_ids), ids_b, 0, n_b, result)
+            double_binary_search(doc_ids, ids_b, result)
             doc_ids = result
         return doc_ids
 
@@ -271,7 +203,7 @@ class SinglePassInMemoryInvertedIndexMemory(InvertedIndex):
         # find common doc ids
         for i, (n_b, ids_b) in enumerate(state[1:]):
             result = []
-            self.double_binary_search(doc_ids, 0, len(doc_ids), ids_b, 0, n_b, result)
+            double_binary_search(doc_ids, ids_b, result)
             doc_ids = result
         return len(doc_ids)
 
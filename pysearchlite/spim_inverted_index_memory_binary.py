@@ -167,6 +167,9 @@ class SinglePassInMemoryInvertedIndexMemoryBinary(InvertedIndex):
             return []
         return [int.from_bytes(doc_id, BYTEORDER) for doc_id in ids]
 
+    def get_freq(self, token: str) -> int:
+        return len(self.data.get(token, []))
+
     def prepare_state(self, tokens: list[str]) -> list[(int, list[bytes])]:
         state = []
         for t in tokens:
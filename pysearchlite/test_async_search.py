@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+from . import search_engine as se
+from .async_search import AsyncSearchEngine
+
+
+def test_async_search(tmpdir):
+    se.init(tmpdir)
+    se.index("id1", "hello world")
+    se.index("id2", "this is a test")
+    se.index("id3", "this is another test")
+    se.save_index()
+
+    async def run():
+        async with AsyncSearchEngine(str(tmpdir), max_workers=1) as engine:
+            assert await engine.search("this test") == ["id2", "id3"]
+            assert await engine.top_k("this test", 1) == ["id2"]
+            assert await engine.count("hello") == 1
+            with pytest.raises(asyncio.TimeoutError):
+                await engine.count("hello", timeout=0)
+
+    asyncio.run(run())
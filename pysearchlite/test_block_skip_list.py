@@ -4,7 +4,24 @@ from tempfile import TemporaryFile
 
 import pytest as pytest
 
-from .block_skip_list import BlockSkipList, SingleDocId, DocIdList, BlockSkipListExt
+from .block_skip_list import (
+    BitmapList,
+    BlockSkipList,
+    BlockSkipListExt,
+    DocIdList,
+    END_DOC_ID,
+    FlatSkipList,
+    ROARING_ARRAY,
+    ROARING_BITMAP,
+    ROARING_RUN,
+    RoaringList,
+    SingleDocId,
+    bitmap_ids,
+    roaring_and,
+    roaring_count,
+    roaring_ids,
+    roaring_or,
+)
 from .gamma_codecs import encode_docid, decode_docid, DOCID_BYTES
 
 B_0 = b'\x00\x00\x00\x00'
@@ -95,15 +112,37 @@ def test_block_skip_list_ext_search(arr, target):
         file.seek(0)
         mem = file.read()
         skip_list_ext = BlockSkipListExt.read(mem)
-        # prepare target
-        mem_target = bytearray(encode_docid(target))
         skip_list_ext_iter = skip_list_ext.get_iter()
-        ret, cmp = skip_list_ext_iter.search(mem_target, 0)
+        ret = skip_list_ext_iter.search(target)
         i = linear_search(arr, target)
         if i == len(arr):
-            assert decode_docid(skip_list_ext.mem, ret) == arr[-1]
+            assert ret == END_DOC_ID
         else:
-            assert decode_docid(skip_list_ext.mem, ret) == arr[i]
+            assert ret == arr[i]
+
+
+@pytest.mark.parametrize('arr, targets', [
+    (arr, sorted(randrange(1, len(arr) * 4 + 2) for _ in range(10))) for arr, _ in search_test_cases(100, 400)])
+def test_block_skip_list_ext_iter(arr, targets):
+    skip_list = BlockSkipList.from_list(arr, block_size=16, max_level=3)
+    with TemporaryFile(prefix="pysearchlite_") as file:
+        skip_list.write(file)
+        file.seek(0)
+        skip_list_ext = BlockSkipListExt.read(file.read())
+    it = skip_list_ext.get_iter()
+    assert it.doc_id == arr[0]
+    # the iterator never moves back, so the expected index is at least the current one
+    current = 0
+    for target in targets:
+        current = max(current, linear_search(arr, target))
+        assert it.search(target) == (arr[current] if current < len(arr) else END_DOC_ID)
+        if current < len(arr) - 1 and target % 3 == 0:
+            current += 1
+            assert it.next_doc() == arr[current]
+    ids = [it.doc_id]
+    while ids[-1] != END_DOC_ID:
+        ids.append(it.next_doc())
+    assert ids[:-1] == arr[current:]
 
 
 def skip_list_and_test_cases(num, max_len):
@@ -117,3 +156,148 @@ def skip_list_and_test_cases(num, max_len):
         b = sorted(set(randrange(1, b_len * 4 + 1) for _ in range(b_len)))
         tests.append((a, b))
     return tests
+
+
+def test_flat_skip_list_fromlist():
+    sl = FlatSkipList.from_list([1], block_ids=4)
+    assert type(sl) == SingleDocId
+    sl = FlatSkipList.from_list([1, 2, 3, 4], block_ids=4)
+    assert type(sl) == DocIdList
+    sl = FlatSkipList.from_list([1, 2, 3, 4, 5, 6, 200, 300, 400], block_ids=4)
+    assert sl.heads == [1, 5, 400]
+    assert sl.blocks == [b'\x01\x02\x03\x04', b'\x05\x06' + encode_docid(200) + encode_docid(300), encode_docid(400)]
+    assert sl.freq == 9
+
+
+@pytest.mark.parametrize('arr, target', search_test_cases(100, 50))
+def test_flat_skip_list_ext_search(arr, target):
+    skip_list = FlatSkipList.from_list(arr, block_ids=3)
+    with TemporaryFile(prefix="pysearchlite_") as file:
+        skip_list.write(file)
+        file.seek(0)
+        mem = file.read()
+    skip_list_ext = BlockSkipListExt.read(mem)
+    it = skip_list_ext.get_iter()
+    # search twice to check that the iterator resumes from its position
+    for t in (target // 2, target):
+        i = linear_search(arr, t)
+        assert it.search(t) == (arr[i] if i < len(arr) else END_DOC_ID)
+    if i < len(arr):
+        ids = [arr[i]]
+        while True:
+            doc_id = it.next_doc()
+            if doc_id == END_DOC_ID:
+                break
+            ids.append(doc_id)
+        assert ids == arr[i:]
+
+
+def test_bitmap_list_fromlist():
+    sl = BitmapList.from_list([1])
+    assert type(sl) == SingleDocId
+    sl = BitmapList.from_list([0, 3, 8, 17])
+    assert sl.bitmap == b'\x09\x01\x02'
+    assert sl.freq == 4
+    assert bitmap_ids(sl.bitmap) == [0, 3, 8, 17]
+    assert BitmapList.is_dense([1, 2, 3, 4], 0.5, 4)
+    assert not BitmapList.is_dense([1, 2, 3, 4], 0.5, 5)
+    assert not BitmapList.is_dense([1, 2, 3, 10], 0.5, 4)
+
+
+@pytest.mark.parametrize('arr, target', search_test_cases(100, 50))
+def test_bitmap_list_ext_search(arr, target):
+    with TemporaryFile(prefix="pysearchlite_") as file:
+        BitmapList.from_list(arr).write(file)
+        file.seek(0)
+        skip_list_ext = BlockSkipListExt.read(file.read())
+    it = skip_list_ext.get_iter()
+    assert it.doc_id == arr[0]
+    for t in (target // 2, target):
+        i = linear_search(arr, t)
+        assert it.search(t) == (arr[i] if i < len(arr) else END_DOC_ID)
+    if i < len(arr):
+        ids = [arr[i]]
+        while True:
+            doc_id = it.next_doc()
+            if doc_id == END_DOC_ID:
+                break
+            ids.append(doc_id)
+        assert ids == arr[i:]
+
+
+def read_ext(skip_list):
+    with TemporaryFile(prefix="pysearchlite_") as file:
+        skip_list.write(file)
+        file.seek(0)
+        return BlockSkipListExt.read(file.read())
+
+
+def test_roaring_list_fromlist():
+    sl = RoaringList.from_list([1])
+    assert type(sl) == SingleDocId
+    sl = RoaringList.from_list([1, 2, 3], min_df=4)
+    assert type(sl) == DocIdList
+    ids = [1, 5, 9] + list(range(65536, 65536 + 10000)) + list(range(131072, 196608, 3))
+    sl = RoaringList.from_list(ids, min_df=4)
+    assert sl.keys == [0, 1, 2]
+    assert sl.types == [ROARING_ARRAY, ROARING_RUN, ROARING_BITMAP]
+    assert sl.freq == len(ids)
+    assert read_ext(sl).decode_ids() == ids
+
+
+def random_ids(n, universe):
+    return sorted(set(randrange(universe) for _ in range(n)))
+
+
+@pytest.mark.parametrize('arr, target', [(random_ids(n, 300_000), randrange(300_000))
+                                         for n in (10, 100, 5000, 50000) for _ in range(5)])
+def test_roaring_list_ext_search(arr, target):
+    it = read_ext(RoaringList.from_list(arr, min_df=2)).get_iter()
+    assert it.doc_id == arr[0]
+    for t in (target // 2, target):
+        i = linear_search(arr, t)
+        assert it.search(t) == (arr[i] if i < len(arr) else END_DOC_ID)
+    if i < len(arr):
+        ids = [arr[i]]
+        while True:
+            doc_id = it.next_doc()
+            if doc_id == END_DOC_ID:
+                break
+            ids.append(doc_id)
+        assert ids == arr[i:]
+
+
+def test_roaring_and_or():
+    lists = [random_ids(100, 300_000), random_ids(50000, 300_000),
+             list(range(0, 300_000, 2)), list(range(60000, 140000))]
+    exts = [read_ext(RoaringList.from_list(ids, min_df=2)) for ids in lists]
+    for a in range(len(lists)):
+        for b in range(len(lists)):
+            expected = sorted(set(lists[a]).intersection(lists[b]))
+            assert roaring_ids(roaring_and([exts[a], exts[b]])) == expected
+            assert roaring_count(roaring_and([exts[a], exts[b]])) == len(expected)
+            assert roaring_ids(roaring_or([exts[a], exts[b]])) == sorted(set(lists[a]).union(lists[b]))
+    assert roaring_ids(roaring_and(exts)) == sorted(set(lists[0]).intersection(*lists[1:]))
+
+
+@pytest.mark.parametrize('cls', [BlockSkipList, FlatSkipList, BitmapList, RoaringList])
+def test_ext_iter_independent(cls):
+    arr = list(range(3, 600, 3))
+    skip_list = cls.from_list(arr)
+    with TemporaryFile(prefix="pysearchlite_") as file:
+        skip_list.write(file)
+        file.seek(0)
+        skip_list_ext = BlockSkipListExt.read(file.read())
+    it = skip_list_ext.get_iter()
+    assert it.search(301) == 303
+    assert it.next_doc() == 306
+    # iterators share the decoded first blocks without changing them
+    it2 = skip_list_ext.get_iter()
+    assert it2.doc_id == 3
+    assert it2.search(301) == 303
+    assert it.search(600) == END_DOC_ID
+    assert it2.next_doc() == 306
+    it.reset()
+    assert it.doc_id == 3
+    assert it.search(301) == 303
+    assert it.next_doc() == 306
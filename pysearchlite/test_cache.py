@@ -0,0 +1,88 @@
+import pytest
+
+from .cache import LRUCache, PairCache, ResultCache, mine_pairs, query_pairs
+
+
+def test_lru_cache():
+    cache = LRUCache(350)
+    assert cache.put('a', 1, 50)
+    assert cache.put('b', 2, 50)
+    assert cache.get('a') == 1
+    assert cache.put('c', 3, 50)
+    # 'b' is the least recently used
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert not cache.put('d', 4, 1000)
+    assert cache.stats() == {'entries': 2, 'bytes': 300, 'max_bytes': 350, 'hits': 2, 'misses': 1,
+                             'hit_ratio': 2 / 3, 'evictions': 1}
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.bytes == 0
+
+
+def test_query_pairs():
+    assert query_pairs(['b', 'a', 'c', 'a']) == [('a', 'b'), ('a', 'c'), ('b', 'c')]
+    assert query_pairs(['a']) == []
+    queries = [['a', 'b'], ['b', 'a', 'c'], ['c', 'd'], ['a', 'b', 'd']]
+    assert mine_pairs(queries) == [('a', 'b')]
+    assert mine_pairs(queries, 1)[0] == ('a', 'b')
+
+
+class FakeList(object):
+
+    def __init__(self, freq):
+        self.freq = freq
+
+
+def test_pair_cache_observe():
+    cache = PairCache(10_000, min_count=2, max_tracked=3)
+    assert cache.observe(['a', 'b']) == []
+    assert cache.observe(['b', 'a', 'c']) == [('a', 'b')]
+    assert cache.observe(['a', 'b']) == []
+    # the pairs seen once are dropped beyond max_tracked
+    cache.observe(['d', 'e'])
+    assert ('a', 'c') not in cache.counts
+    assert cache.counts[('a', 'b')] == 1
+
+
+def test_pair_cache_cover():
+    cache = PairCache(10_000)
+    cache.put(('a', 'b'), FakeList(10), 10)
+    cache.put(('b', 'c'), FakeList(5), 10)
+    cache.put(('c', 'd'), FakeList(20), 10)
+    cache.put(('d', 'e'), None, 0)
+    assert [pair for pair, _ in cache.cover(['a', 'b', 'c', 'd'])] == [('b', 'c')]
+    assert [pair for pair, _ in cache.cover(['a', 'b', 'c', 'd', 'e'])] == [('d', 'e'), ('b', 'c')]
+    assert cache.cover(['a', 'c']) == []
+    # the pairs looked up which are not cached
+    assert cache.stats()['hits'] == 3
+    assert cache.stats()['misses'] == 3 + 6 + 1
+
+
+@pytest.mark.parametrize('policy, evicted', [('lru', 'b'), ('lfu', 'c'), ('fifo', 'a')])
+def test_result_cache_policy(policy, evicted):
+    cache = ResultCache(300, policy)
+    cache.put('a', 1, 0)
+    cache.put('b', 2, 0)
+    cache.put('c', 3, 0)
+    for key in 'bbaca':
+        cache.get(key)
+    cache.put('d', 4, 0)
+    assert evicted not in cache
+    assert 'd' in cache
+    assert cache.stats()['policy'] == policy
+
+
+def test_result_cache_largest_subset():
+    cache = ResultCache(10_000)
+    cache.put(frozenset(['a', 'b']), 1, 0)
+    cache.put(frozenset(['a', 'b', 'c']), 2, 0)
+    cache.put(frozenset(['b', 'd']), 3, 0)
+    assert cache.largest_subset(['a', 'b', 'c', 'd']) == (frozenset(['a', 'b', 'c']), 2)
+    assert cache.largest_subset(['b', 'a']) == (frozenset(['a', 'b']), 1)
+    assert cache.largest_subset(['d', 'b', 'e']) == (frozenset(['b', 'd']), 3)
+    assert cache.largest_subset(['a', 'c']) == (None, None)
+    assert (cache.hits, cache.misses) == (3, 1)
+    with pytest.raises(ValueError):
+        ResultCache(100, 'random')
@@ -0,0 +1,150 @@
+import io
+import json
+import os.path
+from types import SimpleNamespace
+
+import pytest
+
+from . import search_engine as se
+from .block_skip_list import BlockSkipListExt
+from .build_metrics import BuildMetrics
+from .commands import build_index, tune_intersection, tune_skip_list
+from .commands.build_pair_cache import build_pair_cache
+from .intersection import DEFAULT_INTERSECTION, INTERSECTIONS
+from .inverted_index_skip_list import InvertedIndexBlockSkipList
+from .skip_list_layout import SkipListLayout
+
+
+@pytest.fixture
+def inverted_index(tmpdir):
+    inverted_index = InvertedIndexBlockSkipList(str(tmpdir))
+    for i in range(300):
+        tokens = ['a']
+        if i % 2 == 0:
+            tokens.append('b')
+        if i % 3 == 0:
+            tokens.append('c')
+        if i % 30 == 0:
+            tokens.append('d')
+        inverted_index.add(i, tokens)
+    inverted_index.save()
+    inverted_index.restore()
+    yield inverted_index
+    inverted_index.close()
+
+
+@pytest.mark.parametrize('implementation', [None, 'spim'])
+def test_build_index(tmpdir, monkeypatch, implementation):
+    docs = ''.join(json.dumps({'id': f"id{i}", 'text': text}) + '\n'
+                   for i, text in enumerate(["hello world", "hello test", "world test"]))
+    monkeypatch.setattr('sys.stdin', io.StringIO(docs))
+    build_index.main(str(tmpdir.join('plain')), implementation)
+    output = io.StringIO()
+    monkeypatch.setattr('sys.stdin', io.StringIO(docs))
+    build_index.main(str(tmpdir.join('metrics')), implementation, BuildMetrics(output, interval=3600))
+    for name in ('doc_list', 'inverted_index'):
+        assert tmpdir.join('plain', name).read_binary() == tmpdir.join('metrics', name).read_binary()
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert lines[0]['docs'] == 3
+    if implementation is None:
+        se.init(str(tmpdir.join('metrics')))
+        se.restore_index()
+        assert se.count("hello") == 2
+
+
+def test_build_pair_cache(inverted_index):
+    queries = [['a', 'b'], ['b', 'a', 'c'], ['b', 'c'], ['a', 'c']]
+    log = io.StringIO()
+    pair_cache = build_pair_cache(inverted_index, queries, 100_000, min_count=2, log=log)
+    assert pair_cache is inverted_index.pair_cache
+    assert set(pair_cache.entries) == {('a', 'b'), ('a', 'c'), ('b', 'c')}
+    assert pair_cache.get(('b', 'c')).decode_ids() == list(range(0, 300, 6))
+    assert log.getvalue() == f"3 pairs, 3 cached in {pair_cache.bytes} bytes\n"
+    ab_bytes = pair_cache.entries[('a', 'b')][1]
+    # the pairs of at least min_count queries only
+    assert len(build_pair_cache(inverted_index, queries, 100_000, min_count=3)) == 0
+    # the most frequent pairs are kept when they do not all fit
+    queries.append(['a', 'b'])
+    pair_cache = build_pair_cache(inverted_index, queries, ab_bytes, min_count=2)
+    assert set(pair_cache.entries) == {('a', 'b')}
+
+    inverted_index.save_pair_cache()
+    assert os.path.exists(inverted_index.get_pair_cache_filename())
+    assert inverted_index.search_and(['c', 'b', 'a']) == list(range(0, 300, 6))
+
+
+def test_tune_intersection_calibrate(inverted_index, monkeypatch):
+    queries = [('COUNT', ['a', 'b']), ('TOP_10', ['d', 'a']), ('COUNT', ['a', 'c', 'b']), ('COUNT', ['a']),
+               ('COUNT', ['a', 'x'])]
+    # the real algorithms give each bucket a cost per algorithm
+    model = tune_intersection.calibrate(inverted_index, queries, repeat=1)
+    assert set(model.costs) == {'100-999/1-9', '10-99/10-99'}
+    assert all(set(costs) == set(INTERSECTIONS) for costs in model.costs.values())
+
+    # with svs faster on short lists and leapfrog on the others
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(tune_intersection, 'time', SimpleNamespace(perf_counter=lambda: clock.now))
+
+    def evaluate(algorithm, state, count=False):  # pylint: disable=unused-argument
+        fast = 'svs' if state[0][0] < 100 else 'leapfrog'
+        clock.now += 1.0 if algorithm == fast else 2.0
+
+    monkeypatch.setattr(inverted_index, 'evaluate', evaluate)
+    log = io.StringIO()
+    model = tune_intersection.calibrate(inverted_index, queries, ('leapfrog', 'svs'), log=log)
+    assert model.costs == {
+        '100-999/1-9': {'leapfrog': 1.0, 'svs': 2.0},
+        '10-99/10-99': {'leapfrog': 2.0, 'svs': 1.0},
+    }
+    assert model.choose([150, 300]) == 'leapfrog'
+    assert model.choose([10, 300]) == 'svs'
+    assert model.choose([1, 300]) == DEFAULT_INTERSECTION
+    assert log.getvalue() == "10-99/10-99: 1 queries, svs\n100-999/1-9: 2 queries, leapfrog\n"
+
+
+def test_tune_skip_list_calibrate(inverted_index, monkeypatch):
+    queries = [('COUNT', ['a', 'b']), ('TOP_10', ['d', 'c']), ('COUNT', ['a']), ('COUNT', ['a', 'x'])]
+    configs = [(16, 0), (32, 2)]
+    layout = tune_skip_list.calibrate(inverted_index, queries, configs, repeat=1)
+    assert isinstance(layout, SkipListLayout)
+    assert set(layout.costs) == {'100-999', '10-99'}
+    assert all(set(costs) == set(configs) for costs in layout.costs.values())
+    assert layout.get(5) == layout.default
+
+    # each configuration is timed on the lists laid out with it
+    run_queries = tune_skip_list.run_queries
+    parsed = set()
+
+    def check_run_queries(scratch, bucket_queries):
+        run_queries(scratch, bucket_queries)
+        for t, (doc_list, _) in scratch.lists.entries.items():
+            assert type(doc_list) is type(BlockSkipListExt.of(*scratch.data[t]))
+            parsed.add(type(doc_list).__name__)
+
+    monkeypatch.setattr(tune_skip_list, 'run_queries', check_run_queries)
+    tune_skip_list.calibrate(inverted_index, queries, [(16, 1), (16, 0), (32, 2)], repeat=2)
+    assert {'BlockSkipListExt', 'DocIdListExt'} <= parsed
+
+    # with the skip lists faster on the long lists only
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(tune_skip_list, 'time', SimpleNamespace(perf_counter=lambda: clock.now))
+    runs = {}
+
+    def run_queries(scratch, bucket_queries):
+        # the lists of the bucket are the ones laid out again, with the configs in turn
+        freq = next(entry[0] for t, entry in scratch.data.items() if entry is not inverted_index.data[t])
+        long_lists = freq >= 100
+        config = configs[runs.get(long_lists, 0)]
+        runs[long_lists] = runs.get(long_lists, 0) + 1
+        clock.now += len(bucket_queries) * (1.0 if (config[1] > 0) == long_lists else 2.0)
+
+    monkeypatch.setattr(tune_skip_list, 'run_queries', run_queries)
+    log = io.StringIO()
+    layout = tune_skip_list.calibrate(inverted_index, queries, configs, repeat=1, log=log)
+    assert layout.costs == {
+        '100-999': {(16, 0): 2.0, (32, 2): 1.0},
+        '10-99': {(16, 0): 1.0, (32, 2): 2.0},
+    }
+    assert layout.get(300) == (32, 2)
+    assert layout.get(10) == (16, 0)
+    assert "df 10-99: 1 terms, 1 queries, block_size=16 max_level=0\n" in log.getvalue()
@@ -0,0 +1,75 @@
+import json
+import tempfile
+from random import randrange
+
+import pytest
+
+from .block_skip_list import BitmapList, BlockSkipList, BlockSkipListExt, FlatSkipList, RoaringList
+from .intersection import INTERSECTIONS, IntersectionCostModel, intersection_bucket, iter_leapfrog
+from .inverted_index_skip_list import InvertedIndexBlockSkipList
+from .query_stats import QueryStats
+
+
+def ext(skip_list):
+    with tempfile.TemporaryFile(prefix="pysearchlite_") as file:
+        skip_list.write(file)
+        file.seek(0)
+        return BlockSkipListExt.read(file.read())
+
+
+def random_ids(n, universe):
+    return sorted(set(randrange(universe) for _ in range(n)))
+
+
+@pytest.mark.parametrize('algorithm', sorted(INTERSECTIONS))
+@pytest.mark.parametrize('lengths', [(1, 1000), (10, 10), (20, 2000), (500, 600, 3000), (2000, 2000, 2000)])
+def test_intersections(algorithm, lengths):
+    lists = [random_ids(n, 5000) for n in lengths]
+    expected = sorted(set(lists[0]).intersection(*lists[1:]))
+    encoders = [BlockSkipList.from_list, FlatSkipList.from_list, RoaringList.from_list]
+    doc_lists = sorted((ext(encoders[i % len(encoders)](ids)) for i, ids in enumerate(lists)),
+                       key=lambda doc_list: doc_list.freq)
+    stats = QueryStats()
+    assert INTERSECTIONS[algorithm](doc_lists, stats) == expected
+    assert stats.matches == len(expected)
+    assert INTERSECTIONS[algorithm](doc_lists, count=True) == len(expected)
+
+
+@pytest.mark.parametrize('lengths', [(1,), (300,), (1, 1000), (20, 2000), (500, 600, 3000)])
+def test_iter_leapfrog(lengths):
+    lists = [random_ids(n, 5000) for n in lengths]
+    expected = sorted(set(lists[0]).intersection(*lists[1:]))
+    encoders = [BlockSkipList.from_list, FlatSkipList.from_list, RoaringList.from_list, BitmapList.from_list]
+    doc_lists = sorted((ext(encoders[i % len(encoders)](ids)) for i, ids in enumerate(lists)),
+                       key=lambda doc_list: doc_list.freq)
+    assert list(iter_leapfrog(doc_lists)) == expected
+    start = expected[len(expected) // 2] if expected else 0
+    assert list(iter_leapfrog(doc_lists, start)) == [doc_id for doc_id in expected if doc_id >= start]
+    assert list(iter_leapfrog(doc_lists, 5000)) == []
+
+
+def test_intersection_cost_model():
+    assert intersection_bucket([50, 60]) == '10-99/1-9'
+    assert intersection_bucket([50, 6000]) == '10-99/100-999'
+    model = IntersectionCostModel({'10-99/100-999': {'svs': 2.0, 'galloping': 1.0}}, 'leapfrog')
+    assert model.choose([50, 6000, 7000]) == 'galloping'
+    assert model.choose([50, 60]) == 'leapfrog'
+    model = IntersectionCostModel.from_json(json.loads(json.dumps(model.to_json())))
+    assert model.choose([50, 6000]) == 'galloping'
+    assert model.default == 'leapfrog'
+
+
+def test_inverted_intersection_model():
+    with tempfile.TemporaryDirectory(prefix="pysearchlite_idx_dir_") as idx_dir:
+        inverted_index = InvertedIndexBlockSkipList(idx_dir)
+        for i in range(1, 300):
+            inverted_index.add(i, ['a', 'b'] if i % 3 == 0 else ['a'])
+        inverted_index.save()
+        inverted_index.restore()
+        for algorithm in INTERSECTIONS:
+            inverted_index.intersection_model = IntersectionCostModel(default=algorithm)
+            result, plan = inverted_index.explain_and(['a', 'b'])
+            assert result == list(range(3, 300, 3))
+            assert plan['algorithm'] == algorithm
+            assert inverted_index.count_and(['a', 'b']) == 99
+        inverted_index.close()
@@ -1,15 +1,22 @@
 import io
+import json
 import os.path
 import tempfile
 
 import pytest
 
+from .build_metrics import BuildMetrics
+from .block_skip_list import ArrayListExt, BitmapListExt, BlockSkipListExt
+from .cache import ENTRY_BYTES, LRUCache, PairCache, ResultCache
+from .index_stats import index_stats
 from .inverted_index_skip_list import (
+    PARSED_HEADER_BYTES,
     InvertedIndexBlockSkipList,
     read_token,
     write_token,
     write_doc_ids,
 )
+from .skip_list_layout import SkipListLayout
 
 
 # Big endian
@@ -146,3 +153,447 @@ def test_inverted_count_and(inverted_index):
 def test_inverted_clear(inverted_index):
     assert inverted_index.raw_data == {}
     assert inverted_index.data == {}
+
+
+def test_inverted_restore_mmap(idx_dir):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir, use_mmap=True)
+    for i in range(1, 200):
+        inverted_index.add(i, ['a', 'b'] if i % 3 == 0 else ['a'])
+    inverted_index.add(200, ['c'])
+    inverted_index.save()
+    inverted_index.restore()
+    assert inverted_index.get('a') == list(range(1, 200))
+    assert inverted_index.get('c') == [200]
+    assert inverted_index.search_and(['a', 'b']) == list(range(3, 200, 3))
+    assert inverted_index.count_and(['b', 'a']) == 66
+    inverted_index.close()
+    assert inverted_index.mmap is None
+    assert inverted_index.data == {}
+
+
+def test_inverted_search_and_batch(inverted_index):
+    inverted_index.add(1, ['c', 'b'])
+    inverted_index.add(2, ['a', 'c'])
+    inverted_index.add(3, ['a', 'b', 'c'])
+    inverted_index.save()
+    inverted_index.restore()
+    queries = [['a', 'b'], ['a', 'c'], ['a', 'd'], ['b'], ['c', 'b', 'c'], ['a', 'b', 'c'], ['b', 'd']]
+    assert inverted_index.search_and_batch(queries) == [sorted(inverted_index.search_and(list(set(q))))
+                                                        for q in queries]
+    assert inverted_index.search_and_batch(queries, count=True) == [inverted_index.count_and(list(set(q)))
+                                                                    for q in queries]
+
+
+def test_inverted_search_and_batch_drivers(inverted_index, monkeypatch):
+    for i in range(1000):
+        tokens = ['the']
+        if i % 100 == 0:
+            tokens.append('rare')
+        if i % 300 == 0:
+            tokens.append('x')
+        inverted_index.add(i, tokens + [f"r{i % 7}"])
+    inverted_index.save()
+    inverted_index.restore()
+    decoded = []
+    get = inverted_index.get
+    monkeypatch.setattr(inverted_index, 'get', lambda t: decoded.append(t) or get(t))
+    # the long list shared by the queries does not drive them
+    assert inverted_index.search_and_batch([['the', 'rare'], ['r3', 'the'], ['x', 'the']]) == [
+        list(range(0, 1000, 100)), list(range(3, 1000, 7)), list(range(0, 1000, 300))]
+    assert decoded == []
+    # the list which drives two queries is decoded once
+    assert inverted_index.search_and_batch([['rare', 'the'], ['x', 'rare'], ['r3', 'rare'], ['rare', 'nothing']],
+                                           count=True) == [10, 4, 1, 0]
+    assert decoded == ['rare']
+    # and the iterator of a list probed by both is reset for the second one
+    the_list = inverted_index.get_list('the')
+    built = []
+    get_iter = type(the_list).get_iter
+    monkeypatch.setattr(type(the_list), 'get_iter', lambda doc_list, stats=None: built.append(doc_list) or
+                        get_iter(doc_list, stats))
+    assert inverted_index.search_and_batch([['rare', 'the'], ['the', 'rare']]) == [list(range(0, 1000, 100))] * 2
+    assert built == [the_list]
+
+
+def test_inverted_query_stats(inverted_index):
+    for i in range(1, 100):
+        inverted_index.add(i, ['a', 'b'] if i % 3 == 0 else ['a'])
+    inverted_index.save()
+    inverted_index.restore()
+    inverted_index.collect_stats = True
+    assert inverted_index.count_and(['a', 'b']) == 33
+    stats = inverted_index.last_stats
+    assert stats.matches == 33
+    assert stats.candidates == 33
+    assert stats.compares > 0
+    assert stats.search_calls > 0
+    inverted_index.collect_stats = False
+    inverted_index.count_and(['a', 'b'])
+    assert inverted_index.last_stats is None
+    # the parsed lists are kept for the next queries
+    assert inverted_index.get_list('a') is inverted_index.get_list('a')
+    assert inverted_index.get_list('z') is None
+
+
+def test_inverted_explain_and(inverted_index):
+    inverted_index.add(1, ['c', 'b'])
+    inverted_index.add(2, ['a', 'c'])
+    inverted_index.add(3, ['c'])
+    inverted_index.save()
+    inverted_index.restore()
+    result, plan = inverted_index.explain_and(['c', 'a'])
+    assert result == [2]
+    assert plan['terms'] == [{'token': 'c', 'df': 3, 'list_type': 'LIST_TYPE_DOC_IDS_LIST'},
+                             {'token': 'a', 'df': 1, 'list_type': 'LIST_TYPE_DOC_ID'}]
+    assert plan['order'] == ['a', 'c']
+    assert plan['algorithm'] == 'svs'
+    assert set(plan['timings']) == {'prepare', 'intersect'}
+    assert plan['stats']['matches'] == 1
+    result, plan = inverted_index.explain_and(['a', 'd'])
+    assert result == []
+    assert plan['algorithm'] == 'none'
+
+
+def test_inverted_index_stats(inverted_index):
+    for i in range(1, 300):
+        inverted_index.add(i, ['a', 'b'] if i % 3 == 0 else ['a'])
+    inverted_index.add(300, ['c'])
+    inverted_index.save()
+    inverted_index.restore()
+    stats = index_stats(inverted_index)
+    assert stats['terms'] == 3
+    assert stats['postings'] == 299 + 99 + 1
+    assert stats['df']['max'] == 299
+    assert stats['df']['buckets'] == {'1-9': 1, '10-99': 1, '100-999': 1}
+    assert sum(s['total_bytes'] for s in stats['list_types'].values()) == stats['file_bytes']
+    assert stats['list_types']['LIST_TYPE_DOC_ID']['payload_bytes'] == 2
+    assert stats['list_types']['LIST_TYPE_SKIP_LIST']['terms'] == 2
+    assert stats['docid_widths'][1] == 127 + 42
+    assert sum(stats['docid_widths'].values()) == stats['postings']
+    assert stats['skip_levels'][1] > 0
+
+
+def test_inverted_build_metrics(idx_dir):
+    output = io.StringIO()
+    metrics = BuildMetrics(output, interval=3600)
+    inverted_index = InvertedIndexBlockSkipList(idx_dir, mem_limit=100)
+    inverted_index.build_metrics = metrics
+    for i in range(1, 40):
+        tokens = ['a', 'b'] if i % 3 == 0 else ['a']
+        inverted_index.add(i, tokens)
+        metrics.add_document(len(tokens), 0.0, 0.0)
+    metrics.end_indexing()
+    inverted_index.save()
+    metrics.end_save(0.0)
+    inverted_index.restore()
+    assert inverted_index.get('a') == list(range(1, 40))
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line['phase'] for line in lines] == ['indexed'] + ['merge'] * len(metrics.merge_rounds) + ['convert', 'done']
+    done = lines[-1]
+    assert done['docs'] == 39
+    assert done['tokens'] == 39 + 13
+    assert done['spills'] == len(metrics.spills) > 1
+    assert [r['files'] for r in done['merge_rounds']][0] == done['spills']
+    assert done['convert']['bytes'] == os.path.getsize(inverted_index.get_inverted_index_filename())
+
+
+def test_inverted_skip_list_layout(idx_dir):
+    layout = SkipListLayout({'100-999': {(16, 1): 2.0, (255, 2): 1.0}, '10-99': {(44, 0): 1.0}}, 44, 10)
+    assert layout.get(150) == (255, 2)
+    assert layout.get(50) == (44, 0)
+    assert layout.get(5) == (44, 10)
+    layout = SkipListLayout.from_json(json.loads(json.dumps(layout.to_json())))
+    assert layout.get(150) == (255, 2)
+
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    inverted_index.layout = layout
+    for i in range(1, 300):
+        inverted_index.add(i, ['a', 'b'] if i % 3 == 0 else ['a'])
+    inverted_index.save()
+    inverted_index.restore()
+    assert inverted_index.explain_and(['a'])[1]['terms'][0]['list_type'] == 'LIST_TYPE_SKIP_LIST'
+    assert inverted_index.explain_and(['b'])[1]['terms'][0]['list_type'] == 'LIST_TYPE_DOC_IDS_LIST'
+    assert inverted_index.get('a') == list(range(1, 300))
+    assert inverted_index.search_and(['a', 'b']) == list(range(3, 300, 3))
+
+
+def test_inverted_flat_skip_list(idx_dir):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    inverted_index.skip_list_format = 'flat'
+    for i in range(1, 300):
+        inverted_index.add(i, ['a', 'b'] if i % 3 == 0 else ['a'])
+    inverted_index.add(300, ['c'])
+    inverted_index.save()
+    inverted_index.restore()
+    assert inverted_index.explain_and(['a'])[1]['terms'][0]['list_type'] == 'LIST_TYPE_FLAT_SKIP_LIST'
+    assert inverted_index.get('a') == list(range(1, 300))
+    assert inverted_index.get('c') == [300]
+    assert inverted_index.search_and(['a', 'b']) == list(range(3, 300, 3))
+    assert inverted_index.count_and(['b', 'a']) == 99
+    assert inverted_index.search_and(['a', 'c']) == []
+    stats = index_stats(inverted_index)
+    assert sum(s['total_bytes'] for s in stats['list_types'].values()) == stats['file_bytes']
+    assert sum(stats['docid_widths'].values()) == stats['postings']
+
+
+def test_inverted_bitmap(idx_dir):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    inverted_index.bitmap_min_df = 50
+    inverted_index.bitmap_density = 0.2
+    for i in range(1, 1000):
+        tokens = ['a'] if i % 2 == 0 else ['b']
+        if i % 3 == 0:
+            tokens.append('c')
+        if i % 100 == 0:
+            tokens.append('d')
+        if i % 7 == 0:
+            tokens.append('e')
+        inverted_index.add(i, tokens)
+    inverted_index.save()
+    inverted_index.restore()
+    list_types = {t: inverted_index.explain_and([t])[1]['terms'][0]['list_type'] for t in 'abcde'}
+    # 'e' is too sparse, 'd' too short
+    assert list_types == {'a': 'LIST_TYPE_BITMAP', 'b': 'LIST_TYPE_BITMAP', 'c': 'LIST_TYPE_BITMAP',
+                          'd': 'LIST_TYPE_DOC_IDS_LIST', 'e': 'LIST_TYPE_SKIP_LIST'}
+    assert inverted_index.get('a') == list(range(2, 1000, 2))
+    assert inverted_index.search_and(['a', 'b']) == []
+    assert inverted_index.search_and(['a', 'c']) == list(range(6, 1000, 6))
+    assert inverted_index.count_and(['c', 'a']) == 166
+    assert inverted_index.search_and(['a', 'd']) == list(range(100, 1000, 100))
+    assert inverted_index.search_and(['c', 'e', 'a']) == list(range(42, 1000, 42))
+    assert inverted_index.count_and(['d', 'e', 'a']) == 1
+    assert inverted_index.search_and_batch([['a', 'c'], ['c', 'e']]) == [
+        list(range(6, 1000, 6)), list(range(21, 1000, 21))]
+    assert inverted_index.explain_and(['a', 'c'])[1]['algorithm'] == 'bitmap_and'
+    result, plan = inverted_index.explain_and(['a', 'e'])
+    assert result == list(range(14, 1000, 14))
+    assert plan['algorithm'] == 'bitmap_probe'
+    assert plan['stats']['candidates'] == len(range(7, 1000, 7))
+    assert plan['stats']['matches'] == len(result)
+    stats = index_stats(inverted_index)
+    assert sum(s['total_bytes'] for s in stats['list_types'].values()) == stats['file_bytes']
+    assert stats['list_types']['LIST_TYPE_BITMAP']['terms'] == 3
+
+
+def test_inverted_roaring(idx_dir):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    inverted_index.skip_list_format = 'roaring'
+    for i in range(1, 300):
+        inverted_index.add(i, ['a', 'b'] if i % 3 == 0 else ['a'])
+    inverted_index.add(300, ['c'])
+    inverted_index.save()
+    inverted_index.restore()
+    assert inverted_index.explain_and(['a'])[1]['terms'][0]['list_type'] == 'LIST_TYPE_ROARING'
+    assert inverted_index.get('a') == list(range(1, 300))
+    assert inverted_index.search_and(['a', 'b']) == list(range(3, 300, 3))
+    assert inverted_index.count_and(['b', 'a']) == 99
+    assert inverted_index.search_and(['a', 'c']) == []
+    assert inverted_index.explain_and(['a', 'b'])[1]['algorithm'] == 'roaring_and'
+    stats = index_stats(inverted_index)
+    assert sum(s['total_bytes'] for s in stats['list_types'].values()) == stats['file_bytes']
+
+
+def test_inverted_pair_cache(idx_dir):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    for i in range(1, 300):
+        tokens = ['a']
+        if i % 2 == 0:
+            tokens.append('b')
+        if i % 3 == 0:
+            tokens.append('c')
+        if i == 5:
+            tokens.append('d')
+        inverted_index.add(i, tokens)
+    inverted_index.save()
+    inverted_index.restore()
+    inverted_index.pair_cache = PairCache(10_000, min_count=2)
+    assert inverted_index.search_and(['a', 'b']) == list(range(2, 300, 2))
+    assert len(inverted_index.pair_cache) == 0
+    # the second query of a pair caches it
+    assert inverted_index.count_and(['b', 'a']) == 149
+    assert ('a', 'b') in inverted_index.pair_cache
+    result, plan = inverted_index.explain_and(['a', 'b', 'c'])
+    assert result == list(range(6, 300, 6))
+    assert plan['cached_pairs'] == ['a b']
+    result, plan = inverted_index.explain_and(['b', 'a'], count=True)
+    assert result == 149
+    assert plan['algorithm'] == 'decode'
+    inverted_index.add_pairs([('b', 'd'), ('c', 'd'), ('a', 'x')])
+    assert inverted_index.pair_cache.get(('b', 'd')) is None
+    assert ('a', 'x') not in inverted_index.pair_cache
+    assert inverted_index.search_and(['d', 'b', 'c']) == []
+    assert inverted_index.search_and(['a', 'c', 'd']) == []
+    assert inverted_index.search_and(['a', 'd']) == [5]
+
+    inverted_index.save_pair_cache()
+    restored = InvertedIndexBlockSkipList(idx_dir)
+    restored.restore()
+    assert set(restored.pair_cache.entries) == {('a', 'b'), ('a', 'd'), ('b', 'd'), ('c', 'd')}
+    assert restored.pair_cache.get(('c', 'd')) is None
+    assert restored.search_and(['a', 'b', 'c']) == list(range(6, 300, 6))
+    assert restored.count_and(['a', 'b']) == 149
+    assert restored.search_and(['b', 'c', 'd']) == []
+    # saving the index removes the pairs of the previous one
+    restored.add(300, ['a', 'b'])
+    restored.save()
+    assert not os.path.exists(restored.get_pair_cache_filename())
+    restored.pair_cache = None
+    restored.save_pair_cache()
+    assert not os.path.exists(restored.get_pair_cache_filename())
+
+
+def test_inverted_bigrams(idx_dir):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    inverted_index.bigram_min_df = 3
+    inverted_index.add(1, ['the', 'book', 'of', 'life'])
+    inverted_index.add(2, ['life', 'of', 'the', 'book'])
+    inverted_index.add(3, ['the', 'life', 'book'])
+    inverted_index.add(4, ['care', 'a', 'lot'])
+    inverted_index.add(5, ['a', 'lot', 'of', 'care'])
+    inverted_index.save()
+    inverted_index.restore()
+    assert inverted_index.indexed_bigram_min_df == 3
+    # the bigrams of 'the', 'of' and 'life' only
+    assert inverted_index.get('the book') == [1, 2]
+    assert inverted_index.get_freq('care a') == 0
+    assert inverted_index.get_freq('a lot') == 0
+    assert inverted_index.search_and(['the', 'book', 'of', 'life']) == [1, 2]
+    assert inverted_index.search_phrase(['the', 'book', 'of', 'life']) == [1]
+    assert inverted_index.count_phrase(['the', 'book']) == 2
+    assert inverted_index.search_phrase(['book', 'the']) == []
+    assert inverted_index.search_phrase(['care', 'a', 'lot']) == [4, 5]
+    assert inverted_index.search_phrase(['a', 'lot', 'of']) == [5]
+    assert inverted_index.search_phrase(['the', 'unknown']) == []
+    assert inverted_index.search_phrase(['life']) == [1, 2, 3]
+
+    restored = InvertedIndexBlockSkipList(idx_dir)
+    restored.bigram_min_df = 0
+    restored.add(1, ['the', 'book'])
+    restored.save()
+    restored.restore()
+    assert restored.indexed_bigram_min_df is None
+    assert restored.get_freq('the book') == 0
+    assert restored.search_phrase(['book', 'the']) == [1]
+
+
+def test_inverted_result_cache(idx_dir, monkeypatch):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    for i in range(1, 1000):
+        tokens = ['a']
+        if i % 2 == 0:
+            tokens.append('b')
+        if i % 3 == 0:
+            tokens.append('c')
+        if i % 50 == 0:
+            tokens.append('d')
+        inverted_index.add(i, tokens)
+    inverted_index.save()
+    inverted_index.restore()
+    inverted_index.result_cache = ResultCache(100_000)
+    # counts are not cached unless cache_counts is set
+    assert inverted_index.count_and(['a', 'b']) == 499
+    assert len(inverted_index.result_cache) == 0
+    inverted_index.cache_counts = True
+    assert inverted_index.count_and(['a', 'b']) == 499
+    # dense enough for a bitmap
+    assert type(inverted_index.result_cache.entries[frozenset(['a', 'b'])][0]) is BitmapListExt
+    result, plan = inverted_index.explain_and(['a', 'b', 'c'])
+    assert result == list(range(6, 1000, 6))
+    assert plan['cached_result'] == ['a', 'b']
+    assert inverted_index.search_and(['c', 'd', 'a', 'b']) == list(range(150, 1000, 150))
+    assert type(inverted_index.result_cache.entries[frozenset('abcd')][0]) is ArrayListExt
+    assert inverted_index.explain_and(['a', 'b', 'c', 'd'])[1]['algorithm'] == 'decode'
+    assert inverted_index.search_and(['a', 'b', 'c', 'd']) == list(range(150, 1000, 150))
+    assert inverted_index.search_and(['a', 'x']) == []
+    assert inverted_index.search_and(['b', 'd', 'x']) == []
+    assert inverted_index.count_and(['a', 'b', 'c', 'd']) == 6
+    assert inverted_index.result_cache.stats()['hits'] == 5
+    pair_cache = inverted_index.pair_cache = PairCache(100_000)
+    result_cache = inverted_index.result_cache
+    # the caches stay in place for concurrent queries while the pairs are mined
+    seen = []
+    intersect = inverted_index.intersect
+    monkeypatch.setattr(inverted_index, 'intersect', lambda state, stats=None: seen.append(
+        (inverted_index.pair_cache, inverted_index.result_cache)) or intersect(state, stats))
+    inverted_index.add_pairs([('b', 'c')])
+    assert seen == [(pair_cache, result_cache)]
+    assert ('b', 'c') in inverted_index.pair_cache
+    assert frozenset('bc') not in inverted_index.result_cache
+    assert pair_cache.stats()['misses'] == 0 and result_cache.stats()['hits'] == 5
+    inverted_index.restore()
+    assert len(inverted_index.result_cache) == 0
+
+
+def test_inverted_postings_cache(idx_dir):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    for i in range(1, 300):
+        inverted_index.add(i, ['a', 'b'] if i % 3 == 0 else ['a'])
+    inverted_index.add(300, ['c'])
+    inverted_index.save()
+    inverted_index.restore()
+    inverted_index.postings_cache = LRUCache(10_000)
+    assert inverted_index.get('a') == list(range(1, 300))
+    assert inverted_index.get('a') == list(range(1, 300))
+    assert inverted_index.get('c') == [300]
+    assert inverted_index.search_and(['a', 'b']) == list(range(3, 300, 3))
+    assert inverted_index.count_and(['b', 'a']) == 99
+    assert inverted_index.search_and(['a', 'c']) == []
+    stats = inverted_index.cache_stats()['postings']
+    assert (stats['entries'], stats['hits'], stats['misses']) == (2, 5, 2)
+    assert stats['bytes'] == 4 * (299 + 99) + 2 * ENTRY_BYTES
+    assert inverted_index.search_and_batch([['a', 'b'], ['b', 'a']]) == [list(range(3, 300, 3))] * 2
+    inverted_index.get('a').append(0)
+    assert inverted_index.get('a') == list(range(1, 300))
+
+
+def test_inverted_search_after(idx_dir):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    for i in range(0, 300):
+        inverted_index.add(i, ['a', 'b'] if i % 3 == 0 else ['a'])
+    inverted_index.save()
+    inverted_index.restore()
+    it = inverted_index.iter_and(['a', 'b'])
+    assert [next(it) for _ in range(3)] == [0, 3, 6]
+    assert list(inverted_index.iter_and(['b'], 290)) == [291, 294, 297]
+    assert list(inverted_index.iter_and(['a', 'x'])) == []
+    assert inverted_index.search_after(['a', 'b'], -1, 2) == [0, 3]
+    assert inverted_index.search_after(['b', 'a'], 3, 2) == [6, 9]
+    assert inverted_index.search_after(['a', 'b'], 297, 2) == []
+    pages = []
+    last_doc_id = -1
+    while True:
+        page = inverted_index.search_after(['a'], last_doc_id, 7)
+        if not page:
+            break
+        pages.extend(page)
+        last_doc_id = page[-1]
+    assert pages == list(range(300))
+
+
+def test_inverted_postings_cache_too_large(idx_dir):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    for i in range(1, 300):
+        inverted_index.add(i, ['a', 'b'] if i % 3 == 0 else ['a'])
+    inverted_index.save()
+    inverted_index.restore()
+    # 'b' fits, 'a' does not and keeps its skip list
+    inverted_index.postings_cache = LRUCache(4 * 99 + ENTRY_BYTES)
+    state = inverted_index.prepare_state(['a', 'b'])
+    assert [type(doc_list) for _, doc_list in state] == [ArrayListExt, BlockSkipListExt]
+    assert inverted_index.search_and(['a', 'b']) == list(range(3, 300, 3))
+    assert inverted_index.get('a') == list(range(1, 300))
+    assert list(inverted_index.postings_cache.entries) == ['b']
+
+
+def test_inverted_parsed_lists_bound(idx_dir):
+    inverted_index = InvertedIndexBlockSkipList(idx_dir)
+    for i in range(1, 300):
+        inverted_index.add(i, ['a', 'b', f"t{i % 10}"])
+    inverted_index.save()
+    inverted_index.restore()
+    inverted_index.lists = LRUCache(3 * (PARSED_HEADER_BYTES + ENTRY_BYTES))
+    for i in range(10):
+        assert inverted_index.count_and(['a', 'b', f"t{i}"]) == len(range(i or 10, 300, 10))
+    assert len(inverted_index.lists) == 3
+    assert inverted_index.lists.evictions > 0
+    assert inverted_index.count_and(['a', 'b']) == 299
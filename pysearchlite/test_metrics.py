@@ -0,0 +1,28 @@
+from .metrics import latency_summary, percentile, posting_bucket
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 29) == 29
+    assert percentile(values, 99.5) == 100
+    assert percentile(values, 0) == 1
+    assert percentile(values, 100) == 100
+    # nearest rank: the 30th percentile of 4 values is the 2nd one, rank 1.2 rounded up
+    assert percentile([1, 2, 3, 4], 30) == 2
+    assert percentile(list(range(1, 11)), 21) == 3
+    assert percentile([1, 2, 3, 4], 90) == 4
+    assert percentile([], 50) is None
+
+
+def test_latency_summary():
+    summary = latency_summary([0.3, 0.1, 0.2])
+    assert summary == {'count': 3, 'mean': summary['mean'], 'p50': 0.2, 'p90': 0.3, 'p99': 0.3, 'max': 0.3}
+    assert abs(summary['mean'] - 0.2) < 1e-9
+    assert latency_summary([])['p50'] is None
+
+
+def test_posting_bucket():
+    assert posting_bucket(0) == '0'
+    assert posting_bucket(7) == '1-9'
+    assert posting_bucket(100) == '100-999'
@@ -0,0 +1,48 @@
+import os
+import signal
+import socket
+
+import pytest
+
+from . import search_engine as se
+from .commands.prefork import spawn_worker, supervise
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="prefork needs os.fork")
+
+
+def test_prefork_serve(tmpdir):
+    se.init(tmpdir, use_mmap=True)
+    se.index("id1", "hello world")
+    se.index("id2", "hello test")
+    se.save_index()
+    se.restore_index()
+    listener = socket.create_server(('127.0.0.1', 0))
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            supervise(listener, 2)
+        except BaseException:  # pylint: disable=broad-except
+            code = 1
+        finally:
+            os._exit(code)  # pylint: disable=protected-access
+    try:
+        with socket.create_connection(listener.getsockname(), timeout=10) as conn:
+            with conn.makefile('rw', encoding='utf-8') as f:
+                f.write("COUNT\thello\nTOP_10_COUNT\thello test\n")
+                f.flush()
+                assert [f.readline(), f.readline()] == ["2\n", "1\n"]
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        _, status = os.waitpid(pid, 0)
+        listener.close()
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+
+def test_prefork_worker_crash(capfd):
+    listener = socket.create_server(('127.0.0.1', 0))
+    listener.close()
+    pid = spawn_worker(listener)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 1
+    assert "Traceback" in capfd.readouterr().err
@@ -1,4 +1,12 @@
+import json
+import os
+import threading
+
+import pytest
+
 from . import search_engine as se
+from .commands.protocol import run_batch, run_command
+from .slow_query_log import SlowQueryLog
 
 
 def test_search(tmpdir):
@@ -25,3 +33,196 @@ def test_count(tmpdir):
     assert se.count("hello") == 1
     assert se.count("this test") == 2
     assert se.count("that") == 0
+
+
+def test_reopen(tmpdir):
+    old_dir = tmpdir.mkdir("old")
+    new_dir = tmpdir.mkdir("new")
+    se.init(new_dir)
+    se.index("id4", "hello again")
+    se.save_index()
+    se.init(old_dir)
+    se.index("id1", "hello world")
+    se.save_index()
+    se.clear_index()
+    se.restore_index()
+    assert se.search("hello") == ["id1"]
+
+    in_flight = se.acquire_reader()
+    se.reopen(new_dir)
+    assert se.search("hello") == ["id4"]
+    assert se.INVERTED_INDEX is se.READER.inverted_index and se.DOC_LIST is se.READER.doc_list
+    assert se.INVERTED_INDEX.idx_dir == new_dir
+    assert not in_flight.closed
+    assert in_flight.search("hello") == ["id1"]
+    in_flight.release()
+    assert in_flight.closed
+
+
+def test_query_stats(tmpdir):
+    se.init(tmpdir)
+    se.index("id1", "hello world")
+    se.index("id2", "hello test")
+    se.save_index()
+    se.restore_index()
+    se.collect_query_stats()
+    try:
+        assert se.count("hello test") == 1
+        assert se.last_query_stats()['matches'] == 1
+        # the setting is kept across a reopen
+        se.reopen()
+        assert se.count("hello world") == 1
+        assert se.last_query_stats()['matches'] == 1
+
+        # each thread gets the stats of its own last query
+        stats = {}
+
+        def run(query):
+            se.search(query)
+            stats[query] = se.last_query_stats()
+
+        thread = threading.Thread(target=run, args=("world test",))
+        thread.start()
+        thread.join()
+        assert stats["world test"]['matches'] == 0
+        assert se.last_query_stats()['matches'] == 1
+    finally:
+        se.collect_query_stats(False)
+    se.reopen()
+    se.count("hello test")
+    assert se.last_query_stats() is None
+
+
+def test_acquire_reader_before_init(monkeypatch):
+    monkeypatch.setattr(se, 'READER', None)
+    with pytest.raises(ValueError, match="init"):
+        se.acquire_reader()
+    with pytest.raises(ValueError, match="init"):
+        se.search("hello")
+
+
+def test_explain(tmpdir):
+    se.init(tmpdir)
+    se.index("id1", "hello world")
+    se.index("id2", "this is a test")
+    se.save_index()
+    se.restore_index()
+    explanation = se.explain("This TEST")
+    assert explanation['tokens'] == ['this', 'test']
+    assert explanation['result_count'] == 1
+    assert list(explanation['timings']) == ['tokenize', 'prepare', 'intersect', 'materialize']
+
+
+def test_slow_query_log(tmpdir, monkeypatch):
+    se.init(tmpdir)
+    se.index("id1", "hello world")
+    se.index("id2", "this is a test")
+    se.index("id3", "hello test")
+    se.save_index()
+    se.restore_index()
+    # the slow queries are explained from their first run
+    monkeypatch.setattr(se.READER, 'explain_query', None)
+    filename = os.path.join(tmpdir, 'slow.log')
+    with SlowQueryLog(filename, threshold=0.0, collect_stats=True) as slow_query_log:
+        se.set_slow_query_log(slow_query_log)
+        try:
+            assert se.search("hello") == ["id1", "id3"]
+            assert se.top_k("hello", 1) == ["id1"]
+            assert se.count("hello test") == 1
+        finally:
+            se.set_slow_query_log(None)
+    with open(filename, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert [r['command'] for r in records] == ['search', 'top_k', 'count']
+    # top_k reads the first k results only
+    assert [r['result_count'] for r in records] == [2, 1, 1]
+    assert records[1]['k'] == 1
+    assert records[2]['tokens'] == ['hello', 'test']
+    assert [term['df'] for term in records[2]['terms']] == [2, 2]
+    assert records[2]['algorithm'] == se.INVERTED_INDEX.algorithm(se.INVERTED_INDEX.prepare_lists(['hello', 'test']))
+    assert list(records[2]['timings']) == ['tokenize', 'prepare', 'intersect']
+    assert list(records[0]['timings']) == ['tokenize', 'decode', 'materialize']
+    assert records[2]['stats']['matches'] == 1
+    # the trace of the logged query is not left on the thread
+    assert getattr(se.INVERTED_INDEX.thread_stats, 'trace', None) is None
+
+    with SlowQueryLog(filename, threshold=60.0) as slow_query_log:
+        se.set_slow_query_log(slow_query_log)
+        try:
+            assert se.search("hello") == ["id1", "id3"]
+        finally:
+            se.set_slow_query_log(None)
+    with open(filename, 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) == 3
+
+    with SlowQueryLog(filename, threshold=0.0) as slow_query_log:
+        se.set_slow_query_log(slow_query_log)
+        try:
+            assert se.count("hello") == 2
+            assert se.count_batch(["hello"]) == [2]
+        finally:
+            se.set_slow_query_log(None)
+    with open(filename, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    # the stats are off by default and batches are not logged
+    assert len(records) == 4
+    assert records[3]['stats'] is None
+
+
+def test_search_phrase(tmpdir):
+    se.init(tmpdir)
+    se.INVERTED_INDEX.bigram_min_df = 2
+    se.index("id1", "this is a test")
+    se.index("id2", "a test is this")
+    se.index("id3", "hello world")
+    se.save_index()
+    se.clear_index()
+    se.restore_index()
+    assert se.search_phrase("This is") == ["id1"]
+    assert se.count_phrase("a test") == 2
+    assert se.search("is this") == ["id1", "id2"]
+
+
+def test_cache_stats(tmpdir):
+    se.init(tmpdir)
+    se.index("id1", "hello world")
+    se.save_index()
+    se.restore_index()
+    assert se.search("hello world") == ["id1"]
+    stats = se.cache_stats()
+    assert list(stats) == ['lists']
+    assert stats['lists']['entries'] == 2
+
+
+def test_search_after(tmpdir):
+    se.init(tmpdir)
+    for i in range(10):
+        se.index(f"id{i}", "this is a test" if i % 2 == 0 else "this is another")
+    se.save_index()
+    se.clear_index()
+    se.restore_index()
+    assert list(se.iter_search("this test")) == ["id0", "id2", "id4", "id6", "id8"]
+    assert se.top_k("this test", 2) == ["id0", "id2"]
+    docs, cursor = se.search_after("this test", n=3)
+    assert docs == ["id0", "id2", "id4"]
+    docs, cursor = se.search_after("this test", cursor, 3)
+    assert docs == ["id6", "id8"]
+    assert se.search_after("this test", cursor, 3) == ([], None)
+
+
+def test_run_batch(tmpdir, monkeypatch):
+    se.init(tmpdir)
+    se.index("id1", "hello world")
+    se.index("id2", "hello test")
+    se.save_index()
+    se.restore_index()
+    command_queries = [('COUNT', 'hello'), ('TOP_10', 'hello'), ('TOP_10_COUNT', 'hello test'), ('COUNT', 'x')]
+    assert run_batch(command_queries) == [2, 1, 1, 0]
+    assert run_batch(command_queries) == [run_command(command, query) for command, query in command_queries]
+    # TOP_10 reads the first 10 docs only, as run_command does
+    searched = []
+    top_k = se.top_k
+    monkeypatch.setattr('pysearchlite.top_k', lambda query, k=10: searched.append((query, k)) or top_k(query, k))
+    monkeypatch.setattr('pysearchlite.search_batch', None)
+    assert run_batch(command_queries) == [2, 1, 1, 0]
+    assert searched == [('hello', 10)]
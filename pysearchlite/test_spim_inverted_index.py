@@ -5,6 +5,7 @@ import tempfile
 import pytest
 
 from .spim_inverted_index import (
+    MappedDocIds,
     SinglePassInMemoryInvertedIndex,
     read_token,
     write_token,
@@ -142,6 +143,21 @@ def test_spim_count_and(spim_index):
     assert spim_index.count_and(['a', 'b', 'c']) == 0
 
 
+def test_spim_search_and_long_list(spim_index):
+    for i in range(100_000):
+        spim_index.add(i, ['a', 'b'] if i % 40_000 == 3 else ['b'])
+    spim_index.save()
+    spim_index.restore()
+    ids_len, pos = spim_index.data['b']
+    assert isinstance(spim_index.probed_doc_ids(ids_len, pos, 3), MappedDocIds)
+    assert list(spim_index.probed_doc_ids(ids_len, pos, 1000)[:3]) == [0, 1, 2]
+    mapped = MappedDocIds(spim_index.mmap, pos, ids_len)
+    assert len(mapped) == 100_000
+    assert mapped[0] == 0 and mapped[99_999] == 99_999
+    assert spim_index.search_and(['a', 'b']) == [3, 40_003, 80_003]
+    assert spim_index.count_and(['b', 'a']) == 3
+
+
 def test_spim_clear(spim_index):
     assert spim_index.raw_data == {}
     assert spim_index.data == {}